@@ -0,0 +1,272 @@
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.ndimage import median_filter
+
+from csv_io import read_xy_csv, write_xy_csv
+from ecg_session import META_FILE, RR_PAIRS, SESSION_SUFFIX, ECGSession
+
+# 伪迹类型（0 为正常），多条规则同时命中时取编号最小的
+OUT_OF_RANGE = 1
+MISSED = 2
+EXTRA = 3
+ECTOPIC = 4
+IRREGULAR = 5
+OUTLIER = 6
+
+ARTIFACT_NAMES = {
+    OUT_OF_RANGE: "超出生理范围",
+    MISSED: "漏检",
+    EXTRA: "多检",
+    ECTOPIC: "异位搏动",
+    IRREGULAR: "突变",
+    OUTLIER: "Poincaré离群",
+}
+
+# 生理上合理的RR间期范围（秒）
+RR_RANGE = (0.3, 2.0)
+
+# 局部中位数的窗口（心搏数）及允许的相对偏离；漏检/多检判据（相对局部中位数）
+LOCAL_MEDIAN_BEATS = 11
+LOCAL_DEVIATION = 0.2
+MISSED_RATIO = 1.5
+EXTRA_RATIO = 0.7
+
+# 逐差判据：阈值为局部 |ΔRR| 中位数的倍数（窗口为心搏数），并不低于最小值（秒）
+DIFF_WINDOW_BEATS = 91
+DIFF_FACTOR = 5.2
+MIN_DIFF_THRESHOLD = 0.05
+
+# CSV清洗结果的文件名后缀
+CLEANED_SUFFIX = '_cleaned.csv'
+
+# Poincaré 图上的稳健距离阈值（沿 SD1、SD2 方向按中位数绝对偏差标准化）
+POINCARE_THRESHOLD = 5.0
+
+
+def classify_rr(rr):
+    """
+    按逐差和局部中位数规则标记RR间期序列中的伪迹
+
+    - 超出 RR_RANGE 的间期
+    - 漏检：超过局部中位数的 MISSED_RATIO 倍
+    - 多检：明显偏短，且与相邻间期之和接近局部中位数
+    - 异位搏动：逐差先负后正（短-长）或先正后负（长-短）且都超过阈值
+    - 突变：其余偏离局部中位数超过 LOCAL_DEVIATION 的间期
+
+    Returns:
+    np.ndarray: 每个RR间期的伪迹类型（int8，0 为正常）
+    """
+    rr = np.asarray(rr, dtype=float)
+    codes = np.zeros(len(rr), dtype=np.int8)
+    if len(rr) < 3:
+        return codes
+
+    median = median_filter(rr, size=LOCAL_MEDIAN_BEATS, mode='nearest')
+    diff = np.diff(rr)
+    threshold = np.maximum(DIFF_FACTOR * median_filter(np.abs(diff), size=DIFF_WINDOW_BEATS,
+                                                        mode='nearest'),
+                           MIN_DIFF_THRESHOLD)
+    # before[i] = RR[i] - RR[i-1]，after[i] = RR[i+1] - RR[i]（首尾补 0）
+    before = np.concatenate(([0.0], diff))
+    after = np.concatenate((diff, [0.0]))
+    before_th = np.concatenate(([np.inf], threshold))
+    after_th = np.concatenate((threshold, [np.inf]))
+
+    sum_prev = rr + np.concatenate(([np.inf], rr[:-1]))
+    sum_next = rr + np.concatenate((rr[1:], [np.inf]))
+    near = lambda total: np.abs(total - median) <= LOCAL_DEVIATION * median
+
+    short_long = (before < -before_th) & (after > after_th)
+    long_short = (before > before_th) & (after < -after_th)
+    ectopic = short_long | long_short
+    # 短-长模式中的代偿间歇同样属于该次异位搏动
+    ectopic[1:] |= short_long[:-1]
+
+    rules = [
+        (OUT_OF_RANGE, (rr < RR_RANGE[0]) | (rr > RR_RANGE[1])),
+        (MISSED, rr > MISSED_RATIO * median),
+        (EXTRA, (rr < EXTRA_RATIO * median) & (near(sum_prev) | near(sum_next))),
+        (ECTOPIC, ectopic),
+        (IRREGULAR, np.abs(rr - median) > LOCAL_DEVIATION * median),
+    ]
+    for code, hit in reversed(rules):
+        codes[hit] = code
+    return codes
+
+
+def poincare_outliers(x, y, threshold=POINCARE_THRESHOLD):
+    """Poincaré 图上远离主体的RR间期对（沿 SD1、SD2 两个方向的稳健 z 值合成距离）"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) == 0:
+        return np.zeros(0, dtype=bool)
+    distance = np.zeros(len(x))
+    for axis in ((y - x) / np.sqrt(2), (y + x) / np.sqrt(2)):
+        center = np.median(axis)
+        scale = 1.4826 * np.median(np.abs(axis - center))
+        if scale > 0:
+            distance += ((axis - center) / scale) ** 2
+    return np.sqrt(distance) > threshold
+
+
+def detect_artifacts(x, y, segments=None):
+    """
+    标记RR间期对中的伪迹
+
+    RR间期对连续（x[1:] 与 y[:-1] 相同）时还原RR序列做逐差和局部中位数判断，
+    任一间期被标记的对即被标记；否则分别对 x、y 两列判断。最后补充 Poincaré 离群点。
+
+    Parameters:
+    segments: 多个记录拼接时各记录的起止位置（长度为记录数 + 1），逐个记录分别检测
+
+    Returns:
+    np.ndarray: 每个RR间期对的伪迹类型（int8，0 为正常）
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if segments is not None:
+        codes = np.zeros(len(x), dtype=np.int8)
+        for start, stop in zip(segments[:-1], segments[1:]):
+            if stop > start:
+                codes[start:stop] = detect_artifacts(x[start:stop], y[start:stop])
+        return codes
+    if len(x) > 1 and np.array_equal(x[1:], y[:-1]):
+        rr_codes = classify_rr(np.append(x, y[-1]))
+        first, second = rr_codes[:-1], rr_codes[1:]
+    else:
+        first, second = classify_rr(x), classify_rr(y)
+    codes = np.where((first != 0) & ((second == 0) | (first < second)), first, second)
+    codes[(codes == 0) & poincare_outliers(x, y)] = OUTLIER
+    return codes
+
+
+def summarize(codes):
+    """各伪迹类型的数量，例如 “漏检 3，异位搏动 12”"""
+    counts = np.bincount(codes, minlength=max(ARTIFACT_NAMES) + 1)
+    parts = [f"{name} {counts[code]}" for code, name in ARTIFACT_NAMES.items() if counts[code]]
+    return "，".join(parts) if parts else "未发现伪迹"
+
+
+def auto_clean(x, y, labels=None):
+    """
+    无界面自动清洗：去除被标记的RR间期对
+
+    Returns:
+    (x, y, labels, codes): 保留的数据及每个原始数据点的伪迹类型
+    """
+    codes = detect_artifacts(x, y)
+    keep = codes == 0
+    labels = np.arange(len(keep)) if labels is None else np.asarray(labels)
+    return np.asarray(x)[keep], np.asarray(y)[keep], labels[keep], codes
+
+
+def _is_session(path):
+    return os.path.basename(path) == META_FILE or path.rstrip(os.sep).endswith(SESSION_SUFFIX)
+
+
+def collect_recordings(patterns):
+    """
+    收集输入：RR间期对CSV、会话目录，或包含它们的目录（支持通配符，** 递归）
+
+    会话的 meta.json 归并到会话目录；已有的清洗结果 *_cleaned.csv 不作为输入
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern) and not _is_session(pattern):
+            paths += glob.glob(os.path.join(pattern, '*.csv'))
+            paths += glob.glob(os.path.join(pattern, f'*{SESSION_SUFFIX}'))
+        else:
+            paths += glob.glob(pattern, recursive=True)
+    paths = [os.path.dirname(path) if os.path.basename(path) == META_FILE else path.rstrip(os.sep)
+             for path in paths]
+    return sorted({path for path in paths if not path.endswith(CLEANED_SUFFIX)})
+
+
+def clean_session(session, codes):
+    """
+    把自动清洗作为一步新的清洗历史追加到会话
+
+    在会话当前的清洗状态之上再去除被标记的点，已有的手动清洗历史保持不变（当前位置
+    之后的重做记录与在数据精选工具中做新操作时一样被丢弃）；没有新去除的点时不追加。
+
+    Returns:
+    np.ndarray: 追加前保留的点的掩码
+
+    Raises:
+    ValueError: 会话中的清洗历史与RR间期对不一致
+    """
+    n_points = len(codes)
+    cleaning = session.load_cleaning()
+    if cleaning is None:
+        steps, position = np.packbits(np.ones((1, n_points), dtype=bool), axis=1), 0
+    else:
+        steps, position = cleaning
+        if steps.ndim != 2 or steps.shape[1] != (n_points + 7) // 8 or not 0 <= position < len(steps):
+            raise ValueError("会话中的清洗历史与RR间期对不一致")
+    keep = np.unpackbits(steps[position], count=n_points).astype(bool)
+    cleaned = keep & (codes == 0)
+    if not np.array_equal(cleaned, keep):
+        steps = np.vstack((steps[:position + 1], np.packbits(cleaned)[np.newaxis]))
+        session.save_cleaning(steps, position + 1)
+    return keep
+
+
+def clean_recording(path):
+    """
+    在工作进程中清洗一条记录
+
+    会话：在已有的清洗状态之上追加一步清洗历史（见 clean_session），在数据精选工具中
+    打开即为清洗后的状态，并可撤销；CSV：写出 <文件名>_cleaned.csv
+
+    Returns:
+    (path, message, ok)
+    """
+    try:
+        if _is_session(path):
+            session = ECGSession(path)
+            pairs = np.asarray(session[RR_PAIRS])
+            codes = detect_artifacts(pairs[:, 0], pairs[:, 1])
+            keep = clean_session(session, codes)
+            # 只统计当前仍保留的点中新去除的部分
+            codes = codes[keep]
+            output = session.path
+        else:
+            x, y, labels = read_xy_csv(path)
+            x, y, labels, codes = auto_clean(x, y, labels)
+            output = os.path.splitext(path)[0] + CLEANED_SUFFIX
+            write_xy_csv(output, x, y, labels)
+        message = (f"去除 {np.count_nonzero(codes)}/{len(codes)} 个点（{summarize(codes)}）"
+                   f" → {os.path.basename(output)}")
+        return path, message, True
+    except Exception as e:
+        return path, f"失败: {e}", False
+
+
+def main(argv=None):
+    """命令行入口：批量自动清洗RR间期对"""
+    parser = argparse.ArgumentParser(description="自动标记并去除RR间期对中的伪迹（异位搏动、漏检、多检等）")
+    parser.add_argument('inputs', nargs='+',
+                        help="RR间期对CSV、分析会话目录，或包含它们的目录/通配符，例如 data/ 或 'data/**/*.csv'")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认等于CPU核数")
+    args = parser.parse_args(argv)
+
+    paths = collect_recordings(args.inputs)
+    if not paths:
+        print(f"未找到匹配的文件: {' '.join(args.inputs)}", file=sys.stderr)
+        return 1
+    workers = min(args.workers or os.cpu_count() or 1, len(paths))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, message, ok in executor.map(clean_recording, paths):
+            print(f"{os.path.basename(path)}: {message}")
+            failed += not ok
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
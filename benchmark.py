@@ -0,0 +1,307 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from matplotlib.path import Path
+from scipy.signal import sosfiltfilt
+
+from ecg_pipeline import (STREAM_FILTER_TOL, ECGPipeline, design_bandpass, filter_margin,
+                          iter_bandpass_blocks)
+from lasso_selector import LassoDataCleaner
+from spatial_index import PointGridIndex
+from synthetic_data import poincare_points, synthetic_ecg, write_ecg_text
+
+# 基准结果文件格式版本
+BENCHMARK_VERSION = 1
+
+# 默认规模：ECG样本数及Poincaré点数（可用 --sizes/--points 扩展到 10⁸）
+ECG_SIZES = (10**4, 10**5, 10**6, 10**7)
+POINT_SIZES = (10**4, 10**5, 10**6)
+
+# 合成数据参数
+BENCH_FS = 500
+BENCH_ARTIFACTS = 0.01
+
+# 判定回退的阈值：耗时或峰值内存超过基准的相对比例，且绝对差超过下限（避免计时噪声）
+TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+MIN_TIME_DELTA = 0.005
+MIN_MEMORY_DELTA = 1.0
+
+
+def measure(func, *args, repeat=3):
+    """
+    计时并测量峰值内存（func(*args)）
+
+    输入数组作为参数传入而不是由 lambda 捕获，调用方随后可以 del 释放它们。
+
+    耗时取 repeat 次中的最小值；峰值内存在另一次运行中用 tracemalloc 测量
+    （NumPy 的数组分配也计入），以免跟踪开销影响计时。
+
+    Returns:
+    (seconds, peak_mb, result)
+    """
+    seconds = float('inf')
+    result = None
+    for _ in range(max(repeat, 1)):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = min(seconds, time.perf_counter() - start)
+        del result
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak / 2**20, result
+
+
+def _record(results, stage, size, seconds, peak_mb, unit='samples', count=None):
+    """记录一项结果：按规模（输入样本数或点数）索引，吞吐量按 count 个 unit 计算"""
+    count = size if count is None else count
+    key = f"{stage}@{size}"
+    results[key] = {'stage': stage, 'size': size, 'count': count, 'unit': unit, 'seconds': seconds,
+                    'throughput': count / seconds if seconds > 0 else float('inf'),
+                    'peak_mb': peak_mb}
+    print(f"{stage:<18} {size:>11,d} {seconds:>9.4f} s "
+          f"{results[key]['throughput']:>14,.0f} {unit}/s {peak_mb:>9.1f} MB", flush=True)
+
+
+def bench_pipeline(size, workdir, results, repeat=3, fs=BENCH_FS):
+    """ECG处理各阶段：读取文本、带通滤波、R峰检测、保存RR间期对"""
+    input_path = os.path.join(workdir, f"synthetic_{fs}Hz_{size}.txt")
+    if not os.path.isfile(input_path):
+        adc, _ = synthetic_ecg(size, fs=fs, artifacts=BENCH_ARTIFACTS)
+        write_ecg_text(input_path, adc)
+        del adc
+
+    pipeline = ECGPipeline()
+    seconds, peak, adc = measure(pipeline.load_ecg_data, input_path, False, repeat=repeat)
+    _record(results, 'load_ecg_data', size, seconds, peak)
+
+    seconds, peak, filtered = measure(pipeline.bandpass_filter, adc, fs, repeat=repeat)
+    _record(results, 'bandpass_filter', size, seconds, peak)
+    del adc
+
+    seconds, peak, rr = measure(pipeline.detect_r_peaks, filtered, fs, repeat=repeat)
+    _record(results, 'detect_r_peaks', size, seconds, peak)
+    del filtered
+
+    output_path = os.path.join(workdir, f"synthetic_{fs}Hz_{size}_RR_intervals.csv")
+    seconds, peak, _ = measure(pipeline.save_rr_intervals, rr, output_path, repeat=repeat)
+    _record(results, 'save_rr_intervals', size, seconds, peak, 'pairs', len(rr) - 1)
+
+
+def bench_lasso(size, results, repeat=3):
+    """数据精选工具的交互：套索选择（含高亮）、单独高亮、应用清洗（Agg 画布，无窗口）"""
+    x, y = poincare_points(size, artifacts=BENCH_ARTIFACTS)
+    cleaner = LassoDataCleaner(x, y)
+    FigureCanvasAgg(cleaner.fig).draw()
+    # 空间索引在首次访问 index 属性时建立；预先建好，计时只包含套索查询本身
+    _ = cleaner.index
+
+    # 以中位数为中心、覆盖大部分点的八边形套索
+    cx, cy = np.median(x), np.median(y)
+    rx, ry = 2 * np.std(x), 2 * np.std(y)
+    angles = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+    verts = list(zip(cx + rx * np.cos(angles), cy + ry * np.sin(angles)))
+
+    seconds, peak, _ = measure(cleaner.on_lasso_select, verts, repeat=repeat)
+    _record(results, 'on_lasso_select', size, seconds, peak, 'points')
+
+    seconds, peak, _ = measure(cleaner.highlight_selected, repeat=repeat)
+    _record(results, 'highlight_selected', size, seconds, peak, 'points')
+
+    # 应用后撤销以恢复原状，每次计时都包含一次重新选择
+    def apply():
+        cleaner.on_lasso_select(verts)
+        cleaner.apply_cleaning()
+        cleaner.undo()
+
+    seconds, peak, _ = measure(apply, repeat=repeat)
+    _record(results, 'apply_cleaning', size, seconds, peak, 'points')
+
+
+def _check(condition, message):
+    """自检失败时抛出 AssertionError（不依赖 assert 语句，-O 下同样生效）"""
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_spatial_index(seed=0):
+    """
+    自检：网格索引的套索命中测试与逐点 Path.contains_points 的结果完全一致
+
+    包括随机点、x 或 y 全部相同、只有一个点，以及远大于数据范围的多边形
+    """
+    rng = np.random.default_rng(seed)
+    x, y = rng.normal(0.8, 0.1, 5000), rng.normal(0.8, 0.1, 5000)
+    datasets = {
+        'random': (x, y),
+        'constant x': (np.full(500, 0.8), y[:500]),
+        'constant y': (x[:500], np.full(500, 0.8)),
+        'constant x and y': (np.full(500, 0.8), np.full(500, 0.8)),
+        'single point': (np.array([0.8]), np.array([0.8])),
+    }
+    angles = np.linspace(0, 2 * np.pi, 9, endpoint=False)
+    polygons = {
+        'octagon': np.column_stack((0.8 + 0.15 * np.cos(angles), 0.8 + 0.12 * np.sin(angles))),
+        'triangle': np.array([[0.5, 0.5], [1.2, 0.7], [0.7, 1.1]]),
+        'huge': np.array([[-1e6, -1e6], [1e6, -1e6], [1e6, 1e6], [-1e6, 1e6]]),
+    }
+    for data_name, (px, py) in datasets.items():
+        index = PointGridIndex(px, py)
+        for polygon_name, verts in polygons.items():
+            expected = Path(verts).contains_points(np.column_stack((px, py)))
+            _check(np.array_equal(index.query_polygon(verts), expected),
+                   f"网格索引命中测试与逐点测试不一致: {data_name} / {polygon_name}")
+
+
+def check_streaming_filter():
+    """
+    自检：分块流式带通滤波与整段 sosfiltfilt 的最大偏差不超过输入最大幅值的 STREAM_FILTER_TOL
+
+    包括单导联和多导联、小于重叠样本数的块、不能整除信号长度的块，以及不同的滤波参数
+    """
+    adc, _ = synthetic_ecg(60 * 500, fs=500, artifacts=0.05, seed=1)
+    ecg = adc.astype(float)
+    cases = [
+        ('500 Hz', ecg, 500, (1, 45, 4)),
+        ('500 Hz, 2 leads', np.stack((ecg, -0.5 * ecg[::-1])), 500, (1, 45, 4)),
+        ('250 Hz', ecg[::2], 250, (0.5, 40, 2)),
+    ]
+    for name, signal, fs, (lowcut, highcut, order) in cases:
+        expected = sosfiltfilt(design_bandpass(fs, lowcut, highcut, order), signal, axis=-1)
+        margin = filter_margin(fs, lowcut, highcut, order)
+        limit = STREAM_FILTER_TOL * np.max(np.abs(signal))
+        for block_size in (max(margin // 3, 1), 2 * margin + 1, 7919, signal.shape[-1]):
+            filtered = np.full(signal.shape, np.nan)
+            for start, stop, block in iter_bandpass_blocks(signal, fs, lowcut, highcut, order,
+                                                           block_size):
+                filtered[..., start:stop] = block
+            error = np.max(np.abs(filtered - expected))
+            _check(error <= limit,
+                   f"分块滤波与整段滤波偏差过大: {name}, 块大小 {block_size}, "
+                   f"偏差 {error:.3g} > {limit:.3g}")
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """
+    与基准比较
+
+    Returns:
+    list: 回退说明
+    """
+    regressions = []
+    for key, current in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        seconds, base_seconds = current['seconds'], reference['seconds']
+        if (seconds > base_seconds * (1 + time_tolerance)
+                and seconds - base_seconds > MIN_TIME_DELTA):
+            regressions.append(f"{key}: 耗时 {base_seconds:.4f} s → {seconds:.4f} s "
+                               f"(+{seconds / base_seconds - 1:.0%})")
+        peak, base_peak = current['peak_mb'], reference['peak_mb']
+        if peak > base_peak * (1 + memory_tolerance) and peak - base_peak > MIN_MEMORY_DELTA:
+            regressions.append(f"{key}: 峰值内存 {base_peak:.1f} MB → {peak:.1f} MB "
+                               f"(+{peak / max(base_peak, 1e-9) - 1:.0%})")
+    return regressions
+
+
+# 运行基准前执行的正确性自检
+SELF_CHECKS = (check_spatial_index, check_streaming_filter)
+
+
+def _parse_size(text):
+    """规模参数，支持 1e6 这样的写法"""
+    return int(float(text))
+
+
+def main(argv=None):
+    """命令行入口：运行基准测试，可与保存的基准比较"""
+    parser = argparse.ArgumentParser(description="ECG处理流程和数据精选交互的性能基准（合成数据，无界面）")
+    parser.add_argument('--sizes', type=_parse_size, nargs='*', default=list(ECG_SIZES),
+                        help="ECG样本数，默认 1e4 1e5 1e6 1e7")
+    parser.add_argument('--points', type=_parse_size, nargs='*', default=list(POINT_SIZES),
+                        help="套索交互的数据点数，默认 1e4 1e5 1e6")
+    parser.add_argument('--repeat', type=int, default=3, help="每项重复次数（取最短耗时），默认 3")
+    parser.add_argument('--workdir', default=None,
+                        help="合成ECG文本的存放目录（保留以便下次复用），默认使用临时目录")
+    parser.add_argument('--output', default=None, help="把本次结果写入JSON文件")
+    parser.add_argument('--baseline', default=None, help="与该基准JSON比较，出现回退时返回非零")
+    parser.add_argument('--save-baseline', default=None, help="把本次结果保存为基准JSON")
+    parser.add_argument('--tolerance', type=float, default=TIME_TOLERANCE,
+                        help=f"允许的耗时增加比例，默认 {TIME_TOLERANCE}")
+    parser.add_argument('--memory-tolerance', type=float, default=MEMORY_TOLERANCE,
+                        help=f"允许的峰值内存增加比例，默认 {MEMORY_TOLERANCE}")
+    parser.add_argument('--check-only', action='store_true', help="只运行正确性自检，不测量性能")
+    args = parser.parse_args(argv)
+
+    # 先做正确性自检：结果不对时性能数字没有意义
+    try:
+        for check in SELF_CHECKS:
+            check()
+    except AssertionError as e:
+        print(f"自检失败: {e}", file=sys.stderr)
+        return 1
+    print(f"自检通过（{len(SELF_CHECKS)} 项）")
+    if args.check_only:
+        return 0
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ecg_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+    results = {}
+    try:
+        for size in args.sizes:
+            bench_pipeline(size, workdir, results, args.repeat)
+        for size in args.points:
+            bench_lasso(size, results, args.repeat)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'version': BENCHMARK_VERSION,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                    'numpy': np.__version__, 'cpus': os.cpu_count()},
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            print(f"结果已保存到: {path}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+        if regressions:
+            print(f"\n性能回退（{len(regressions)} 项，相对 {args.baseline}）:", file=sys.stderr)
+            for line in regressions:
+                print(f"  ✗ {line}", file=sys.stderr)
+            return 1
+        print(f"\n与基准 {args.baseline} 相比没有回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
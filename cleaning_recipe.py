@@ -0,0 +1,206 @@
+import argparse
+import csv
+import glob
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from artifact_detection import CLEANED_SUFFIX, detect_artifacts
+from csv_io import read_xy_csv, write_xy_csv
+from spatial_index import PointGridIndex
+
+# 配方文件格式版本
+RECIPE_VERSION = 1
+
+# 套索选择的组合方式
+REPLACE, ADD, REMOVE = 'replace', 'add', 'remove'
+
+# 重放结果的默认汇总表文件名及其字段（输出文件后缀 CLEANED_SUFFIX 与自动清洗相同）
+REPORT_FILE = 'recipe_report.csv'
+REPORT_FIELDS = ['file', 'status', 'error', 'n_points', 'kept', 'dropped', 'output']
+
+
+def select_operation(verts, mode=REPLACE):
+    """套索选择操作（顶点为数据坐标）"""
+    return {'op': 'select', 'mode': mode, 'verts': np.asarray(verts, dtype=float).tolist()}
+
+
+def scope_ranges(mask):
+    """范围掩码中连续为 True 的区间 [[起点, 终点), ...]，用于记录只作用于部分点的操作"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0]))))
+    return edges.reshape(-1, 2).tolist()
+
+
+def scope_mask(ranges, n_points):
+    """由 scope_ranges 的区间还原范围掩码"""
+    mask = np.zeros(n_points, dtype=bool)
+    for start, stop in ranges:
+        mask[start:stop] = True
+    return mask
+
+
+def save_recipe(filepath, operations):
+    """保存清洗配方（JSON）"""
+    with open(filepath, 'w', encoding='utf-8') as file:
+        json.dump({'version': RECIPE_VERSION, 'operations': list(operations)}, file,
+                  ensure_ascii=False, indent=2)
+
+
+def load_recipe(filepath):
+    """
+    Returns:
+    list: 操作序列
+    """
+    with open(filepath, 'r', encoding='utf-8') as file:
+        recipe = json.load(file)
+    if recipe.get('version', 0) > RECIPE_VERSION:
+        raise ValueError(f"配方格式版本 {recipe.get('version')} 过新，无法读取")
+    return recipe['operations']
+
+
+def replay(operations, x, y, segments=None):
+    """
+    按配方重放清洗操作，不创建任何图形
+
+    与数据精选工具的语义一致：选择只作用于当前保留的点，“应用”保留选中的点，
+    “重置”恢复全部数据，撤销/重做在历史中移动并清空选择。所有掩码都相对原始数据，
+    多边形命中测试共用一个按原始数据建立的网格索引。
+
+    Parameters:
+    segments: 多个文件拼接时各文件的起止位置，自动预选按文件分别检测
+
+    Returns:
+    np.ndarray: 最终的保留掩码
+    """
+    n_points = len(x)
+    index = None
+    history = [np.ones(n_points, dtype=bool)]
+    position = 0
+    selected = np.zeros(n_points, dtype=bool)
+
+    for operation in operations:
+        keep = history[position]
+        op = operation['op']
+        if op == 'select':
+            if index is None:
+                index = PointGridIndex(x, y)
+            inside = index.query_polygon(operation['verts']) & keep
+            mode = operation.get('mode', REPLACE)
+            if mode == ADD:
+                selected = selected | inside
+            elif mode == REMOVE:
+                selected = selected & ~inside
+            else:
+                selected = inside
+        elif op == 'auto_select':
+            selected = keep & (detect_artifacts(x, y, segments) == 0)
+        elif op in ('apply', 'reset'):
+            if op == 'apply':
+                new_keep = selected
+            elif 'scope' in operation:
+                # 只恢复范围内的点（数据精选工具中只清洗部分文件时录制）
+                new_keep = keep | scope_mask(operation['scope'], n_points)
+            else:
+                new_keep = np.ones(n_points, dtype=bool)
+            if (op == 'apply' and not selected.any()) or (op == 'reset' and np.array_equal(new_keep, keep)):
+                selected = np.zeros(n_points, dtype=bool)
+                continue
+            del history[position + 1:]
+            history.append(new_keep.copy())
+            position = len(history) - 1
+            selected = np.zeros(n_points, dtype=bool)
+        elif op in ('undo', 'redo'):
+            target = position - 1 if op == 'undo' else position + 1
+            if 0 <= target < len(history):
+                position = target
+                selected = np.zeros(n_points, dtype=bool)
+        else:
+            raise ValueError(f"未知的配方操作: {op}")
+    return history[position]
+
+
+def cleaned_path(input_path, output_dir=None):
+    """清洗结果的输出路径：默认写在输入文件旁边"""
+    name = os.path.splitext(os.path.basename(input_path))[0] + CLEANED_SUFFIX
+    return os.path.join(output_dir or os.path.dirname(input_path), name)
+
+
+def replay_file(input_path, operations, output_dir=None):
+    """
+    在工作进程中对一个RR间期对CSV重放配方并写出清洗结果
+
+    Returns:
+    dict: 汇总表行
+    """
+    try:
+        x, y, labels = read_xy_csv(input_path)
+        keep = replay(operations, x, y)
+        if labels is None:
+            labels = np.arange(len(x))
+        output = cleaned_path(input_path, output_dir)
+        write_xy_csv(output, x[keep], y[keep], labels[keep])
+        kept = int(np.count_nonzero(keep))
+        return {'file': input_path, 'status': 'ok', 'n_points': len(keep), 'kept': kept,
+                'dropped': len(keep) - kept, 'output': output}
+    except Exception as e:
+        return {'file': input_path, 'status': 'error', 'error': str(e)}
+
+
+def collect_csv_files(pattern):
+    """收集待清洗的CSV（跳过已有的清洗结果和汇总表）"""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    return sorted(path for path in glob.glob(pattern, recursive=True)
+                  if os.path.isfile(path) and not path.endswith(CLEANED_SUFFIX)
+                  and os.path.basename(path) != REPORT_FILE)
+
+
+def main(argv=None):
+    """命令行入口：在一批RR间期对CSV上重放清洗配方"""
+    parser = argparse.ArgumentParser(description="在多个RR间期对CSV上无界面重放数据精选工具录制的清洗配方")
+    parser.add_argument('recipe', help="清洗配方（JSON）")
+    parser.add_argument('input', help="输入目录或通配符，例如 data/ 或 'data/**/*_RR_intervals.csv'")
+    parser.add_argument('--output-dir', default=None, help="清洗结果的输出目录，默认写在输入文件旁边")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认等于CPU核数")
+    parser.add_argument('--report', default=None, help=f"汇总表路径，默认 <输出目录>/{REPORT_FILE}")
+    args = parser.parse_args(argv)
+
+    operations = load_recipe(args.recipe)
+    files = collect_csv_files(args.input)
+    if not files:
+        print(f"未找到匹配的文件: {args.input}", file=sys.stderr)
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    workers = min(args.workers or os.cpu_count() or 1, len(files))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(replay_file, files, itertools.repeat(operations),
+                                 itertools.repeat(args.output_dir)))
+
+    for row in rows:
+        if row['status'] == 'ok':
+            print(f"{os.path.basename(row['file'])}: 保留 {row['kept']}，去除 {row['dropped']}")
+        else:
+            print(f"{os.path.basename(row['file'])}: 失败: {row['error']}")
+
+    report = args.report
+    if report is None:
+        report_dir = args.output_dir or (args.input if os.path.isdir(args.input) else os.getcwd())
+        report = os.path.join(report_dir, REPORT_FILE)
+    with open(report, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+    failed = sum(row['status'] != 'ok' for row in rows)
+    print(f"处理完成: 成功 {len(rows) - failed} 个，失败 {failed} 个；汇总表: {report}")
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
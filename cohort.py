@@ -0,0 +1,130 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from cleaning_recipe import cleaned_path
+from csv_io import _concat_labels, read_xy_csv, write_xy_csv
+
+# 并发读取文件的线程数上限（首次读取后有二进制列缓存，之后主要是磁盘读取）
+COHORT_WORKERS = 8
+
+
+class Cohort:
+    def __init__(self, paths, records):
+        """
+        一组RR间期对文件拼接成的数据集
+
+        所有文件的点按文件顺序拼接为一个数组，file_index 记录每个点所属的文件，
+        offsets 为各文件在拼接数组中的起止位置。清洗时以拼接后的保留掩码表示结果，
+        保存时再按文件拆分。
+
+        Parameters:
+        paths: 文件路径
+        records: 与 paths 对应的 (x, y, labels)，labels 可以为 None
+        """
+        self.paths = list(paths)
+        counts = np.array([len(x) for x, _, _ in records], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.x = np.concatenate([np.asarray(x, dtype=float) for x, _, _ in records])
+        self.y = np.concatenate([np.asarray(y, dtype=float) for _, y, _ in records])
+
+        # 没有标签列的文件以文件内序号为标签，与单文件打开时一致；保存时保持各文件原来的标签类型
+        self.file_labels = [np.arange(count) if labels is None else np.asarray(labels)
+                            for count, (_, _, labels) in zip(counts, records)]
+        self.labels = _concat_labels(self.file_labels)
+        self.file_index = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+
+    @property
+    def n_files(self):
+        return len(self.paths)
+
+    @property
+    def n_points(self):
+        return int(self.offsets[-1])
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def file_range(self, file):
+        """第 file 个文件在拼接数组中的范围"""
+        return int(self.offsets[file]), int(self.offsets[file + 1])
+
+    def file_mask(self, files):
+        """属于指定文件的点的掩码"""
+        mask = np.zeros(self.n_points, dtype=bool)
+        for file in files:
+            start, stop = self.file_range(file)
+            mask[start:stop] = True
+        return mask
+
+    def split(self, keep):
+        """
+        按文件拆分保留掩码
+
+        Returns:
+        list: 各文件保留的点在该文件内的索引
+        """
+        kept = np.flatnonzero(keep)
+        bounds = np.searchsorted(kept, self.offsets)
+        return [kept[bounds[i]:bounds[i + 1]] - self.offsets[i] for i in range(self.n_files)]
+
+    def save(self, keep, output_dir=None, progress=None):
+        """
+        按文件写出清洗结果 <文件名>_cleaned.csv（默认写在各输入文件旁边）
+
+        保留掩码一次拆分到各文件，再依次写出。
+
+        Parameters:
+        keep: 拼接数组的保留掩码
+        progress: 进度回调，参数为已写出的文件数
+
+        Returns:
+        list: 每个文件一行汇总 {'file', 'n_points', 'kept', 'dropped', 'output'}
+        """
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        rows = []
+        for file, local in enumerate(self.split(keep)):
+            start, stop = self.file_range(file)
+            output = cleaned_path(self.paths[file], output_dir)
+            write_xy_csv(output, self.x[start:stop][local], self.y[start:stop][local],
+                         self.file_labels[file][local])
+            rows.append({'file': self.paths[file], 'n_points': stop - start, 'kept': len(local),
+                         'dropped': stop - start - len(local), 'output': output})
+            if progress is not None:
+                progress(file + 1)
+        return rows
+
+
+def load_cohort(paths, workers=None, progress=None):
+    """
+    并发读取多个RR间期对CSV并拼接
+
+    Parameters:
+    workers: 读取线程数，默认为 COHORT_WORKERS 与CPU核数中较小者
+    progress: 进度回调，参数为已读取的文件数
+
+    Returns:
+    (cohort, errors): 数据集（只包含读取成功的文件，保持输入顺序）及 [(路径, 错误信息)]
+    """
+    paths = list(paths)
+    workers = min(workers or min(COHORT_WORKERS, os.cpu_count() or 1), max(len(paths), 1))
+    records = [None] * len(paths)
+    errors = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(read_xy_csv, path): i for i, path in enumerate(paths)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                records[i] = future.result()
+            except Exception as e:
+                errors.append((paths[i], str(e)))
+            if progress is not None:
+                progress(done)
+
+    loaded = [i for i, record in enumerate(records) if record is not None]
+    if not loaded:
+        raise ValueError("没有可读取的RR间期对文件")
+    errors.sort()
+    return Cohort([paths[i] for i in loaded], [records[i] for i in loaded]), errors
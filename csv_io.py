@@ -0,0 +1,304 @@
+import io
+import os
+
+import numpy as np
+
+from sidecar_cache import load_sidecar, write_sidecar
+
+# 读取时每块的字节数、写出时每块的行数
+CSV_CHUNK_BYTES = 16 * 1024 * 1024
+WRITE_CHUNK_ROWS = 200000
+
+# 定点格式的最大小数位数；缩放后的整数须不超过该值，才能由 float64 精确表示
+MAX_DECIMALS = 18
+MAX_EXACT_INT = 2 ** 53
+
+# 二进制列缓存的标记：坐标按列存为 (2, 行数) 的数组，标签单独存放
+XY_CACHE_TAG = 'xy'
+LABEL_CACHE_TAG = 'label'
+
+
+def _count_columns(filepath):
+    """根据首个数据行确定列数（首行为表头）"""
+    with open(filepath, 'r', encoding='utf-8') as file:
+        file.readline()
+        for line in file:
+            if line.strip():
+                return len(line.split(','))
+    return 0
+
+
+def _parse_block(text, n_cols, first_line_num, bad_lines):
+    """
+    解析一块CSV文本
+
+    整块交给 np.loadtxt 的C解析器；出错时退回逐行解析并记录错误行号
+
+    Returns:
+    (xy, labels): xy 形状为 (行数, 2)；没有标签列时 labels 为 None
+    """
+    # 数值标签与坐标一次解析；标签为文本时再单独读取标签列
+    usecols = (0, 1, 2) if n_cols >= 3 else (0, 1)
+    try:
+        values = np.loadtxt(io.StringIO(text), delimiter=',', usecols=usecols, ndmin=2)
+        if n_cols < 3:
+            return values, None
+        return values[:, :2], _integral_labels(values[:, 2])
+    except ValueError:
+        pass
+    if n_cols >= 3:
+        try:
+            xy = np.loadtxt(io.StringIO(text), delimiter=',', usecols=(0, 1), ndmin=2)
+            return xy, np.loadtxt(io.StringIO(text), delimiter=',', usecols=2, dtype=str, ndmin=1)
+        except ValueError:
+            pass
+
+    rows, labels = [], []
+    for line_num, line in enumerate(text.splitlines(), first_line_num):
+        parts = line.split(',')
+        if not line.strip():
+            continue
+        try:
+            row = (float(parts[0]), float(parts[1]))
+            label = parts[2].strip() if n_cols >= 3 else None
+        except (ValueError, IndexError):
+            bad_lines.append(line_num)
+            continue
+        rows.append(row)
+        labels.append(label)
+
+    xy = np.array(rows, dtype=float).reshape(-1, 2)
+    if n_cols < 3:
+        return xy, None
+    try:
+        return xy, _integral_labels(np.array(labels, dtype=float))
+    except ValueError:
+        return xy, np.array(labels, dtype=str)
+
+
+def _integral_labels(labels):
+    """取整数值的标签（如R峰序号）转为整型"""
+    if len(labels) and np.all(labels == np.round(labels)) and np.abs(labels).max() < 2 ** 53:
+        return labels.astype(np.int64)
+    return labels
+
+
+def _concat_labels(chunks):
+    """合并各块标签；只要有一块是文本标签，整体按文本处理"""
+    if any(chunk.dtype.kind == 'U' for chunk in chunks):
+        chunks = [chunk.astype(str) for chunk in chunks]
+    elif any(chunk.dtype.kind == 'f' for chunk in chunks):
+        chunks = [chunk.astype(float) for chunk in chunks]
+    return np.concatenate(chunks)
+
+
+def read_xy_csv(filepath, use_cache=True, log=None):
+    """
+    读取 x,y[,label] 格式的CSV文件（首行为表头）
+
+    按块解析为类型化数组，不为每个单元格创建Python字符串对象；首次解析后在源文件旁
+    写出二进制列缓存，之后以内存映射方式读取。
+
+    Parameters:
+    log: 日志回调，用于报告格式错误的行
+
+    Returns:
+    (x, y, labels): 没有第三列时 labels 为 None
+    """
+    if not os.path.isfile(filepath):
+        raise FileNotFoundError(f"未找到文件: {filepath}")
+
+    n_cols = _count_columns(filepath)
+    if n_cols == 0:
+        raise ValueError("CSV 文件中没有有效数据")
+    if n_cols < 2:
+        raise ValueError("CSV 文件必须至少包含两列")
+
+    if use_cache:
+        xy = load_sidecar(filepath, XY_CACHE_TAG)
+        labels = load_sidecar(filepath, LABEL_CACHE_TAG) if n_cols >= 3 else None
+        if xy is not None and (n_cols < 3 or labels is not None):
+            return xy[0], xy[1], labels
+
+    bad_lines = []
+    xy_chunks, label_chunks = [], []
+    with open(filepath, 'rb') as file:
+        file.readline()  # 跳过表头
+        line_num = 2
+        while True:
+            block = file.read(CSV_CHUNK_BYTES)
+            if not block:
+                break
+            if not block.endswith(b'\n'):
+                block += file.readline()
+            xy, labels = _parse_block(block.decode('utf-8'), n_cols, line_num, bad_lines)
+            xy_chunks.append(xy)
+            if labels is not None:
+                label_chunks.append(labels)
+            line_num += block.count(b'\n')
+
+    if bad_lines and log is not None:
+        log(f"警告: 共 {len(bad_lines)} 行数据格式错误，已跳过（首个位于第{bad_lines[0]}行）")
+
+    xy = np.ascontiguousarray(np.concatenate(xy_chunks).T) if xy_chunks else np.empty((2, 0))
+    if xy.shape[1] == 0:
+        raise ValueError("CSV 文件中没有有效数据")
+    labels = _concat_labels(label_chunks) if n_cols >= 3 else None
+
+    if use_cache:
+        _write_cache(filepath, xy, labels)
+    return xy[0], xy[1], labels
+
+
+def _write_cache(filepath, xy, labels):
+    """写出二进制列缓存（标签先写，坐标缓存存在即表示缓存完整）"""
+    if labels is not None and write_sidecar(filepath, LABEL_CACHE_TAG, labels) is None:
+        return
+    write_sidecar(filepath, XY_CACHE_TAG, xy)
+
+
+def _fixed_decimals(values):
+    """
+    定点格式的小数位数
+
+    整数列为 0；浮点列在缩放后的整数仍能由 float64 精确表示的前提下取尽量多的位数，
+    短小数（如 0.824）去掉末尾零后即是最短表示
+    """
+    if values.dtype.kind in 'iub':
+        return 0
+    finite = np.abs(values[np.isfinite(values)])
+    peak = float(finite.max()) if len(finite) else 0.0
+    if peak == 0:
+        return MAX_DECIMALS
+    return int(np.clip(np.floor(np.log10(MAX_EXACT_INT / peak)), 0, MAX_DECIMALS))
+
+
+def _fixed_point_bytes(values, decimals):
+    """
+    把一列数值格式化为定点小数的字节矩阵
+
+    每行一个数，各位数字由整型数组运算得到，不为单个数值创建 Python 对象；
+    整数部分的前导零和小数部分的末尾零留为 0 字节，拼接时删去。
+
+    Returns:
+    (out, exact): out 为 uint8 矩阵，形状为 (行数, 宽度)；exact 标记读回后与原值完全相同的行
+    （非有限值、或相对该列过小而无法在 decimals 位内精确表示的值为 False）
+    """
+    if values.dtype.kind in 'iub':
+        values = values.astype(np.int64)
+        negative = values < 0
+        integer = np.abs(values).astype(np.uint64)
+        fraction = None
+        exact = np.ones(len(values), dtype=bool)
+    else:
+        # 整数 scaled 与 10**decimals 都能精确表示，两者相除的舍入与解析十进制文本的舍入
+        # 相同，因此除回去等于原值即表示写出的文本读回后与原值完全相同
+        scale = 10.0 ** decimals
+        finite = np.isfinite(values)
+        magnitude = np.where(finite, np.abs(values), 0.0)
+        scaled = np.rint(magnitude * scale)
+        exact = finite & (scaled <= MAX_EXACT_INT) & (scaled / scale == magnitude)
+        negative = np.signbit(values)
+        scaled = np.where(exact, scaled, 0).astype(np.uint64)
+        integer, fraction = np.divmod(scaled, np.uint64(10 ** decimals))
+
+    n_int = len(str(int(integer.max()))) if len(integer) else 1
+    width = 1 + n_int + (decimals + 1 if fraction is not None and decimals else 0)
+    out = np.zeros((len(values), width), dtype=np.uint8)
+    out[negative, 0] = ord('-')
+
+    # 整数部分：个位总是输出，更高位只在数值达到该位时输出
+    remaining = integer.copy()
+    for column in range(n_int, 0, -1):
+        digit = (remaining % 10).astype(np.uint8)
+        remaining //= 10
+        shown = integer >= np.uint64(10 ** (n_int - column)) if column < n_int else True
+        out[:, column] = np.where(shown, digit + ord('0'), 0)
+
+    # 小数部分：某一位及其后各位全为零时不再输出（小数全为零时连小数点一起省略）
+    if fraction is not None and decimals:
+        out[:, n_int + 1] = np.where(fraction != 0, ord('.'), 0)
+        for position in range(1, decimals + 1):
+            place = np.uint64(10 ** (decimals - position))
+            digit = ((fraction // place) % 10).astype(np.uint8)
+            shown = fraction % (place * np.uint64(10)) != 0
+            out[:, n_int + 1 + position] = np.where(shown, digit + ord('0'), 0)
+    return out, exact
+
+
+def _text_bytes(labels):
+    """文本标签按 UTF-8 编码的字节矩阵（不足宽度的位置为 0 字节）"""
+    encoded = np.char.encode(labels, 'utf-8')
+    width = max(encoded.dtype.itemsize, 1)
+    return encoded.astype(f'S{width}').view(np.uint8).reshape(len(labels), width)
+
+
+def _number_bytes(values):
+    """
+    一列数值的字节矩阵：能精确定点表示的值批量生成，其余的值（非有限值、相对该列
+    过小或有效数字过多的值）逐个按 repr 格式化，读回后与原值完全相同
+    """
+    out, exact = _fixed_point_bytes(values, _fixed_decimals(values))
+    if exact.all():
+        return out
+    text = np.array(list(map(repr, values[~exact].tolist())), dtype=bytes)
+    text = text.view(np.uint8).reshape(len(text), text.dtype.itemsize)
+    if text.shape[1] > out.shape[1]:
+        out = np.hstack((out, np.zeros((len(out), text.shape[1] - out.shape[1]), dtype=np.uint8)))
+    out[~exact] = 0
+    out[~exact, :text.shape[1]] = text
+    return out
+
+
+def _format_block(columns):
+    """
+    把一块各列数据格式化为CSV文本（字节）
+
+    数值列按定点格式由整型运算批量生成，文本标签编码为字节矩阵，各列与分隔符拼成
+    (行数, 总宽度) 的矩阵后删去 0 字节即得到全部行。
+    """
+    n_rows = len(columns[0])
+    parts = []
+    for values in columns:
+        if parts:
+            parts.append(np.full((n_rows, 1), ord(','), dtype=np.uint8))
+        parts.append(_text_bytes(values) if values.dtype.kind == 'U' else _number_bytes(values))
+    parts.append(np.full((n_rows, 1), ord('\n'), dtype=np.uint8))
+    block = np.hstack(parts)
+    return block[block != 0].tobytes()
+
+
+def write_xy_csv(filepath, x, y, labels=None, cache=True):
+    """
+    写出 x,y[,label] 格式的CSV文件
+
+    每块的数值列以定点格式批量生成字节（整数部分去掉前导零，小数部分去掉末尾零），
+    不经过逐个单元格的 Python 字符串格式化；数值保持原类型，不会被提升为字符串数组。
+    浮点数按完整精度写出，读回后与原值（及二进制列缓存）完全相同。
+
+    Parameters:
+    cache: 同时写出二进制列缓存，重新打开该文件时无需再解析
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if labels is not None:
+        labels = np.asarray(labels)
+        if labels.dtype.kind not in 'iubfU':
+            labels = labels.astype(str)
+
+    with open(filepath, 'wb') as file:
+        file.write(b'x,y\n' if labels is None else b'x,y,label\n')
+        for start in range(0, len(x), WRITE_CHUNK_ROWS):
+            stop = min(start + WRITE_CHUNK_ROWS, len(x))
+            columns = [x[start:stop], y[start:stop]]
+            if labels is not None:
+                columns.append(labels[start:stop])
+            file.write(_format_block(columns))
+
+    if cache:
+        # 缓存与重新解析该文件得到的结果一致：数值标签按读取时的规则取整数类型
+        if labels is not None and labels.dtype.kind in 'iub':
+            labels = labels.astype(np.int64)
+        elif labels is not None and labels.dtype.kind == 'f':
+            labels = _integral_labels(labels)
+        _write_cache(filepath, np.vstack((x, y)), labels)
@@ -1,24 +1,51 @@
+import argparse
 import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
-import matplotlib.pyplot as plt
-import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from startup import preload
 
-from lasso_selector import LassoDataCleaner
+# 窗口出现后在后台预先导入的模块；NumPy、matplotlib 等在用到的方法内导入，不阻塞启动
+PRELOAD_MODULES = ('numpy', 'matplotlib.backends.backend_tkagg', 'lasso_selector', 'signal_viewer',
+                   'csv_io', 'ecg_session', 'hrv_metrics', 'cohort')
+
+# 后台加载/保存结果队列的轮询间隔（毫秒）
+QUEUE_POLL_MS = 50
 
 
 class DataCleanerApp:
-    def __init__(self, root):
+    def __init__(self, root, demo=False):
+        """
+        Parameters:
+        demo: 是否启动时加载演示数据，否则显示提示，等待加载数据
+        """
         self.root = root
         self.root.title("数据精选工具")
         
         self.cleaner = None
+        self.session = None
+        self.viewer = None
+        self.signal_canvas = None
         self.canvas = None
+        self.toolbar = None
+        self.placeholder = None
+        
+        # 文件夹模式：多个文件拼接后一起清洗；后台线程通过队列回传进度和结果
+        self.cohort = None
+        self.queue = queue.Queue()
+        self.busy = False
         
         self.setup_ui()
-        self.load_demo_data()
+        self.root.after(QUEUE_POLL_MS, self.drain_queue)
+        if demo:
+            self.load_demo_data()
+        else:
+            self.placeholder = ttk.Label(self.plot_frame, anchor=tk.CENTER,
+                                         text="点击“加载数据”打开RR间期对CSV或分析会话（meta.json）")
+            self.placeholder.pack(fill=tk.BOTH, expand=True)
+            preload(PRELOAD_MODULES)
     
     def setup_ui(self):
         """设置用户界面"""
@@ -32,9 +59,18 @@ class DataCleanerApp:
         
         # 按钮
         ttk.Button(control_frame, text="加载数据", command=self.load_data).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="加载文件夹", command=self.load_cohort).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="自动预选", command=self.auto_select).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(control_frame, text="应用选择", command=self.apply_cleaning).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="撤销", command=self.undo).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="重做", command=self.redo).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(control_frame, text="重置数据", command=self.reset_data).pack(side=tk.LEFT, padx=(0, 5))
         ttk.Button(control_frame, text="保存数据", command=self.save_data).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="保存进度", command=self.save_history).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="载入进度", command=self.load_history).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="保存配方", command=self.save_recipe).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="应用配方", command=self.apply_recipe).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(control_frame, text="HRV指标", command=self.show_hrv).pack(side=tk.LEFT, padx=(0, 5))
         
         # 信息显示
         self.info_var = tk.StringVar()
@@ -45,14 +81,35 @@ class DataCleanerApp:
         self.plot_frame = ttk.Frame(main_frame)
         self.plot_frame.pack(fill=tk.BOTH, expand=True)
         
+        # 文件列表（文件夹模式下显示）：选中部分文件时只显示和清洗这些文件的点
+        self.cohort_frame = ttk.Frame(main_frame)
+        ttk.Label(self.cohort_frame, text="文件（可多选）").pack(side=tk.TOP, anchor=tk.W)
+        ttk.Button(self.cohort_frame, text="全部文件", command=self.show_all_files).pack(side=tk.BOTTOM, fill=tk.X)
+        scrollbar = ttk.Scrollbar(self.cohort_frame, orient=tk.VERTICAL)
+        self.file_list = tk.Listbox(self.cohort_frame, selectmode=tk.EXTENDED, exportselection=False,
+                                    width=32, yscrollcommand=scrollbar.set)
+        scrollbar.config(command=self.file_list.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.file_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.file_list.bind('<<ListboxSelect>>', lambda event: self.on_file_filter())
+        
+        # 波形显示区域（打开含信号的会话时显示）
+        self.signal_frame = ttk.Frame(main_frame)
+        
         # 状态栏
         self.status_var = tk.StringVar()
         self.status_var.set("就绪")
         status_bar = ttk.Label(main_frame, textvariable=self.status_var, relief=tk.SUNKEN)
         status_bar.pack(fill=tk.X, pady=(5, 0))
+        
+        # 快捷键
+        self.root.bind('<Control-z>', lambda event: self.undo())
+        self.root.bind('<Control-y>', lambda event: self.redo())
     
     def load_demo_data(self):
         """加载演示数据"""
+        import numpy as np
+        
         np.random.seed(42)
         n_points = 200
         
@@ -71,39 +128,16 @@ class DataCleanerApp:
         self.create_cleaner(x_data, y_data)
         self.status_var.set("已加载演示数据")
     
-    def read_csv_with_numpy(file_path):
-        """
-        使用 NumPy 读取 CSV 文件的前两列（x, y），可选第三列为标签
-        """
-        try:
-            # 尝试读取最多三列
-            data = np.genfromtxt(file_path, delimiter=',', skip_header=1, dtype=str)
-            if data.ndim == 1:
-                raise ValueError("CSV 文件内容格式有误，必须至少包含两列")
-
-            if data.shape[1] < 2:
-                raise ValueError("CSV 文件必须至少包含两列")
-
-            x_data = data[:, 0].astype(float)
-            y_data = data[:, 1].astype(float)
-
-            if data.shape[1] >= 3:
-                labels = data[:, 2].tolist()
-            else:
-                labels = [str(i) for i in range(len(x_data))]
-
-            return x_data, y_data, labels
-
-        except Exception as e:
-            raise ValueError(f"无法读取 CSV 文件: {e}")
-    
-    
     def load_data(self):
         """加载数据文件"""
+        from csv_io import read_xy_csv
+        from ecg_session import META_FILE
+        
         file_path = filedialog.askopenfilename(
             title="选择数据文件",
             filetypes=[
                 ("逗号分隔值", "*.csv"),
+                ("分析会话", META_FILE),
                 ("所有文件", "*.*")
             ]
         )
@@ -112,29 +146,263 @@ class DataCleanerApp:
             return
         
         try:
-            x_data, y_data, labels = read_csv_with_numpy(file_path)
+            if os.path.basename(file_path) == META_FILE:
+                self.open_session(file_path)
+                return
+            x_data, y_data, labels = read_xy_csv(file_path)
             self.create_cleaner(x_data, y_data, labels)
+            self.close_cohort()
+            self.session = None
+            self.close_signal_viewer()
             self.status_var.set(f"已加载数据文件: {os.path.basename(file_path)}")
         except Exception as e:
             messagebox.showerror("错误", f"加载失败: {str(e)}")
     
-    def create_cleaner(self, x_data, y_data, labels=None):
-        """创建数据清洗器"""
-        # 清除之前的画布
+    def open_session(self, path):
+        """打开ECG分析器保存的会话：RR间期对以R峰位置为标签，并恢复清洗进度"""
+        from ecg_session import R_PEAKS, RR_PAIRS, ECGSession, pair_labels
+        
+        session = ECGSession(path)
+        rr_pairs = session[RR_PAIRS]
+        labels = pair_labels(session[R_PEAKS]) if R_PEAKS in session else None
+        self.create_cleaner(rr_pairs[:, 0], rr_pairs[:, 1], labels)
+        self.close_cohort()
+        self.session = session
+        self.open_signal_viewer(session)
+        
+        cleaning = session.load_cleaning()
+        if cleaning is not None:
+            self.cleaner.restore_history(*cleaning)
+            self.update_info()
+        status = f"已打开会话: {os.path.basename(session.path)}"
+        if self.viewer is not None:
+            status += "（双击左图或单击右图中的点可查看对应波形）"
+        self.status_var.set(status)
+    
+    def load_cohort(self):
+        """在后台并发加载文件夹中的全部RR间期对CSV，拼接后一起清洗"""
+        from cleaning_recipe import collect_csv_files
+        
+        if self.busy:
+            return
+        
+        folder = filedialog.askdirectory(title="选择包含RR间期对CSV的文件夹")
+        if not folder:
+            return
+        
+        paths = collect_csv_files(folder)
+        if not paths:
+            messagebox.showwarning("警告", "文件夹中没有CSV文件")
+            return
+        
+        self.busy = True
+        self.status_var.set(f"正在加载 {len(paths)} 个文件...")
+        threading.Thread(target=self.cohort_worker, args=(paths,), daemon=True).start()
+    
+    def cohort_worker(self, paths):
+        """后台线程：读取并拼接文件"""
+        from cohort import load_cohort
+        
+        try:
+            cohort, errors = load_cohort(
+                paths, progress=lambda done: self.queue.put(
+                    ('status', f"正在加载文件 {done}/{len(paths)}...")))
+            self.queue.put(('cohort_loaded', (cohort, errors)))
+        except Exception as e:
+            self.queue.put(('error', f"加载失败: {str(e)}"))
+    
+    def on_cohort_loaded(self, cohort, errors):
+        """主线程：用拼接后的数据创建清洗器并列出文件"""
+        self.create_cleaner(cohort.x, cohort.y, cohort.labels, segments=cohort.offsets)
+        self.session = None
+        self.close_signal_viewer()
+        self.cohort = cohort
+        self.cleaner.point_callback = self.show_cohort_point
+        
+        self.file_list.delete(0, tk.END)
+        for path, count in zip(cohort.paths, cohort.counts()):
+            self.file_list.insert(tk.END, f"{os.path.basename(path)} ({count})")
+        self.cohort_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 5), before=self.plot_frame)
+        
+        status = f"已加载 {cohort.n_files} 个文件，共 {cohort.n_points} 个点；在左侧列表中选择文件可只清洗这些文件"
+        if errors:
+            status += f"（{len(errors)} 个文件读取失败）"
+            messagebox.showwarning("警告", "以下文件读取失败:\n" + "\n".join(
+                f"{os.path.basename(path)}: {error}" for path, error in errors[:20]))
+        self.status_var.set(status)
+    
+    def close_cohort(self):
+        if self.cohort is None:
+            return
+        self.cohort = None
+        self.file_list.delete(0, tk.END)
+        self.cohort_frame.pack_forget()
+    
+    def selected_files(self):
+        """文件列表中选中的文件；未选或全选时为 None（全部文件）"""
+        files = list(self.file_list.curselection())
+        if not files or len(files) == self.cohort.n_files:
+            return None
+        return files
+    
+    def on_file_filter(self):
+        """只显示和清洗列表中选中的文件"""
+        if self.cohort is None or self.cleaner is None:
+            return
+        files = self.selected_files()
+        self.cleaner.set_scope(None if files is None else self.cohort.file_mask(files))
+        self.update_info()
+    
+    def show_all_files(self):
+        self.file_list.selection_clear(0, tk.END)
+        self.on_file_filter()
+    
+    def show_cohort_point(self, index):
+        """文件夹模式下点击数据点时显示其所属文件"""
+        file = int(self.cohort.file_index[index])
+        self.status_var.set(f"{os.path.basename(self.cohort.paths[file])}：标签 {self.cleaner.labels[index]}，"
+                            f"({self.cleaner.x_original[index]:.3f}, {self.cleaner.y_original[index]:.3f})")
+    
+    def save_cohort(self):
+        """按文件在后台写出清洗结果 <文件名>_cleaned.csv"""
+        if self.busy:
+            return
+        
+        output_dir = filedialog.askdirectory(
+            title="选择清洗结果的输出目录",
+            initialdir=os.path.dirname(self.cohort.paths[0]))
+        if not output_dir:
+            return
+        
+        self.busy = True
+        self.status_var.set(f"正在保存 {self.cohort.n_files} 个文件...")
+        threading.Thread(target=self.cohort_save_worker,
+                         args=(self.cohort, self.cleaner.keep_mask, output_dir), daemon=True).start()
+    
+    def cohort_save_worker(self, cohort, keep, output_dir):
+        """后台线程：按文件拆分保留掩码并写出"""
+        try:
+            rows = cohort.save(keep, output_dir, progress=lambda done: self.queue.put(
+                ('status', f"正在保存文件 {done}/{cohort.n_files}...")))
+            self.queue.put(('cohort_saved', (rows, output_dir)))
+        except Exception as e:
+            self.queue.put(('error', f"保存失败: {str(e)}"))
+    
+    def on_cohort_saved(self, rows, output_dir):
+        kept = sum(row['kept'] for row in rows)
+        dropped = sum(row['dropped'] for row in rows)
+        message = f"已保存 {len(rows)} 个文件到 {output_dir}：保留 {kept} 个点，去除 {dropped} 个点"
+        messagebox.showinfo("成功", message)
+        self.status_var.set(message)
+    
+    def drain_queue(self):
+        """主线程定时取出后台线程的进度和结果"""
+        try:
+            while True:
+                kind, payload = self.queue.get_nowait()
+                if kind == 'status':
+                    self.status_var.set(payload)
+                    continue
+                self.busy = False
+                if kind == 'cohort_loaded':
+                    self.on_cohort_loaded(*payload)
+                elif kind == 'cohort_saved':
+                    self.on_cohort_saved(*payload)
+                elif kind == 'error':
+                    self.status_var.set(payload)
+                    messagebox.showerror("错误", payload)
+        except queue.Empty:
+            pass
+        self.root.after(QUEUE_POLL_MS, self.drain_queue)
+    
+    def open_signal_viewer(self, session):
+        """显示会话中的波形，点击RR间期对时跳转到对应的R峰"""
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        
+        from ecg_session import FILTERED, R_PEAKS, RAW
+        from signal_viewer import SignalViewer
+        
+        self.close_signal_viewer()
+        signal = session.get(FILTERED)
+        if signal is None:
+            signal = session.get(RAW)
+        if signal is None or R_PEAKS not in session or signal.ndim != 1:
+            return
+        
+        self.viewer = SignalViewer(signal, session.params['fs'], session[R_PEAKS])
+        self.signal_canvas = FigureCanvasTkAgg(self.viewer.fig, self.signal_frame)
+        toolbar = NavigationToolbar2Tk(self.signal_canvas, self.signal_frame, pack_toolbar=False)
+        toolbar.update()
+        toolbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.signal_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.signal_frame.pack(fill=tk.X, after=self.plot_frame, pady=(5, 0))
+        self.cleaner.point_callback = self.show_pair
+    
+    def close_signal_viewer(self):
+        if self.viewer is None:
+            return
+        for child in self.signal_frame.winfo_children():
+            child.destroy()
+        self.signal_frame.pack_forget()
+        self.viewer = None
+        self.signal_canvas = None
+    
+    def show_pair(self, index):
+        """在波形中显示第 index 个RR间期对的三个R峰"""
+        from ecg_session import RR_PAIRS
+        
+        self.viewer.show_pair(index)
+        rr_pairs = self.session[RR_PAIRS]
+        self.status_var.set(f"RR间期对 #{index}: {rr_pairs[index, 0]:.3f} s, {rr_pairs[index, 1]:.3f} s")
+    
+    def create_cleaner(self, x_data, y_data, labels=None, segments=None):
+        """
+        创建数据清洗器
+
+        Parameters:
+        segments: 多个文件拼接时各文件的起止位置
+        """
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+        
+        from lasso_selector import LassoDataCleaner
+        
+        # 清除之前的画布（或启动时的提示）
+        if self.placeholder is not None:
+            self.placeholder.destroy()
+            self.placeholder = None
         if self.canvas:
             self.canvas.get_tk_widget().destroy()
+        if self.toolbar:
+            self.toolbar.destroy()
         
         # 创建清洗器
-        self.cleaner = LassoDataCleaner(x_data, y_data, labels)
+        self.cleaner = LassoDataCleaner(x_data, y_data, labels, segments=segments)
         
         # 嵌入matplotlib图形
         self.canvas = FigureCanvasTkAgg(self.cleaner.fig, self.plot_frame)
+        # 工具栏用于缩放和平移，大数据量时密度图会按可见区域重新分箱
+        self.toolbar = NavigationToolbar2Tk(self.canvas, self.plot_frame, pack_toolbar=False)
+        self.toolbar.update()
+        self.toolbar.pack(side=tk.BOTTOM, fill=tk.X)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         self.canvas.draw()
         
         # 更新信息
         self.update_info()
     
+    def auto_select(self):
+        """自动标记疑似伪迹并选中其余的点"""
+        from artifact_detection import summarize
+        
+        if not self.cleaner:
+            messagebox.showwarning("警告", "请先加载数据")
+            return
+        
+        codes = self.cleaner.auto_select()
+        self.update_info()
+        self.status_var.set(f"已标记 {(codes != 0).sum()} 个疑似伪迹（{summarize(codes)}），其余点已选中；"
+                            "按住 Shift 套索添加、Ctrl 套索移除，确认后点击“应用选择”")
+    
     def apply_cleaning(self):
         """应用数据清洗"""
         if not self.cleaner:
@@ -148,7 +416,6 @@ class DataCleanerApp:
         success = self.cleaner.apply_cleaning()
         if success:
             self.update_info()
-            self.canvas.draw()
             self.status_var.set("数据已精选！")
         else:
             messagebox.showerror("错误", "应用清洗失败")
@@ -161,15 +428,159 @@ class DataCleanerApp:
         
         self.cleaner.reset_data()
         self.update_info()
-        self.canvas.draw()
         self.status_var.set("已重置数据")
     
+    def undo(self):
+        """撤销上一步清洗"""
+        if not self.cleaner:
+            return
+        
+        if self.cleaner.undo():
+            self.update_info()
+            self.status_var.set("已撤销")
+        else:
+            self.status_var.set("没有可撤销的操作")
+    
+    def redo(self):
+        """重做被撤销的清洗"""
+        if not self.cleaner:
+            return
+        
+        if self.cleaner.redo():
+            self.update_info()
+            self.status_var.set("已重做")
+        else:
+            self.status_var.set("没有可重做的操作")
+    
+    def save_history(self):
+        """保存清洗进度（打开的是会话时直接写入会话）"""
+        if not self.cleaner:
+            messagebox.showwarning("警告", "请先加载数据")
+            return
+        
+        if self.session is not None:
+            try:
+                self.session.save_cleaning(*self.cleaner.history_state())
+                self.status_var.set(f"清洗进度已保存到会话: {os.path.basename(self.session.path)}")
+            except Exception as e:
+                messagebox.showerror("错误", f"保存失败: {str(e)}")
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            title="保存清洗进度",
+            defaultextension=".npz",
+            filetypes=[
+                ("清洗进度", "*.npz"),
+                ("所有文件", "*.*")
+            ]
+        )
+        
+        if not file_path:
+            return
+        
+        try:
+            self.cleaner.save_history(file_path)
+            self.status_var.set(f"清洗进度已保存到: {os.path.basename(file_path)}")
+        except Exception as e:
+            messagebox.showerror("错误", f"保存失败: {str(e)}")
+    
+    def load_history(self):
+        """载入清洗进度（需先加载对应的数据文件）"""
+        if not self.cleaner:
+            messagebox.showwarning("警告", "请先加载数据")
+            return
+        
+        file_path = filedialog.askopenfilename(
+            title="载入清洗进度",
+            filetypes=[
+                ("清洗进度", "*.npz"),
+                ("所有文件", "*.*")
+            ]
+        )
+        
+        if not file_path:
+            return
+        
+        try:
+            self.cleaner.load_history(file_path)
+            self.update_info()
+            self.status_var.set(f"已载入清洗进度: {os.path.basename(file_path)}")
+        except Exception as e:
+            messagebox.showerror("错误", f"载入失败: {str(e)}")
+    
+    def save_recipe(self):
+        """保存本次录制的清洗配方（套索顶点及应用、重置、撤销等操作）"""
+        import cleaning_recipe
+        
+        if not self.cleaner:
+            messagebox.showwarning("警告", "请先加载数据")
+            return
+        
+        if not self.cleaner.operations:
+            messagebox.showwarning("警告", "尚未录制任何操作")
+            return
+        
+        if not self.cleaner.recording_complete:
+            messagebox.showwarning("警告", "只清洗部分文件时录制的操作依赖所选文件，不能保存为配方")
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            title="保存清洗配方",
+            defaultextension=".json",
+            filetypes=[
+                ("清洗配方", "*.json"),
+                ("所有文件", "*.*")
+            ]
+        )
+        
+        if not file_path:
+            return
+        
+        try:
+            cleaning_recipe.save_recipe(file_path, self.cleaner.operations)
+            self.status_var.set(f"清洗配方（{len(self.cleaner.operations)} 步操作）已保存到: "
+                                f"{os.path.basename(file_path)}")
+        except Exception as e:
+            messagebox.showerror("错误", f"保存失败: {str(e)}")
+    
+    def apply_recipe(self):
+        """在当前数据上重放清洗配方（作为一步清洗，可撤销）"""
+        import cleaning_recipe
+        
+        if not self.cleaner:
+            messagebox.showwarning("警告", "请先加载数据")
+            return
+        
+        file_path = filedialog.askopenfilename(
+            title="应用清洗配方",
+            filetypes=[
+                ("清洗配方", "*.json"),
+                ("所有文件", "*.*")
+            ]
+        )
+        
+        if not file_path:
+            return
+        
+        try:
+            kept = self.cleaner.apply_recipe(cleaning_recipe.load_recipe(file_path))
+            self.update_info()
+            self.status_var.set(f"已应用清洗配方 {os.path.basename(file_path)}：保留 {kept} 个点")
+        except Exception as e:
+            messagebox.showerror("错误", f"应用配方失败: {str(e)}")
+    
     def save_data(self):
         """保存数据"""
+        from csv_io import write_xy_csv
+        
         if not self.cleaner:
             messagebox.showwarning("警告", "请先加载数据")
             return
         
+        if self.cohort is not None:
+            self.save_cohort()
+            return
+        
         file_path = filedialog.asksaveasfilename(
             title="保存清洗后的数据",
             defaultextension=".csv",
@@ -184,39 +595,62 @@ class DataCleanerApp:
         
         try:
             x, y, labels = self.cleaner.get_cleaned_data()
-            arr = np.column_stack((x, y, labels))
-            header = "x,y,label"
-            np.savetxt(file_path, arr, delimiter=',', fmt='%s', header=header, comments='')
+            write_xy_csv(file_path, x, y, labels)
 
             messagebox.showinfo("成功", f"数据已保存到: {file_path}")
             self.status_var.set(f"数据已保存到: {os.path.basename(file_path)}")
         except Exception as e:
             messagebox.showerror("错误", f"保存失败: {str(e)}")
     
+    def show_hrv(self):
+        """计算当前（清洗后）数据的HRV指标"""
+        from ecg_session import R_PEAKS
+        from hrv_metrics import format_metrics, hrv_metrics, pair_times
+        
+        if not self.cleaner:
+            messagebox.showwarning("警告", "请先加载数据")
+            return
+        
+        # 会话中的标签为R峰样本位置，可还原每对的实际时刻；普通CSV按连续序列累加
+        indices = self.cleaner.current_indices
+        if self.cohort is not None:
+            # 各文件的RR序列彼此独立，只计算单个文件
+            files = self.selected_files()
+            if (files is None and self.cohort.n_files > 1) or (files is not None and len(files) != 1):
+                messagebox.showwarning("警告", "请在文件列表中只选择一个文件")
+                return
+            start, stop = self.cohort.file_range(files[0] if files else 0)
+            times = pair_times(self.cleaner.x_original[start:stop])[indices - start]
+        elif self.session is not None and R_PEAKS in self.session:
+            times = self.cleaner.labels[indices] / self.session.params['fs']
+        else:
+            times = pair_times(self.cleaner.x_original)[indices]
+        x, y, _ = self.cleaner.get_cleaned_data()
+        summary = format_metrics(hrv_metrics(x, y, times))
+        self.status_var.set(summary)
+        messagebox.showinfo("HRV指标", f"当前数据 {len(x)} 个RR间期对\n{summary}")
+    
     def update_info(self):
         """更新信息显示"""
         if self.cleaner:
             current_count = self.cleaner.get_current_count()
             selected_count = self.cleaner.get_selected_count()
             info_text = f"当前数据: {current_count} 个点"
+            if self.cohort is not None:
+                files = self.selected_files()
+                info_text += f" | 文件: {self.cohort.n_files if files is None else len(files)}/{self.cohort.n_files}"
             if selected_count > 0:
                 info_text += f" | 已选择: {selected_count} 个点"
             self.info_var.set(info_text)
 
-def main():
+def main(argv=None):
     """主函数"""
-    root = tk.Tk()
-    DataCleanerApp(root)
+    parser = argparse.ArgumentParser(description="数据精选工具")
+    parser.add_argument('--demo', action='store_true', help="启动时加载演示数据")
+    args = parser.parse_args(argv)
     
-    # 设置窗口关闭事件
-    def on_closing():
-        try:
-            plt.close('all')
-        except Exception as e:
-            messagebox.showerror("错误", str(e))
-        root.destroy()
-    
-    root.protocol("WM_DELETE_WINDOW", on_closing)
+    root = tk.Tk()
+    DataCleanerApp(root, demo=args.demo)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -1,9 +1,34 @@
 import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
-import numpy as np
-from scipy.signal import butter, filtfilt, find_peaks
+from instrumentation import instrument
+from startup import preload
+
+# 窗口出现后在后台预先导入的模块（NumPy/SciPy 导入较慢，不阻塞启动）
+PRELOAD_MODULES = ('numpy', 'scipy.signal', 'ecg_pipeline', 'hrv_metrics', 'stage_cache')
+
+# 日志/进度队列的轮询间隔（毫秒）
+QUEUE_POLL_MS = 50
+
+# 界面中滤波的分块长度（秒），每块之后更新进度并检查取消
+FILTER_BLOCK_SECONDS = 60
+
+# 采样频率不低于该值 (Hz) 时先降采样到 DETECT_RATE 再滤波和检测R峰
+MULTIRATE_MIN_FS = 1000
+
+# 界面中阶段缓存（勾选后启用）的容量上限
+ANALYZER_CACHE_BYTES = 1024 ** 3
+
+# 各阶段在总进度条中所占的区间及显示名称
+PROGRESS_STAGES = {
+    'load': (0, 40, "加载"),
+    'filter': (40, 80, "滤波"),
+    'detect': (80, 95, "检测R峰"),
+    'save': (95, 100, "保存"),
+}
 
 
 class ECGAnalyzer:
@@ -12,11 +37,54 @@ class ECGAnalyzer:
         self.root = tk.Tk()
         self.root.title("ECG数据分析器")
         
+        # 后台线程与界面之间的消息队列
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        
+        # 处理引擎和阶段缓存在第一次使用时创建（见 get_pipeline、get_stage_cache）
+        self.pipeline = None
+        self.stage_cache = None
+        self._pipeline_lock = threading.Lock()
+        
         # 设置样式
         style = ttk.Style()
         style.theme_use('clam')
         
         self.setup_ui()
+        self.root.after(QUEUE_POLL_MS, self.drain_queue)
+        preload(PRELOAD_MODULES)
+    
+    def get_pipeline(self):
+        """处理引擎（首次调用时导入并创建），日志和进度经队列输出到界面"""
+        with self._pipeline_lock:
+            if self.pipeline is None:
+                from ecg_pipeline import ECGPipeline
+                
+                self.pipeline = ECGPipeline(
+                    log=self.log_message,
+                    progress=lambda stage, fraction: self.queue.put(('progress', (stage, fraction))),
+                    cancel_event=self.cancel_event
+                )
+            return self.pipeline
+    
+    def get_stage_cache(self):
+        """
+        阶段结果缓存（勾选“缓存中间结果”时使用），重复处理同一文件时只重新计算参数变化的阶段
+
+        原始数据已有源文件旁的 .npy 缓存，这里不再保存加载结果；首次创建时清理一次过期记录。
+        目录不可用时返回 None
+        """
+        with self._pipeline_lock:
+            if self.stage_cache is None:
+                from stage_cache import StageCache
+                
+                try:
+                    self.stage_cache = StageCache(max_bytes=ANALYZER_CACHE_BYTES,
+                                                  stages=('filter', 'peaks', 'rr'))
+                    self.stage_cache.evict()
+                except OSError:
+                    return None
+            return self.stage_cache
         
     def setup_ui(self):
         # 主框架
@@ -71,6 +139,30 @@ class ECGAnalyzer:
         ttk.Label(filter_frame, text=" - ").pack(side=tk.LEFT)
         ttk.Entry(filter_frame, textvariable=self.highcut_var, width=8).pack(side=tk.LEFT)
         
+        # 数据列（多导联用逗号分隔）
+        ttk.Label(params_frame, text="数据列:").grid(row=2, column=0, sticky=tk.W, padx=(0, 10), pady=(5, 0))
+        
+        columns_frame = ttk.Frame(params_frame)
+        columns_frame.grid(row=2, column=1, sticky=tk.W, pady=(5, 0))
+        
+        self.columns_var = tk.StringVar(value="1")
+        self.fuse_var = tk.BooleanVar(value=False)
+        
+        ttk.Entry(columns_frame, textvariable=self.columns_var, width=12).pack(side=tk.LEFT)
+        ttk.Checkbutton(columns_frame, text="跨导联融合R峰", 
+                       variable=self.fuse_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # 分析会话（信号、R峰位置、参数），可直接在数据精选工具中打开
+        self.session_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(params_frame, text="同时保存分析会话",
+                       variable=self.session_var).grid(row=3, column=1, sticky=tk.W, pady=(5, 0))
+        
+        # 阶段缓存：滤波信号等中间结果写入用户目录，默认关闭
+        self.stage_cache_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(params_frame,
+                       text=f"缓存中间结果，加快重复分析（占用至多 {ANALYZER_CACHE_BYTES / 1024 ** 3:g} GB）",
+                       variable=self.stage_cache_var).grid(row=4, column=1, sticky=tk.W, pady=(5, 0))
+        
         # 处理和保存按钮
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=3, column=0, columnspan=3, pady=(0, 15))
@@ -80,12 +172,20 @@ class ECGAnalyzer:
                                      style='Accent.TButton')
         self.process_btn.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.cancel_btn = ttk.Button(button_frame, text="取消", 
+                                    command=self.cancel_processing, state='disabled')
+        self.cancel_btn.pack(side=tk.LEFT, padx=(0, 10))
+        
         ttk.Button(button_frame, text="退出", 
                   command=self.root.quit).pack(side=tk.LEFT)
         
         # 进度条
-        self.progress = ttk.Progressbar(main_frame, mode='indeterminate')
-        self.progress.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
+        self.progress = ttk.Progressbar(main_frame, mode='determinate', maximum=100)
+        self.progress.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
+        
+        self.stage_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.stage_var, width=14).grid(
+            row=4, column=2, sticky=tk.W, padx=(10, 0), pady=(0, 10))
         
         # 状态和日志区域
         log_frame = ttk.LabelFrame(main_frame, text="处理日志", padding="15")
@@ -103,73 +203,38 @@ class ECGAnalyzer:
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
 
     def browse_file(self):
-        file_path = filedialog.askopenfilename(
-            title="选择ECG数据文件",
-            filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")]
-        )
+        with instrument('dialog', dialog='open_file'):
+            file_path = filedialog.askopenfilename(
+                title="选择ECG数据文件",
+                filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")]
+            )
         if file_path:
             self.file_path_var.set(file_path)
             self.log_message(f"已选择文件: {os.path.basename(file_path)}")
     
     def log_message(self, message):
-        self.log_text.insert(tk.END, f"{message}\n")
+        """记录日志（任意线程均可调用，由主线程定时写入界面）"""
+        self.queue.put(('log', message))
+    
+    def append_log(self, text):
+        self.log_text.insert(tk.END, f"{text}\n")
         self.log_text.see(tk.END)
-        self.root.update()
     
-    def load_ecg_data(self, filepath):
+    def load_ecg_data(self, filepath, use_cache=True):
         """加载ECG数据"""
-        if not os.path.isfile(filepath):
-            raise FileNotFoundError(f"未找到文件: {filepath}")
-        
-        with open(filepath, 'r', encoding='utf-8') as file:
-            next(file)  # 跳过表头
-            adc_values = []
-            for line_num, line in enumerate(file, 2):
-                try:
-                    parts = line.strip().split()
-                    if len(parts) >= 2:
-                        adc_values.append(int(parts[1]))
-                except (ValueError, IndexError) as e:
-                    self.log_message(f"警告: 第{line_num}行数据格式错误，已跳过")
-        
-        if not adc_values:
-            raise ValueError("文件中没有有效的ECG数据")
-        
-        return adc_values
+        return self.get_pipeline().load_ecg_data(filepath, use_cache)
     
     def bandpass_filter(self, signal, fs, lowcut=1, highcut=45, order=4):
         """带通滤波"""
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band')
-        return filtfilt(b, a, signal)
+        return self.get_pipeline().bandpass_filter(signal, fs, lowcut, highcut, order)
     
     def detect_r_peaks(self, ecg_signal, fs):
         """检测R峰"""
-        peaks, _ = find_peaks(
-            ecg_signal,
-            height=np.percentile(ecg_signal, 90),
-            distance=int(0.25 * fs),
-            prominence=np.std(ecg_signal) * 0.8
-        )
-        
-        # 计算RR间期（秒）
-        rr_intervals = np.diff(peaks) / fs
-        self.log_message(f"检测到 {len(peaks)} 个R峰，{len(rr_intervals)} 个RR间期")
-        return rr_intervals
+        return self.get_pipeline().detect_r_peaks(ecg_signal, fs)
     
     def save_rr_intervals(self, rr_intervals, filepath):
         """保存RR间期对"""
-        if len(rr_intervals) == 0:
-            self.log_message("警告: 没有RR间期数据可保存")
-            return
-        
-        # 构造 (RR[n], RR[n+1]) 的二维数组
-        rr_pairs = np.column_stack((rr_intervals[:-1], rr_intervals[1:]))
-        np.savetxt(filepath, rr_pairs, delimiter=',', 
-                  header='RR(n),RR(n+1)', comments='', fmt='%.6f')
-        self.log_message(f"已保存 {len(rr_pairs)} 对RR间期到: {os.path.basename(filepath)}")
+        self.get_pipeline().save_rr_intervals(rr_intervals, filepath)
     
     def process_and_save(self):
         if not self.file_path_var.get():
@@ -181,78 +246,216 @@ class ECGAnalyzer:
             fs = float(self.fs_var.get())
             lowcut = float(self.lowcut_var.get())
             highcut = float(self.highcut_var.get())
+            columns = [int(c) for c in self.columns_var.get().split(',')]
             
-            if fs <= 0 or lowcut <= 0 or highcut <= lowcut:
+            if fs <= 0 or lowcut <= 0 or highcut <= lowcut or min(columns) < 0:
                 raise ValueError("参数设置不正确")
             
         except ValueError as e:
             messagebox.showerror("参数错误", "请检查参数设置是否正确")
             return
         
-        # 开始处理
-        self.process_btn.config(state='disabled')
-        self.progress.start(10)
+        # 开始处理（后台线程，界面保持响应）
+        input_path = self.file_path_var.get()
+        self.set_running(True)
+        self.cancel_event.clear()
+        self.log_message("=" * 50)
+        self.log_message(f"开始处理文件: {os.path.basename(input_path)}")
+        
+        worker = threading.Thread(
+            target=self.analyze_worker,
+            args=(input_path, columns, fs, lowcut, highcut, self.fuse_var.get(),
+                  self.stage_cache_var.get()),
+            daemon=True
+        )
+        worker.start()
+    
+    def analyze_worker(self, input_path, columns, fs, lowcut, highcut, fuse, use_stage_cache=False):
+        """后台线程：加载 → 滤波 → R峰检测，结果通过队列交回主线程"""
+        import numpy as np
+        from ecg_pipeline import DETECT_RATE, ProcessingCancelled, fuse_r_peaks
+        from hrv_metrics import format_metrics, hrv_from_peaks
         
         try:
-            input_path = self.file_path_var.get()
-            self.log_message("=" * 50)
-            self.log_message(f"开始处理文件: {os.path.basename(input_path)}")
-            
-            # 加载数据
-            self.log_message("正在加载ECG数据...")
-            ecg_data = self.load_ecg_data(input_path)
-            self.log_message(f"成功加载 {len(ecg_data)} 个数据点")
+            pipeline = self.get_pipeline()
+            pipeline.stage_cache = self.get_stage_cache() if use_stage_cache else None
+            # 加载 → 分块滤波（便于报告进度和响应取消）→ 检测R峰，未变化的阶段复用缓存
+            self.log_message("正在加载、滤波并检测R峰...")
+            detect_rate = DETECT_RATE if fs >= MULTIRATE_MIN_FS else None
+            if len(columns) == 1:
+                with instrument('analyze', file=os.path.basename(input_path), leads=1):
+                    ecg_data, filtered, peaks, _ = pipeline.analyze(
+                        input_path, fs, lowcut, highcut, columns=columns[0],
+                        block_seconds=FILTER_BLOCK_SECONDS, detect_rate=detect_rate)
+                self.log_message(f"共 {len(ecg_data)} 个数据点，滤波频率范围: {lowcut}-{highcut} Hz")
+                outputs = [(None, peaks, ecg_data, filtered)]
+            else:
+                with instrument('analyze', file=os.path.basename(input_path), leads=len(columns)):
+                    ecg_data, filtered, peak_lists, _ = pipeline.analyze(
+                        input_path, fs, lowcut, highcut, columns=columns,
+                        block_seconds=FILTER_BLOCK_SECONDS, detect_rate=detect_rate)
+                self.log_message(f"共 {ecg_data.shape[1]} 个数据点 × {len(columns)} 个导联，"
+                                 f"滤波频率范围: {lowcut}-{highcut} Hz")
+                # 多速率检测时没有全速率的滤波信号，会话只保存原始信号
+                outputs = [(f"lead{column}", peaks, ecg_data[i],
+                            filtered[i] if filtered is not None else None)
+                           for i, (column, peaks) in enumerate(zip(columns, peak_lists))]
+                if fuse:
+                    outputs.append(("fused", fuse_r_peaks(peak_lists, fs), None, None))
             
-            # 转换为numpy数组并滤波
-            self.log_message("正在进行带通滤波...")
-            ecg_signal = np.array(ecg_data, dtype=float)
-            filtered_signal = self.bandpass_filter(ecg_signal, fs, lowcut, highcut)
-            self.log_message(f"滤波完成 (频率范围: {lowcut}-{highcut} Hz)")
-            
-            # 检测R峰
-            self.log_message("正在检测R峰...")
-            rr_intervals = self.detect_r_peaks(filtered_signal, fs)
+            results = []
+            for name, peaks, raw, filtered_lead in outputs:
+                rr_intervals = np.diff(peaks) / fs
+                prefix = f"{name}: " if name else ""
+                self.log_message(f"{prefix}检测到 {len(peaks)} 个R峰，{len(rr_intervals)} 个RR间期")
+                self.log_message(f"{prefix}{format_metrics(hrv_from_peaks(peaks, fs))}")
+                session = {'r_peaks': peaks, 'raw': raw, 'filtered': filtered_lead,
+                           'params': dict(fs=fs, lowcut=lowcut, highcut=highcut,
+                                          source=os.path.abspath(input_path), lead=name)}
+                results.append((name, rr_intervals, session))
             
+            self.queue.put(('analyzed', (input_path, results)))
+        except ProcessingCancelled:
+            self.queue.put(('cancelled', None))
+        except Exception as e:
+            self.queue.put(('error', str(e)))
+    
+    def on_analyzed(self, input_path, results):
+        """主线程：选择保存位置后在后台保存"""
+        from ecg_pipeline import default_output_path
+        
+        if len(results) == 1:
+            rr_intervals = results[0][1]
             if len(rr_intervals) < 2:
-                raise ValueError("检测到的R峰数量不足，无法生成RR间期对")
-            
-            # 生成输出文件名
-            base_name = os.path.splitext(os.path.basename(input_path))[0]
-            default_name = f"{base_name}_RR_intervals.csv"
-            
-            # 选择保存位置
-            output_path = filedialog.asksaveasfilename(
-                title="保存RR间期文件",
-                defaultextension=".csv",
-                initialfile=default_name,
-                filetypes=[("逗号分隔值文件", "*.csv"), ("所有文件", "*.*")]
-            )
-            
-            if not output_path:
-                self.log_message("用户取消了保存操作")
+                self.on_error("检测到的R峰数量不足，无法生成RR间期对")
                 return
             
-            # 保存结果
+            # 选择保存位置（对话框等待时间单独记录，不计入处理阶段）
+            with instrument('dialog', dialog='save_file'):
+                output_path = filedialog.asksaveasfilename(
+                    title="保存RR间期文件",
+                    defaultextension=".csv",
+                    initialfile=os.path.basename(default_output_path(input_path)),
+                    filetypes=[("逗号分隔值文件", "*.csv"), ("所有文件", "*.*")]
+                )
+            jobs = [(output_path, rr_intervals, results[0][2])] if output_path else []
+        else:
+            with instrument('dialog', dialog='save_directory'):
+                output_dir = filedialog.askdirectory(
+                    title="选择RR间期文件的保存目录",
+                    initialdir=os.path.dirname(input_path)
+                )
+            base_name = os.path.splitext(os.path.basename(input_path))[0]
+            jobs = []
+            for name, rr_intervals, session in results:
+                if not output_dir:
+                    break
+                if len(rr_intervals) < 2:
+                    self.log_message(f"警告: {name} 的R峰数量不足，已跳过")
+                    continue
+                jobs.append((os.path.join(output_dir, f"{base_name}_{name}_RR_intervals.csv"),
+                             rr_intervals, session))
+        
+        if not jobs:
+            self.log_message("用户取消了保存操作")
+            self.set_running(False)
+            return
+        
+        if not self.session_var.get():
+            jobs = [(output_path, rr_intervals, None) for output_path, rr_intervals, _ in jobs]
+        
+        self.cancel_btn.config(state='disabled')
+        threading.Thread(target=self.save_worker, args=(jobs,), daemon=True).start()
+    
+    def save_worker(self, jobs):
+        """后台线程：保存RR间期对及分析会话"""
+        import numpy as np
+        from ecg_session import session_path
+        
+        try:
+            pipeline = self.get_pipeline()
             self.log_message("正在保存RR间期数据...")
-            self.save_rr_intervals(rr_intervals, output_path)
+            with instrument('save', files=len(jobs)):
+                for output_path, rr_intervals, session in jobs:
+                    pipeline.save_rr_intervals(rr_intervals, output_path)
+                    if session is not None:
+                        pipeline.save_session(session_path(output_path), session['r_peaks'],
+                                              raw=session['raw'], filtered=session['filtered'],
+                                              **session['params'])
             
-            # 显示统计信息
-            self.log_message(f"RR间期统计:")
-            self.log_message(f"  平均值: {np.mean(rr_intervals):.3f} 秒")
-            self.log_message(f"  标准差: {np.std(rr_intervals):.3f} 秒")
-            self.log_message(f"  范围: {np.min(rr_intervals):.3f} - {np.max(rr_intervals):.3f} 秒")
+            if len(jobs) == 1:
+                # 显示统计信息
+                rr_intervals = jobs[0][1]
+                self.log_message(f"RR间期统计:")
+                self.log_message(f"  平均值: {np.mean(rr_intervals):.3f} 秒")
+                self.log_message(f"  标准差: {np.std(rr_intervals):.3f} 秒")
+                self.log_message(f"  范围: {np.min(rr_intervals):.3f} - {np.max(rr_intervals):.3f} 秒")
+                summary = f"输出文件: {os.path.basename(jobs[0][0])}"
+            else:
+                summary = f"已保存 {len(jobs)} 个RR间期文件"
             self.log_message("处理完成！")
-            
-            messagebox.showinfo("处理完成", f"ECG数据处理完成！\n输出文件: {os.path.basename(output_path)}")
-            
+            self.queue.put(('finished', summary))
         except Exception as e:
-            error_msg = f"处理过程中发生错误: {str(e)}"
-            self.log_message(error_msg)
-            messagebox.showerror("处理错误", error_msg)
-        
+            self.queue.put(('error', str(e)))
+    
+    def cancel_processing(self):
+        """请求取消当前处理，在下一个数据块处生效"""
+        self.cancel_event.set()
+        self.cancel_btn.config(state='disabled')
+        self.log_message("正在取消...")
+    
+    def on_error(self, message):
+        error_msg = f"处理过程中发生错误: {message}"
+        self.append_log(error_msg)
+        self.set_running(False)
+        messagebox.showerror("处理错误", error_msg)
+    
+    def set_running(self, running):
+        """切换处理中/空闲的界面状态"""
+        self.process_btn.config(state='disabled' if running else 'normal')
+        self.cancel_btn.config(state='normal' if running else 'disabled')
+        if not running:
+            self.stage_var.set("")
+        self.progress['value'] = 0
+    
+    def on_progress(self, stage, fraction):
+        """按阶段权重把阶段内进度换算为总进度"""
+        start, stop, label = PROGRESS_STAGES[stage]
+        self.progress['value'] = start + (stop - start) * fraction
+        self.stage_var.set(f"{label} {fraction:.0%}")
+    
+    def drain_queue(self):
+        """主线程定时取出后台线程的日志、进度和结果（处理函数出错时也继续轮询）"""
+        log_lines = []
+        try:
+            while True:
+                kind, payload = self.queue.get_nowait()
+                if kind == 'log':
+                    log_lines.append(payload)
+                    continue
+                
+                if log_lines:
+                    self.append_log("\n".join(log_lines))
+                    log_lines = []
+                
+                if kind == 'progress':
+                    self.on_progress(*payload)
+                elif kind == 'analyzed':
+                    self.on_analyzed(*payload)
+                elif kind == 'finished':
+                    self.set_running(False)
+                    messagebox.showinfo("处理完成", f"ECG数据处理完成！\n{payload}")
+                elif kind == 'cancelled':
+                    self.append_log("处理已取消")
+                    self.set_running(False)
+                elif kind == 'error':
+                    self.on_error(payload)
+        except queue.Empty:
+            pass
         finally:
-            self.progress.stop()
-            self.process_btn.config(state='normal')
+            if log_lines:
+                self.append_log("\n".join(log_lines))
+            self.root.after(QUEUE_POLL_MS, self.drain_queue)
     
     def run(self):
         self.root.mainloop()
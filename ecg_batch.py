@@ -0,0 +1,223 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ecg_pipeline import ECGPipeline
+from param_sweep import best_parameters
+from stage_cache import DEFAULT_MAX_BYTES, StageCache
+
+# 自动调参时写入清单的参数
+SWEEP_FIELDS = ('lowcut', 'highcut', 'order', 'prominence_factor', 'distance_seconds')
+
+MANIFEST_FIELDS = [
+    'file', 'lead', 'status', 'error', 'n_samples', 'n_peaks', 'n_rr',
+    'rr_mean', 'rr_std', 'rr_min', 'rr_max', 'output', 'cache_hits', 'cache_misses',
+    'cache_saved_seconds', *SWEEP_FIELDS, 'tune_score',
+]
+
+# 工作进程内按 (目录, 容量) 复用的阶段缓存：目录只在首次写入时扫描一次
+_worker_caches = {}
+
+
+def _worker_cache(cache_dir, cache_bytes):
+    """当前进程的阶段缓存实例，每个文件开始时清零命中统计"""
+    cache = _worker_caches.get((cache_dir, cache_bytes))
+    if cache is None:
+        cache = _worker_caches[cache_dir, cache_bytes] = StageCache(cache_dir, cache_bytes)
+    cache.reset_stats()
+    return cache
+
+
+def collect_input_files(pattern, extension='.txt'):
+    """
+    收集待处理的ECG文件
+
+    Parameters:
+    pattern: 目录路径或通配符（支持 ** 递归）
+    extension: 目录模式下匹配的文件扩展名
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, f"*{extension}")
+    files = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+    return sorted(files)
+
+
+def process_one(input_path, fs, lowcut, highcut, block_seconds=None, columns=None, fuse=False,
+                segment_seconds=None, write_session=False, cache_dir=None,
+                cache_bytes=DEFAULT_MAX_BYTES, auto_tune=False, detect_rate=None):
+    """
+    在工作进程中处理单个文件，异常只影响当前文件
+
+    Parameters:
+    cache_dir: 阶段缓存目录，为 None 时不使用阶段缓存
+    auto_tune: 是否先在参数网格上为该文件自动选择滤波和检测参数（多导联时按第一个导联选择）
+    detect_rate: 多速率检测的最低检测频率 (Hz)，为 None 时在原采样频率下处理
+
+    Returns:
+    list: 清单行，单导联时一行，多导联时每个导联（及融合结果）一行
+    """
+    cache = _worker_cache(cache_dir, cache_bytes) if cache_dir else None
+    try:
+        pipeline = ECGPipeline(stage_cache=cache)
+        filter_params = {'lowcut': lowcut, 'highcut': highcut, 'order': 4}
+        detect_params, tuned = {}, None
+        if auto_tune:
+            signal = pipeline.load_ecg_data(input_path, columns=columns[0] if columns else 1)
+            filter_params, detect_params, tuned = best_parameters(signal, fs)
+        if columns is None:
+            summaries = [pipeline.process_file(input_path, fs=fs, block_seconds=block_seconds,
+                                               segment_seconds=segment_seconds, detect_workers=1,
+                                               write_session=write_session,
+                                               detect_params=detect_params,
+                                               detect_rate=detect_rate, **filter_params)]
+        else:
+            summaries = pipeline.process_file_multi(input_path, columns, fs=fs,
+                                                    block_seconds=block_seconds, fuse=fuse,
+                                                    segment_seconds=segment_seconds,
+                                                    detect_workers=1, write_session=write_session,
+                                                    detect_params=detect_params,
+                                                    detect_rate=detect_rate, **filter_params)
+    except Exception as e:
+        return [{'file': input_path, 'status': 'error', 'error': str(e)}]
+
+    if cache is not None:
+        # 缓存统计记在该文件的第一行，汇总时不会重复计数
+        stats = cache.stats.values()
+        summaries[0].update(cache_hits=sum(s['hits'] for s in stats),
+                            cache_misses=sum(s['misses'] for s in stats),
+                            cache_saved_seconds=round(sum(s['saved'] for s in stats), 3))
+    if tuned is not None:
+        for summary in summaries:
+            summary.update({name: tuned[name] for name in SWEEP_FIELDS},
+                           tune_score=round(tuned['score'], 3))
+    return [dict(summary, file=input_path, status='error' if 'error' in summary else 'ok')
+            for summary in summaries]
+
+
+def run_batch(files, fs, lowcut, highcut, workers=None, log=print, block_seconds=None,
+              columns=None, fuse=False, segment_seconds=None, write_session=False,
+              cache_dir=None, cache_bytes=DEFAULT_MAX_BYTES, auto_tune=False, detect_rate=None):
+    """
+    使用进程池批量处理文件
+
+    Returns:
+    list: 按输入文件顺序排列的清单行
+    """
+    workers = workers or os.cpu_count() or 1
+    results = [None] * len(files)
+    if cache_dir:
+        # 过期哈希记录的清理和容量检查每批只做一次，工作进程之后只累加各自写入的大小
+        StageCache(cache_dir, cache_bytes).evict()
+
+    with ProcessPoolExecutor(max_workers=min(workers, max(len(files), 1))) as executor:
+        futures = {
+            executor.submit(process_one, path, fs, lowcut, highcut,
+                            block_seconds, columns, fuse, segment_seconds, write_session,
+                            cache_dir, cache_bytes, auto_tune, detect_rate): index
+            for index, path in enumerate(files)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            try:
+                rows = future.result()
+            except Exception as e:
+                # 工作进程意外退出等情况
+                rows = [{'file': files[index], 'status': 'error', 'error': str(e)}]
+            results[index] = rows
+
+            errors = [row['error'] for row in rows if row['status'] != 'ok']
+            status = "完成" if not errors else f"失败: {errors[0]}"
+            log(f"[{done}/{len(files)}] {os.path.basename(files[index])} {status}")
+
+    return [row for rows in results for row in rows]
+
+
+def write_manifest(results, manifest_path):
+    """写出批处理汇总清单（CSV）"""
+    with open(manifest_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=MANIFEST_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            writer.writerow(result)
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量将ECG文本文件处理为RR间期对")
+    parser.add_argument('input', help="输入目录或通配符，例如 data/ 或 'data/**/*.txt'")
+    parser.add_argument('--fs', type=float, default=500, help="采样频率 (Hz)，默认 500")
+    parser.add_argument('--lowcut', type=float, default=1, help="带通下限 (Hz)，默认 1")
+    parser.add_argument('--highcut', type=float, default=45, help="带通上限 (Hz)，默认 45")
+    parser.add_argument('--columns', default=None,
+                        help="多导联数据列号（从0开始，逗号分隔），例如 1,2,3")
+    parser.add_argument('--fuse', action='store_true', help="多导联时额外输出跨导联融合的RR间期")
+    parser.add_argument('--stream-block', type=float, default=None, metavar='SECONDS',
+                        help="按指定块长度（秒）流式滤波，适合多日记录")
+    parser.add_argument('--segment', type=float, default=None, metavar='SECONDS',
+                        help="按指定段长（秒）分段检测R峰，阈值按段计算")
+    parser.add_argument('--session', action='store_true',
+                        help="同时保存分析会话（信号、R峰位置、RR间期对），可直接在数据精选工具中打开")
+    parser.add_argument('--stage-cache', nargs='?', const='', default=None, metavar='DIR',
+                        help="启用阶段结果缓存（按文件内容和参数复用加载、滤波、R峰检测结果），"
+                             "默认目录 ~/.ecg_stage_cache 或环境变量 ECG_STAGE_CACHE")
+    parser.add_argument('--cache-size', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3,
+                        metavar='GB', help="阶段缓存容量上限 (GB)，超出时淘汰最久未用的结果")
+    parser.add_argument('--auto-tune', action='store_true',
+                        help="为每个文件自动选择滤波频带和R峰检测参数（忽略 --lowcut/--highcut），"
+                             "所选参数写入汇总清单")
+    parser.add_argument('--detect-rate', type=float, default=None, metavar='HZ',
+                        help="高采样率记录先降采样到不低于该频率（例如 250）再滤波和检测R峰，"
+                             "R峰随后在原信号上精确定位")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认等于CPU核数")
+    parser.add_argument('--manifest', default=None, help="汇总清单路径，默认写到输入目录下")
+    args = parser.parse_args(argv)
+
+    if args.fs <= 0 or args.lowcut <= 0 or args.highcut <= args.lowcut:
+        parser.error("参数设置不正确")
+
+    columns = None
+    if args.columns is not None:
+        try:
+            columns = [int(c) for c in args.columns.split(',')]
+        except ValueError:
+            parser.error("数据列设置不正确")
+
+    files = collect_input_files(args.input)
+    if not files:
+        print(f"未找到匹配的文件: {args.input}", file=sys.stderr)
+        return 1
+
+    manifest_path = args.manifest
+    if manifest_path is None:
+        manifest_dir = args.input if os.path.isdir(args.input) else os.getcwd()
+        manifest_path = os.path.join(manifest_dir, "rr_batch_manifest.csv")
+
+    cache_dir = None
+    if args.stage_cache is not None:
+        cache_dir = StageCache(args.stage_cache or None).directory
+
+    print(f"共 {len(files)} 个文件，开始批量处理...")
+    results = run_batch(files, args.fs, args.lowcut, args.highcut, args.workers,
+                        block_seconds=args.stream_block, columns=columns, fuse=args.fuse,
+                        segment_seconds=args.segment, write_session=args.session,
+                        cache_dir=cache_dir, cache_bytes=int(args.cache_size * 1024 ** 3),
+                        auto_tune=args.auto_tune, detect_rate=args.detect_rate)
+    write_manifest(results, manifest_path)
+
+    failed_files = {result['file'] for result in results if result['status'] != 'ok'}
+    failed = len(failed_files)
+    print(f"处理完成: 成功 {len(files) - failed} 个，失败 {failed} 个")
+    if cache_dir is not None:
+        hits = sum(result.get('cache_hits', 0) for result in results)
+        misses = sum(result.get('cache_misses', 0) for result in results)
+        saved = sum(result.get('cache_saved_seconds', 0.0) for result in results)
+        print(f"阶段缓存: 命中 {hits} 次，未命中 {misses} 次，共节省约 {saved:.1f} 秒（{cache_dir}）")
+    print(f"汇总清单: {manifest_path}")
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,880 @@
+import contextlib
+import functools
+import itertools
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.signal import (butter, detrend, find_peaks, firwin, kaiserord, resample_poly, sosfilt,
+                          sosfiltfilt)
+
+from ecg_session import (CLEANING_HISTORY, FILTERED, R_PEAKS, RAW, RR_PAIRS, ECGSession,
+                         session_path)
+from instrumentation import annotate, instrument
+from sidecar_cache import load_sidecar, write_sidecar
+from stage_cache import STAGE_NAMES, timed
+
+# ADC值的存储类型及文本分块读取大小
+ADC_DTYPE = np.int32
+ADC_CACHE_TAG = 'adc'
+CHUNK_BYTES = 16 * 1024 * 1024
+MIN_SPLIT_CHARS = 64 * 1024
+
+# 分块流式滤波与整段滤波结果的最大偏差（相对于输入信号的最大幅值）
+STREAM_FILTER_TOL = 1e-6
+
+# R峰检测的默认参数：幅值阈值百分位数、显著性（相对标准差）及最小间隔（秒）
+PEAK_PERCENTILE = 90
+PEAK_PROMINENCE_FACTOR = 0.8
+PEAK_DISTANCE_SECONDS = 0.25
+
+# 多速率检测：降采样后的最低检测频率 (Hz)、带通上限占降采样后奈奎斯特频率的最大比例、
+# 抗混叠滤波器阻带衰减 (dB)，R峰在原信号上精确定位时局部窗口的半宽（秒）及每批处理的R峰数
+DETECT_RATE = 250
+DETECT_BAND_RATIO = 0.8
+ANTI_ALIAS_ATTENUATION = 60
+REFINE_HALF_WIDTH = 0.05
+REFINE_BATCH = 10000
+
+# 多速率路径中降采样在“滤波”阶段进度中所占的比例，其余为降采样后的带通滤波
+DECIMATE_PROGRESS_SHARE = 0.5
+
+# 缓存阶段对应的进度阶段
+STAGE_PROGRESS = {'load': 'load', 'filter': 'filter', 'peaks': 'detect', 'rr': 'detect'}
+
+
+class ProcessingCancelled(Exception):
+    """处理被用户取消"""
+
+
+def default_output_path(input_path):
+    """根据输入文件生成同目录下的RR间期输出路径"""
+    base_name = os.path.splitext(input_path)[0]
+    return f"{base_name}_RR_intervals.csv"
+
+
+@functools.lru_cache(maxsize=64)
+def design_bandpass(fs, lowcut=1, highcut=45, order=4):
+    """设计Butterworth带通滤波器（二阶节形式），相同参数只设计一次"""
+    nyq = 0.5 * fs
+    return butter(order, [lowcut / nyq, highcut / nyq], btype='band', output='sos')
+
+
+@functools.lru_cache(maxsize=64)
+def filter_margin(fs, lowcut=1, highcut=45, order=4, tol=STREAM_FILTER_TOL):
+    """
+    计算分块滤波每侧需要的重叠样本数
+
+    块边缘截断造成的误差不超过 输入最大幅值 × 冲激响应在重叠处之后的绝对值尾部之和，
+    反向滤波再放大至多 sum|h| 倍，两侧各有一份，因此取尾部之和降到 tol / (2·sum|h|)
+    以下的位置，分块结果与整段滤波的偏差不超过输入最大幅值的 tol
+    """
+    sos = design_bandpass(fs, lowcut, highcut, order)
+    length = max(int(8 * fs / lowcut), 16)
+    while True:
+        impulse = np.zeros(length)
+        impulse[0] = 1.0
+        response = np.abs(sosfilt(sos, impulse))
+        tail = np.cumsum(response[::-1])[::-1]
+        threshold = tol / (2 * tail[0])
+        if tail[-1] <= threshold * 1e-3:
+            return int(np.argmax(tail <= threshold))
+        length *= 2
+
+
+def iter_bandpass_blocks(signal, fs, lowcut=1, highcut=45, order=4, block_size=None):
+    """
+    零相位分块流式带通滤波
+
+    每块两侧各扩展 filter_margin 个样本后做正反向滤波，只保留块中心部分；
+    信号首尾处与整段滤波使用相同的边界延拓。输入可以是内存映射数组，
+    内存占用只与块大小有关，与记录长度无关。
+
+    Yields:
+    (start, stop, filtered_block): 块在原信号中的范围及滤波结果（最后一维为时间轴）
+    """
+    sos = design_bandpass(fs, lowcut, highcut, order)
+    margin = filter_margin(fs, lowcut, highcut, order)
+    n_samples = signal.shape[-1]
+    if block_size is None:
+        block_size = max(int(60 * fs), 4 * margin)
+
+    for start in range(0, n_samples, block_size):
+        stop = min(start + block_size, n_samples)
+        ext_start = max(start - margin, 0)
+        ext_stop = min(stop + margin, n_samples)
+        extended = np.asarray(signal[..., ext_start:ext_stop], dtype=float)
+        filtered = sosfiltfilt(sos, extended, axis=-1)
+        yield start, stop, filtered[..., start - ext_start:stop - ext_start]
+
+
+def decimation_factor(fs, highcut=45, detect_rate=DETECT_RATE):
+    """
+    多速率检测的整数降采样倍数
+
+    降采样后的频率不低于 detect_rate，且带通上限不超过其奈奎斯特频率的 DETECT_BAND_RATIO；
+    不满足时返回 1（不降采样）
+    """
+    factor = max(int(fs // detect_rate), 1)
+    while factor > 1 and highcut > DETECT_BAND_RATIO * fs / factor / 2:
+        factor -= 1
+    return factor
+
+
+@functools.lru_cache(maxsize=64)
+def anti_alias_taps(fs, factor, highcut=45):
+    """
+    降采样用的抗混叠FIR滤波器（Kaiser窗）
+
+    只需保证混叠不落入 0 ~ highcut 的通带，过渡带可以从 highcut 一直延伸到
+    降采样后频率减去 highcut，因此比 resample_poly 的默认滤波器短得多
+    """
+    rate = fs / factor
+    width = (rate - 2 * highcut) / (fs / 2)
+    numtaps, beta = kaiserord(ANTI_ALIAS_ATTENUATION, width)
+    return firwin(numtaps | 1, rate / 2, window=('kaiser', beta), fs=fs)
+
+
+def iter_decimated_blocks(signal, factor, taps, block_size=None):
+    """
+    多相抗混叠滤波并按整数倍分块降采样
+
+    resample_poly 已补偿FIR滤波器的延迟，降采样后的样本 i 对应原信号的样本 i * factor。
+    块边界和重叠都取 factor 的整数倍，每侧重叠覆盖滤波器半长，结果与整段降采样一致。
+
+    Parameters:
+    taps: 抗混叠FIR滤波器系数（见 anti_alias_taps）
+
+    Yields:
+    (start, stop, decimated_block): 块在降采样信号中的范围及结果（最后一维为时间轴）
+    """
+    n_samples = signal.shape[-1]
+    n_out = -(-n_samples // factor)
+    margin = (len(taps) // 2 // factor + 2) * factor
+    if block_size is None:
+        block_size = 60 * 1000 * factor
+    block_size = max(block_size // factor, 1) * factor
+
+    for start in range(0, n_samples, block_size):
+        stop = min(start + block_size, n_samples)
+        ext_start = max(start - margin, 0)
+        ext_stop = min(stop + margin, n_samples)
+        extended = np.asarray(signal[..., ext_start:ext_stop], dtype=float)
+        decimated = resample_poly(extended, 1, factor, axis=-1, window=taps)
+        first = (start - ext_start) // factor
+        count = -(-(stop - start) // factor)
+        yield start // factor, min(start // factor + count, n_out), decimated[..., first:first + count]
+
+
+def refine_r_peaks(signal, fs, candidates, factor, highcut=45, order=4,
+                   half_width=REFINE_HALF_WIDTH):
+    """
+    在原信号上精确定位降采样信号中检测到的R峰
+
+    每个候选位置两侧各取 half_width 秒的原始信号，去除线性基线后做与带通上限相同的
+    零相位低通滤波，在候选位置 ±factor 个样本内取最大值，再用三点抛物线插值得到
+    亚样本位置。所有窗口按批堆叠成二维数组一次滤波。
+
+    Parameters:
+    signal: 原始全速率信号（一维，可以是内存映射数组）
+    candidates: 降采样信号中的R峰位置
+    factor: 降采样倍数
+
+    Returns:
+    np.ndarray: 原信号中的R峰位置（浮点，亚样本精度）
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    n_samples = len(signal)
+    if len(candidates) == 0 or n_samples < 3:
+        return candidates.astype(float)
+
+    width = max(int(half_width * fs), 2 * factor + 1)
+    offsets = np.arange(-width, width + 1)
+    search = slice(width - factor, width + factor + 1)
+    sos = butter(order, highcut, btype='low', fs=fs, output='sos')
+
+    refined = np.empty(len(candidates))
+    for first in range(0, len(candidates), REFINE_BATCH):
+        centers = candidates[first:first + REFINE_BATCH] * factor
+        index = np.clip(centers[:, None] + offsets, 0, n_samples - 1)
+        windows = detrend(np.asarray(signal[index.ravel()], dtype=float).reshape(index.shape),
+                          axis=-1)
+        smoothed = sosfiltfilt(sos, windows, axis=-1)
+
+        k = search.start + np.argmax(smoothed[:, search], axis=1)
+        rows = np.arange(len(k))
+        left, middle, right = smoothed[rows, k - 1], smoothed[rows, k], smoothed[rows, k + 1]
+        curvature = left - 2 * middle + right
+        shift = np.where(curvature < 0, 0.5 * (left - right) / np.where(curvature < 0, curvature, -1),
+                         0.0)
+        refined[first:first + len(centers)] = centers + (k - width) + np.clip(shift, -0.5, 0.5)
+    return np.clip(refined, 0, n_samples - 1)
+
+
+def adc_cache_tag(columns):
+    """
+    数据列对应的缓存标签，默认的第二列保持为 'adc'
+
+    单列缓存一维数组，列号序列缓存 (导联数, 样本数) 的数组，两者用不同前缀（'adc11' 与
+    'adcs11'），只含一列的序列也不会读到单列的缓存
+    """
+    if np.isscalar(columns):
+        return ADC_CACHE_TAG if int(columns) == 1 else f"{ADC_CACHE_TAG}{int(columns)}"
+    return f"{ADC_CACHE_TAG}s" + "_".join(str(int(c)) for c in columns)
+
+
+def lead_output_path(input_path, column):
+    """多导联模式下单个导联的RR间期输出路径"""
+    base_name = os.path.splitext(input_path)[0]
+    return f"{base_name}_lead{column}_RR_intervals.csv"
+
+
+def fuse_r_peaks(peak_lists, fs, tolerance=0.05, min_leads=None):
+    """
+    跨导联融合R峰位置
+
+    将各导联的R峰合并排序，相距不超过 tolerance 秒的归为同一次心搏，
+    至少被 min_leads 个导联检出（默认过半数）的心搏取各导联位置的中位数
+
+    Returns:
+    np.ndarray: 融合后的R峰位置（采样点索引）
+    """
+    n_leads = len(peak_lists)
+    if min_leads is None:
+        min_leads = n_leads // 2 + 1
+
+    positions = np.sort(np.concatenate([np.asarray(p, dtype=np.int64) for p in peak_lists]))
+    if len(positions) == 0:
+        return positions
+
+    # 相邻位置间隔超过容差即开始新的心搏簇
+    new_cluster = np.diff(positions) > tolerance * fs
+    starts = np.concatenate(([0], np.flatnonzero(new_cluster) + 1))
+    counts = np.diff(np.concatenate((starts, [len(positions)])))
+
+    lower = positions[starts + (counts - 1) // 2]
+    upper = positions[starts + counts // 2]
+    medians = (lower + upper) // 2
+    return medians[counts >= min_leads]
+
+
+def locate_r_peaks(ecg_signal, fs, reference=None, percentile=PEAK_PERCENTILE,
+                   prominence_factor=PEAK_PROMINENCE_FACTOR, distance_seconds=PEAK_DISTANCE_SECONDS):
+    """
+    检测R峰位置（采样点索引）
+
+    Parameters:
+    reference: 计算幅值阈值所用的信号片段，默认为整个信号
+    percentile: 幅值阈值取参考信号的该百分位数
+    prominence_factor: 显著性阈值为参考信号标准差的倍数
+    distance_seconds: 相邻R峰的最小间隔（秒）
+    """
+    if reference is None:
+        reference = ecg_signal
+    peaks, _ = find_peaks(
+        ecg_signal,
+        height=np.percentile(reference, percentile),
+        distance=max(int(distance_seconds * fs), 1),
+        prominence=np.std(reference) * prominence_factor
+    )
+    return peaks
+
+
+def _fields_per_line(text, n_lines):
+    """每行以空白分隔的字段数（按字节向量化统计，控制字符均视为空白）"""
+    data = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+    space = data <= ord(' ')
+    starts = np.empty(len(data), dtype=bool)
+    starts[0] = not space[0]
+    np.greater(space[:-1], space[1:], out=starts[1:])
+    line_starts = np.concatenate(([0], np.flatnonzero(data == ord('\n')) + 1))[:n_lines]
+    return np.add.reduceat(starts, line_starts, dtype=np.intp)
+
+
+def _locate_segment_peaks(segment, fs, core_start, core_stop, detect_params=None):
+    """在一个带重叠的片段内检测R峰，阈值取自片段核心区，只返回核心区内的峰"""
+    peaks = locate_r_peaks(segment, fs, reference=segment[core_start:core_stop],
+                           **(detect_params or {}))
+    return peaks[(peaks >= core_start) & (peaks < core_stop)] - core_start
+
+
+def enforce_peak_distance(peaks, ecg_signal, distance):
+    """去除间隔小于 distance 的相邻R峰，保留幅值较高者"""
+    keep = np.ones(len(peaks), dtype=bool)
+    for i in np.flatnonzero(np.diff(peaks) < distance):
+        # 左侧峰可能已在上一次冲突中被移除，此时与再往前保留的峰比较
+        left = i
+        while left >= 0 and not keep[left]:
+            left -= 1
+        if left < 0 or peaks[i + 1] - peaks[left] >= distance:
+            continue
+        if ecg_signal[peaks[i + 1]] > ecg_signal[peaks[left]]:
+            keep[left] = False
+        else:
+            keep[i + 1] = False
+    return peaks[keep]
+
+
+def rr_statistics(rr_intervals):
+    """计算RR间期的基本统计量"""
+    rr_intervals = np.asarray(rr_intervals, dtype=float)
+    if len(rr_intervals) == 0:
+        return {'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan}
+    return {
+        'mean': float(np.mean(rr_intervals)),
+        'std': float(np.std(rr_intervals)),
+        'min': float(np.min(rr_intervals)),
+        'max': float(np.max(rr_intervals)),
+    }
+
+
+class ECGPipeline:
+    def __init__(self, log=None, progress=None, cancel_event=None, stage_cache=None):
+        """
+        ECG → RR间期处理引擎（不依赖界面）
+
+        Parameters:
+        log: 日志回调函数（可选），接收一条文本消息
+        progress: 进度回调函数（可选），接收阶段名和该阶段完成比例 (0-1)
+        cancel_event: threading.Event（可选），置位后在下一个检查点抛出 ProcessingCancelled
+        stage_cache: StageCache（可选），加载、滤波、R峰检测和RR间期各阶段结果的缓存
+        """
+        self.log = log
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.stage_cache = stage_cache
+        # 阶段名 → 当前子步骤在该阶段进度中的区间（见 progress_span）
+        self._progress_spans = {}
+
+    def log_message(self, message):
+        if self.log is not None:
+            self.log(message)
+
+    def report_progress(self, stage, fraction):
+        """报告阶段进度，同时作为取消检查点"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ProcessingCancelled("处理已取消")
+        if self.progress is not None:
+            start, stop = self._progress_spans.get(stage, (0.0, 1.0))
+            self.progress(stage, start + (stop - start) * fraction)
+
+    @contextlib.contextmanager
+    def progress_span(self, stage, start, stop):
+        """
+        一个阶段由多个子步骤组成时，把子步骤报告的 0-1 进度映射到该阶段的 [start, stop]，
+        各子步骤依次推进，进度不会回退
+        """
+        previous = self._progress_spans.get(stage)
+        self._progress_spans[stage] = (start, stop)
+        try:
+            yield
+        finally:
+            if previous is None:
+                del self._progress_spans[stage]
+            else:
+                self._progress_spans[stage] = previous
+
+    def load_ecg_data(self, filepath, use_cache=True, columns=1):
+        """
+        加载ECG数据（默认第二列ADC值）
+
+        文本按块读取，每块由NumPy的C解析器直接转换为整型数组；含格式错误或
+        空行的块才逐行解析。首次解析后在源文件旁写出 .npy 缓存，之后以内存映射方式读取。
+
+        Parameters:
+        columns: 数据列号（从0开始）；传入列号序列时一次读取多个导联
+
+        Returns:
+        np.ndarray: ADC值（ADC_DTYPE）；多导联时形状为 (导联数, 样本数)
+        """
+        if not os.path.isfile(filepath):
+            raise FileNotFoundError(f"未找到文件: {filepath}")
+
+        multi_lead = not np.isscalar(columns)
+        column_list = tuple(int(c) for c in columns) if multi_lead else (int(columns),)
+        if not column_list or min(column_list) < 0:
+            raise ValueError("数据列设置不正确")
+        cache_tag = adc_cache_tag(columns)
+
+        self.report_progress('load', 0.0)
+        if use_cache:
+            cached = load_sidecar(filepath, cache_tag)
+            if cached is not None:
+                self.log_message(f"已从缓存加载: {os.path.basename(filepath)}")
+                self.report_progress('load', 1.0)
+                return cached
+
+        total_bytes = max(os.path.getsize(filepath), 1)
+        bad_lines = []
+        chunks = []
+        with open(filepath, 'rb') as file:
+            file.readline()  # 跳过表头
+            line_num = 2
+            while True:
+                block = file.read(CHUNK_BYTES)
+                if not block:
+                    break
+                if not block.endswith(b'\n'):
+                    block += file.readline()
+                chunks.append(self._parse_block(block.decode('utf-8'), line_num,
+                                                bad_lines, column_list))
+                line_num += block.count(b'\n')
+                self.report_progress('load', file.tell() / total_bytes)
+
+        if bad_lines:
+            self.log_message(f"警告: 共 {len(bad_lines)} 行数据格式错误，已跳过"
+                             f"（首个位于第{bad_lines[0]}行）")
+
+        if chunks:
+            rows = np.concatenate(chunks)
+        else:
+            rows = np.empty((0, len(column_list)), dtype=ADC_DTYPE)
+        if len(rows) == 0:
+            raise ValueError("文件中没有有效的ECG数据")
+
+        # 多导联按 (导联, 样本) 存放，每个导联在内存中连续
+        adc_values = np.ascontiguousarray(rows.T) if multi_lead else rows[:, 0].copy()
+
+        if use_cache:
+            write_sidecar(filepath, cache_tag, adc_values)
+
+        return adc_values
+
+    @staticmethod
+    def _parse_block(text, first_line_num, bad_lines, columns=(1,)):
+        """解析一块文本，出错时退回逐行解析并记录错误行号"""
+        first_line = text.lstrip().split('\n', 1)[0]
+        n_cols = len(first_line.split())
+        if n_cols == 0:
+            return np.empty((0, len(columns)), dtype=ADC_DTYPE)
+
+        info = np.iinfo(ADC_DTYPE)
+        max_column = max(columns)
+
+        # 快速路径：整块按空白分隔一次性解析（先按 int64 解析，超出 ADC_DTYPE 范围的值
+        # 才能被发现而不是溢出回绕），每行字段数都与首行一致才采用
+        if n_cols > max_column:
+            n_lines = text.count('\n') + (not text.endswith('\n'))
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                try:
+                    values = np.fromstring(text, dtype=np.int64, sep=' ')
+                except ValueError:
+                    values = None
+            if (values is not None and len(values) == n_lines * n_cols
+                    and np.all(_fields_per_line(text, n_lines) == n_cols)):
+                selected = values.reshape(n_lines, n_cols)[:, list(columns)]
+                if len(selected) == 0 or (selected.min() >= info.min and selected.max() <= info.max):
+                    return selected.astype(ADC_DTYPE)
+
+        # 大块对半拆分后分别解析，把逐行解析限制在出错行附近的小块内
+        if len(text) > MIN_SPLIT_CHARS:
+            split_at = text.find('\n', len(text) // 2) + 1
+            if 0 < split_at < len(text):
+                head, tail = text[:split_at], text[split_at:]
+                return np.concatenate([
+                    ECGPipeline._parse_block(head, first_line_num, bad_lines, columns),
+                    ECGPipeline._parse_block(tail, first_line_num + head.count('\n'),
+                                             bad_lines, columns),
+                ])
+
+        adc_values = []
+        for line_num, line in enumerate(text.splitlines(), first_line_num):
+            parts = line.split()
+            if len(parts) <= max_column:
+                continue
+            try:
+                row = [int(parts[c]) for c in columns]
+            except ValueError:
+                bad_lines.append(line_num)
+                continue
+            if all(info.min <= value <= info.max for value in row):
+                adc_values.append(row)
+            else:
+                bad_lines.append(line_num)
+        return np.array(adc_values, dtype=ADC_DTYPE).reshape(-1, len(columns))
+
+    def bandpass_filter(self, signal, fs, lowcut=1, highcut=45, order=4,
+                        block_size=None, out=None):
+        """
+        带通滤波
+
+        Parameters:
+        block_size: 分块流式滤波的块长度（样本数），为 None 时整段滤波
+        out: 流式模式下的输出数组（可为内存映射数组），为 None 时新建
+        """
+        self.report_progress('filter', 0.0)
+        if block_size is None:
+            sos = design_bandpass(fs, lowcut, highcut, order)
+            filtered_signal = sosfiltfilt(sos, np.asarray(signal, dtype=float), axis=-1)
+            self.report_progress('filter', 1.0)
+            return filtered_signal
+
+        if out is None:
+            out = np.empty(signal.shape, dtype=float)
+        n_samples = signal.shape[-1]
+        for start, stop, filtered in iter_bandpass_blocks(signal, fs, lowcut, highcut,
+                                                          order, block_size):
+            out[..., start:stop] = filtered
+            self.report_progress('filter', stop / n_samples)
+        return out
+
+    def decimate(self, signal, fs, factor, highcut=45, block_size=None):
+        """
+        多相抗混叠滤波并按整数倍降采样（分块进行，输入可以是内存映射数组）
+
+        Parameters:
+        block_size: 每块的原信号样本数，为 None 时使用默认块长
+        """
+        n_out = -(-signal.shape[-1] // factor)
+        out = np.empty(signal.shape[:-1] + (n_out,))
+        taps = anti_alias_taps(fs, factor, highcut)
+        for start, stop, decimated in iter_decimated_blocks(signal, factor, taps, block_size):
+            out[..., start:stop] = decimated
+            self.report_progress('filter', stop / n_out)
+        return out
+
+    def refine_peaks(self, ecg_data, peaks, fs, factor, highcut=45, order=4):
+        """
+        将降采样信号中的R峰映射回原信号并精确定位（取最近的样本）
+
+        Parameters:
+        ecg_data: 原始信号；多导联时形状为 (导联数, 样本数)，peaks 为按导联排列的列表
+        """
+        if ecg_data.ndim > 1:
+            return [self.refine_peaks(lead, lead_peaks, fs, factor, highcut, order)
+                    for lead, lead_peaks in zip(ecg_data, peaks)]
+        refined = refine_r_peaks(ecg_data, fs, peaks, factor, highcut, order)
+        return np.unique(np.rint(refined).astype(np.int64))
+
+    def find_r_peaks(self, ecg_signal, fs, detect_params=None):
+        """
+        检测R峰位置（采样点索引）
+
+        Parameters:
+        detect_params: 传给 locate_r_peaks 的检测参数（percentile、prominence_factor、distance_seconds）
+        """
+        self.report_progress('detect', 0.0)
+        peaks = locate_r_peaks(ecg_signal, fs, **(detect_params or {}))
+        self.report_progress('detect', 1.0)
+        return peaks
+
+    def find_r_peaks_segmented(self, ecg_signal, fs, segment_seconds=600, overlap_seconds=10,
+                               workers=None, detect_params=None):
+        """
+        分段并行检测R峰
+
+        信号按固定长度切分，每段两侧各带 overlap_seconds 的重叠，阈值只用本段
+        核心区计算；各段只保留核心区内的峰，拼接后再在段边界处执行不应期约束。
+        分段方式只取决于 segment_seconds，结果与工作进程数无关。
+
+        Parameters:
+        workers: 工作进程数，默认等于CPU核数；为 1 时在当前进程内顺序执行
+        """
+        n_samples = len(ecg_signal)
+        segment_size = max(int(segment_seconds * fs), 1)
+        overlap = int(overlap_seconds * fs)
+
+        tasks = []
+        for core_start in range(0, n_samples, segment_size):
+            core_stop = min(core_start + segment_size, n_samples)
+            ext_start = max(core_start - overlap, 0)
+            ext_stop = min(core_stop + overlap, n_samples)
+            tasks.append((ext_start, core_start - ext_start, core_stop - ext_start, ext_stop))
+
+        self.report_progress('detect', 0.0)
+        workers = workers or os.cpu_count() or 1
+        results = []
+        if workers == 1 or len(tasks) == 1:
+            for a, b, c, d in tasks:
+                results.append(_locate_segment_peaks(ecg_signal[a:d], fs, b, c, detect_params))
+                self.report_progress('detect', len(results) / len(tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                for segment_peaks in executor.map(
+                        _locate_segment_peaks,
+                        (np.asarray(ecg_signal[a:d]) for a, b, c, d in tasks),
+                        itertools.repeat(fs),
+                        (b for a, b, c, d in tasks),
+                        (c for a, b, c, d in tasks),
+                        itertools.repeat(detect_params)):
+                    results.append(segment_peaks)
+                    self.report_progress('detect', len(results) / len(tasks))
+
+        peaks = np.concatenate([segment_peaks + core_start for segment_peaks, core_start
+                                in zip(results, range(0, n_samples, segment_size))])
+        self.log_message(f"分段检测完成: {len(tasks)} 段")
+        distance_seconds = (detect_params or {}).get('distance_seconds', PEAK_DISTANCE_SECONDS)
+        return enforce_peak_distance(peaks, ecg_signal, max(int(distance_seconds * fs), 1))
+
+    def find_r_peaks_multi(self, ecg_signals, fs, segment_seconds=None, workers=None,
+                           detect_params=None):
+        """逐导联检测R峰，阈值按各导联自身计算"""
+        return [self._find_peaks(ecg_signal, fs, segment_seconds, workers, detect_params)
+                for ecg_signal in ecg_signals]
+
+    def _find_peaks(self, ecg_signal, fs, segment_seconds=None, workers=None, detect_params=None):
+        """按是否分段选择R峰检测方式"""
+        if segment_seconds is None:
+            return self.find_r_peaks(ecg_signal, fs, detect_params)
+        return self.find_r_peaks_segmented(ecg_signal, fs, segment_seconds, workers=workers,
+                                           detect_params=detect_params)
+
+    def _cached_stage(self, stage, key, compute):
+        """有缓存时先查缓存，未命中再计算并写入"""
+        if self.stage_cache is None or stage not in self.stage_cache.stages:
+            return compute()
+        result, seconds = self.stage_cache.get(stage, key)
+        annotate(**{f'{stage}_cached': result is not None})
+        if result is not None:
+            self.log_message(f"缓存命中: {STAGE_NAMES[stage]}（节省约 {seconds:.1f} 秒）")
+            self.report_progress(STAGE_PROGRESS[stage], 1.0)
+            return result
+        result, seconds = timed(compute)
+        self.stage_cache.put(key, result, seconds)
+        return result
+
+    def analyze(self, input_path, fs=500, lowcut=1, highcut=45, columns=1, block_seconds=None,
+                segment_seconds=None, detect_workers=None, order=4, detect_params=None,
+                detect_rate=None):
+        """
+        加载 → 滤波 → R峰检测 → RR间期
+
+        配置了阶段缓存时，输入文件以内容哈希标识，每个阶段的缓存键由上一阶段的键和
+        本阶段参数组成：只改滤波参数时直接复用加载结果，参数都不变时全部命中。
+
+        指定 detect_rate 时走多速率路径：先抗混叠降采样到不低于 detect_rate 的频率，
+        在低速率信号上滤波和检测，再在原信号的局部窗口内把每个R峰精确定位到原采样点。
+        滤波和检测的计算量随降采样倍数成比例下降。
+
+        Parameters:
+        columns: 数据列号；传入列号序列时按多导联处理
+        order: 带通滤波器阶数
+        detect_params: R峰检测参数（见 locate_r_peaks）
+        detect_rate: 多速率检测的最低检测频率 (Hz)，为 None 时在原采样频率下处理
+
+        Returns:
+        (ecg_data, filtered, peaks, rr_intervals): 多导联时 peaks 和 rr_intervals 为按导联排列的列表；
+        多速率检测时不生成全速率的滤波信号，filtered 为 None
+        """
+        if not os.path.isfile(input_path):
+            raise FileNotFoundError(f"未找到文件: {input_path}")
+        multi_lead = not np.isscalar(columns)
+        column_key = [int(c) for c in columns] if multi_lead else int(columns)
+        factor = 1 if detect_rate is None else decimation_factor(fs, highcut, detect_rate)
+        rate = fs / factor
+
+        cache = self.stage_cache
+        # 阶段缓存不保存加载结果时，仍使用源文件旁的 .npy 缓存，避免同一份数据存两次
+        load_cached = cache is not None and 'load' in cache.stages
+        load_key = filter_key = peaks_key = rr_key = None
+        if cache is not None:
+            load_key = cache.key('load', cache.content_hash(input_path), column_key)
+            filter_key = cache.key('filter', load_key, fs, lowcut, highcut, order, block_seconds,
+                                   factor)
+            peaks_key = cache.key('peaks', filter_key, fs, segment_seconds,
+                                  sorted((detect_params or {}).items()))
+            rr_key = cache.key('rr', peaks_key, fs)
+
+        with instrument('load', file=os.path.basename(input_path)) as record:
+            ecg_data = self._cached_stage(
+                'load', load_key,
+                lambda: self.load_ecg_data(input_path, use_cache=not load_cached, columns=columns))
+            record.set(samples=ecg_data.shape[-1], leads=len(column_key) if multi_lead else 1)
+
+        block_size = None if block_seconds is None else int(block_seconds * rate)
+        if factor > 1:
+            self.log_message(f"多速率检测: 降采样 {factor} 倍至 {rate:g} Hz")
+
+        def bandpass():
+            if factor == 1:
+                return self.bandpass_filter(ecg_data, rate, lowcut, highcut, order,
+                                            block_size=block_size)
+            with self.progress_span('filter', 0.0, DECIMATE_PROGRESS_SHARE):
+                signal = self.decimate(ecg_data, fs, factor, highcut,
+                                       None if block_size is None else block_size * factor)
+            with self.progress_span('filter', DECIMATE_PROGRESS_SHARE, 1.0):
+                return self.bandpass_filter(signal, rate, lowcut, highcut, order,
+                                            block_size=block_size)
+
+        with instrument('filter', samples=ecg_data.shape[-1], factor=factor):
+            filtered = self._cached_stage('filter', filter_key, bandpass)
+
+        def detect():
+            if multi_lead:
+                found = self.find_r_peaks_multi(filtered, rate, segment_seconds, detect_workers,
+                                                detect_params)
+            else:
+                found = self._find_peaks(filtered, rate, segment_seconds, detect_workers,
+                                         detect_params)
+            return found if factor == 1 else self.refine_peaks(ecg_data, found, fs, factor,
+                                                                highcut, order)
+
+        with instrument('detect', samples=filtered.shape[-1]) as record:
+            peaks = self._cached_stage('peaks', peaks_key, detect)
+            if multi_lead:
+                rr_intervals = self._cached_stage(
+                    'rr', rr_key, lambda: [np.diff(lead_peaks) / fs for lead_peaks in peaks])
+                record.set(peaks=sum(len(lead_peaks) for lead_peaks in peaks))
+            else:
+                rr_intervals = self._cached_stage('rr', rr_key, lambda: np.diff(peaks) / fs)
+                record.set(peaks=len(peaks))
+
+        if cache is not None:
+            self.log_message(cache.summary())
+        return ecg_data, filtered if factor == 1 else None, peaks, rr_intervals
+
+    def detect_r_peaks(self, ecg_signal, fs):
+        """检测R峰"""
+        peaks = self.find_r_peaks(ecg_signal, fs)
+
+        # 计算RR间期（秒）
+        rr_intervals = np.diff(peaks) / fs
+        self.log_message(f"检测到 {len(peaks)} 个R峰，{len(rr_intervals)} 个RR间期")
+        return rr_intervals
+
+    def save_rr_intervals(self, rr_intervals, filepath):
+        """保存RR间期对"""
+        if len(rr_intervals) == 0:
+            self.log_message("警告: 没有RR间期数据可保存")
+            return
+
+        # 构造 (RR[n], RR[n+1]) 的二维数组
+        self.report_progress('save', 0.0)
+        rr_pairs = np.column_stack((rr_intervals[:-1], rr_intervals[1:]))
+        with instrument('save_rr_intervals', pairs=len(rr_pairs)):
+            np.savetxt(filepath, rr_pairs, delimiter=',',
+                       header='RR(n),RR(n+1)', comments='', fmt='%.6f')
+        self.report_progress('save', 1.0)
+        self.log_message(f"已保存 {len(rr_pairs)} 对RR间期到: {os.path.basename(filepath)}")
+
+    def save_session(self, path, r_peaks, fs, raw=None, filtered=None, **params):
+        """
+        保存分析会话：R峰位置、RR间期对、参数及（可选的）原始和滤波后信号
+
+        重新分析会使旧的清洗记录失效，因此同时删除会话中已有的清洗历史
+        """
+        self.report_progress('save', 0.0)
+        with instrument('save_session', peaks=len(r_peaks),
+                        samples=0 if raw is None else np.shape(raw)[-1]):
+            session = ECGSession(path, create=True)
+            rr_intervals = np.diff(r_peaks) / fs
+            session[R_PEAKS] = np.asarray(r_peaks, dtype=np.int64)
+            session[RR_PAIRS] = np.column_stack((rr_intervals[:-1], rr_intervals[1:]))
+            for name, array in ((RAW, raw), (FILTERED, filtered)):
+                if array is not None:
+                    session[name] = array
+                elif name in session:
+                    del session[name]
+            if CLEANING_HISTORY in session:
+                del session[CLEANING_HISTORY]
+            session.update_params(fs=fs, **params)
+        self.report_progress('save', 1.0)
+        self.log_message(f"已保存会话: {os.path.basename(path)}")
+
+    def process_file(self, input_path, output_path=None, fs=500, lowcut=1, highcut=45,
+                     block_seconds=None, segment_seconds=None, detect_workers=None,
+                     write_session=False, order=4, detect_params=None, detect_rate=None):
+        """
+        完整处理单个文件：加载 → 滤波 → R峰检测 → 保存
+
+        Parameters:
+        block_seconds: 流式滤波的块长度（秒），为 None 时整段滤波
+        segment_seconds: 分段检测R峰的段长（秒），为 None 时使用全局阈值
+        detect_workers: 分段检测的工作进程数
+        write_session: 是否在输出文件旁同时保存分析会话
+        order, detect_params: 滤波器阶数和R峰检测参数（见 locate_r_peaks）
+        detect_rate: 多速率检测的最低检测频率 (Hz)，为 None 时在原采样频率下处理
+
+        Returns:
+        dict: 处理摘要（样本数、R峰数、RR统计量、输出路径）
+        """
+        if fs <= 0 or lowcut <= 0 or highcut <= lowcut:
+            raise ValueError("参数设置不正确")
+
+        if output_path is None:
+            output_path = default_output_path(input_path)
+
+        ecg_data, filtered_signal, peaks, rr_intervals = self.analyze(
+            input_path, fs, lowcut, highcut, block_seconds=block_seconds,
+            segment_seconds=segment_seconds, detect_workers=detect_workers, order=order,
+            detect_params=detect_params, detect_rate=detect_rate)
+        self.log_message(f"检测到 {len(peaks)} 个R峰，{len(rr_intervals)} 个RR间期")
+
+        if len(rr_intervals) < 2:
+            raise ValueError("检测到的R峰数量不足，无法生成RR间期对")
+
+        self.save_rr_intervals(rr_intervals, output_path)
+        if write_session:
+            self.save_session(session_path(output_path), peaks, fs, ecg_data, filtered_signal,
+                              source=os.path.abspath(input_path), lowcut=lowcut, highcut=highcut,
+                              order=order, **(detect_params or {}))
+
+        summary = {
+            'n_samples': len(ecg_data),
+            'n_peaks': len(peaks),
+            'n_rr': len(rr_intervals),
+            'output': output_path,
+        }
+        summary.update({f'rr_{key}': value for key, value in rr_statistics(rr_intervals).items()})
+        return summary
+
+    def process_file_multi(self, input_path, columns, fs=500, lowcut=1, highcut=45,
+                           block_seconds=None, fuse=False, segment_seconds=None,
+                           detect_workers=None, write_session=False, order=4, detect_params=None,
+                           detect_rate=None):
+        """
+        多导联处理：一次读取所有导联、一次向量化滤波，逐导联检测并分别保存
+
+        Parameters:
+        columns: 数据列号序列，每列一个导联
+        fuse: 是否额外输出跨导联融合R峰得到的RR间期
+        write_session: 是否为每个导联（及融合结果）保存分析会话
+        order, detect_params: 滤波器阶数和R峰检测参数（见 locate_r_peaks）
+        detect_rate: 多速率检测的最低检测频率 (Hz)，为 None 时在原采样频率下处理
+
+        Returns:
+        list: 每个导联（及融合结果）的处理摘要，'lead' 字段为列号或 'fused'
+        """
+        if fs <= 0 or lowcut <= 0 or highcut <= lowcut:
+            raise ValueError("参数设置不正确")
+
+        ecg_data, filtered_signals, peak_lists, _ = self.analyze(
+            input_path, fs, lowcut, highcut, columns=columns, block_seconds=block_seconds,
+            segment_seconds=segment_seconds, detect_workers=detect_workers, order=order,
+            detect_params=detect_params, detect_rate=detect_rate)
+        outputs = [(column, peaks, lead_output_path(input_path, column), index)
+                   for index, (column, peaks) in enumerate(zip(columns, peak_lists))]
+        if fuse:
+            base_name = os.path.splitext(input_path)[0]
+            outputs.append(('fused', fuse_r_peaks(peak_lists, fs),
+                            f"{base_name}_fused_RR_intervals.csv", None))
+
+        summaries = []
+        for lead, peaks, output_path, index in outputs:
+            rr_intervals = np.diff(peaks) / fs
+            self.log_message(f"导联 {lead}: 检测到 {len(peaks)} 个R峰，{len(rr_intervals)} 个RR间期")
+            summary = {
+                'lead': lead,
+                'n_samples': ecg_data.shape[-1],
+                'n_peaks': len(peaks),
+                'n_rr': len(rr_intervals),
+            }
+            if len(rr_intervals) < 2:
+                summary['error'] = "检测到的R峰数量不足，无法生成RR间期对"
+            else:
+                self.save_rr_intervals(rr_intervals, output_path)
+                summary['output'] = output_path
+                if write_session:
+                    # 融合结果不对应单个导联，只保存R峰和RR间期
+                    raw = ecg_data[index] if index is not None else None
+                    filtered = (filtered_signals[index]
+                                if index is not None and filtered_signals is not None else None)
+                    self.save_session(session_path(output_path), peaks, fs, raw, filtered,
+                                      source=os.path.abspath(input_path), lead=lead,
+                                      lowcut=lowcut, highcut=highcut, order=order,
+                                      **(detect_params or {}))
+            summary.update({f'rr_{key}': value for key, value in rr_statistics(rr_intervals).items()})
+            summaries.append(summary)
+        return summaries
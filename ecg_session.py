@@ -0,0 +1,138 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# 会话目录后缀、格式版本及元数据文件名
+SESSION_SUFFIX = '.ecgsession'
+SESSION_VERSION = 1
+META_FILE = 'meta.json'
+
+# 标准条目名称
+RAW = 'raw'
+FILTERED = 'filtered'
+R_PEAKS = 'r_peaks'
+RR_PAIRS = 'rr_pairs'
+CLEANING_HISTORY = 'cleaning_history'
+
+
+def session_path(output_path):
+    """RR间期文件对应的会话目录路径"""
+    return os.path.splitext(output_path)[0] + SESSION_SUFFIX
+
+
+def pair_labels(r_peaks):
+    """RR间期对的标签：第 i 对 (RR[i], RR[i+1]) 中间那个R峰的样本位置"""
+    return np.asarray(r_peaks)[1:-1]
+
+
+class ECGSession:
+    def __init__(self, path, create=False):
+        """
+        ECG分析会话
+
+        会话是一个目录：meta.json 保存参数和条目信息，每个数组条目单独保存为一个 .npy。
+        打开会话时只读取 meta.json，数组在首次访问时以只读内存映射方式打开，
+        因此打开大型会话几乎不耗时。
+
+        Parameters:
+        path: 会话目录（也可传入其中的 meta.json）
+        create: 会话不存在时是否新建
+        """
+        if os.path.basename(path) == META_FILE:
+            path = os.path.dirname(path)
+        self.path = path
+        self._arrays = {}
+
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.isfile(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                self.meta = json.load(file)
+            if self.meta.get('version', 0) > SESSION_VERSION:
+                raise ValueError(f"会话格式版本 {self.meta.get('version')} 过新，无法读取")
+        elif create:
+            os.makedirs(path, exist_ok=True)
+            self.meta = {'version': SESSION_VERSION, 'params': {}, 'entries': {}}
+            self._write_meta()
+        else:
+            raise FileNotFoundError(f"未找到会话: {path}")
+
+    @property
+    def params(self):
+        """分析参数（采样频率、滤波范围、源文件等）"""
+        return self.meta['params']
+
+    def update_params(self, **params):
+        self.meta['params'].update(params)
+        self._write_meta()
+
+    def keys(self):
+        return list(self.meta['entries'])
+
+    def __contains__(self, name):
+        return name in self.meta['entries']
+
+    def __getitem__(self, name):
+        if name not in self.meta['entries']:
+            raise KeyError(name)
+        if name not in self._arrays:
+            entry = self.meta['entries'][name]
+            # 空数组无法建立内存映射
+            mmap_mode = 'r' if all(entry['shape']) else None
+            self._arrays[name] = np.load(self._entry_path(name), mmap_mode=mmap_mode)
+        return self._arrays[name]
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def __setitem__(self, name, array):
+        """写入数组条目（先写临时文件再原子替换）"""
+        array = np.asarray(array)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=f".{name}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.save(file, np.ascontiguousarray(array))
+            self._arrays.pop(name, None)
+            os.replace(tmp_path, self._entry_path(name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.meta['entries'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+        self._write_meta()
+
+    def __delitem__(self, name):
+        if name not in self.meta['entries']:
+            raise KeyError(name)
+        self._arrays.pop(name, None)
+        del self.meta['entries'][name]
+        self._write_meta()
+        try:
+            os.unlink(self._entry_path(name))
+        except OSError:
+            pass
+
+    def save_cleaning(self, steps, position):
+        """保存数据精选的清洗历史（按位压缩的保留掩码）及当前步骤"""
+        self[CLEANING_HISTORY] = steps
+        self.meta['cleaning_position'] = int(position)
+        self._write_meta()
+
+    def load_cleaning(self):
+        """
+        Returns:
+        (steps, position): 清洗历史；会话中没有清洗记录时返回 None
+        """
+        if CLEANING_HISTORY not in self:
+            return None
+        return np.array(self[CLEANING_HISTORY]), int(self.meta.get('cleaning_position', 0))
+
+    def _entry_path(self, name):
+        return os.path.join(self.path, f"{name}.npy")
+
+    def _write_meta(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=f".{META_FILE}.", suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(self.meta, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
@@ -0,0 +1,417 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import struct
+import sys
+import time
+
+import numpy as np
+
+from ecg_pipeline import ADC_DTYPE, ECGPipeline
+from realtime_detector import IncrementalRPeakDetector
+
+# 默认监听地址
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 样本格式：text 为与 load_ecg_data 相同的 “序号 ADC值” 文本行（不含表头）；
+# binary 为帧序列，每帧一个小端 uint32 样本数后跟相应个数的小端 int32 ADC值，样本数为 0 表示结束
+TEXT_FORMAT = 'text'
+BINARY_FORMAT = 'binary'
+FRAME_HEADER = struct.Struct('<I')
+SAMPLE_DTYPE = np.dtype('<i4')
+MAX_FRAME_SAMPLES = 1 << 20
+
+# 握手行（一行 JSON）的最大长度及文本格式每次读取的字节数
+MAX_HANDSHAKE_BYTES = 4096
+READ_BYTES = 64 * 1024
+
+# 每路待处理的样本块上限：队列满时停止读取该连接，由TCP流量控制让发送端等待
+QUEUE_CHUNKS = 16
+
+# 每路RR间期对输出文件名后缀（与分析器的输出格式相同）
+RR_SUFFIX = '_RR_intervals.csv'
+RR_HEADER = 'RR(n),RR(n+1)\n'
+
+
+class StreamError(Exception):
+    """数据流握手或格式错误"""
+
+
+def stream_output_path(output_dir, stream):
+    """数据流的RR间期对输出路径（流名中的特殊字符替换为下划线）"""
+    safe_name = re.sub(r'[^\w.-]', '_', stream).strip('.') or 'stream'
+    return os.path.join(output_dir, safe_name + RR_SUFFIX)
+
+
+def encode_chunk(samples, fmt, start=0):
+    """按传输格式编码一块样本，文本格式的序号从 start 开始"""
+    samples = np.asarray(samples)
+    if fmt == BINARY_FORMAT:
+        return FRAME_HEADER.pack(len(samples)) + samples.astype(SAMPLE_DTYPE).tobytes()
+    rows = np.column_stack((np.arange(start, start + len(samples)), samples))
+    return (('%d %d\n' * len(samples)) % tuple(rows.ravel().tolist())).encode('ascii')
+
+
+class RRWriter:
+    def __init__(self, path):
+        """
+        追加写出一路数据流的RR间期对
+
+        同名数据流重新连接时接着写入同一文件；跨块保留上一个RR间期，
+        输出与 save_rr_intervals 相同的 (RR[n], RR[n+1]) 格式。
+        """
+        self.path = path
+        self.previous = None
+        self.pairs = 0
+        new_file = not os.path.isfile(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', encoding='utf-8')
+        if new_file:
+            self.file.write(RR_HEADER)
+            self.file.flush()
+
+    def write(self, rr_intervals):
+        """写出本块新确认的RR间期组成的间期对，并立即刷新"""
+        if len(rr_intervals) == 0:
+            return
+        if self.previous is not None:
+            rr_intervals = np.concatenate(([self.previous], rr_intervals))
+        self.previous = float(rr_intervals[-1])
+        if len(rr_intervals) < 2:
+            return
+        pairs = np.column_stack((rr_intervals[:-1], rr_intervals[1:]))
+        self.file.write(('%.6f,%.6f\n' * len(pairs)) % tuple(pairs.ravel().tolist()))
+        self.file.flush()
+        self.pairs += len(pairs)
+
+    def close(self):
+        self.file.close()
+
+
+async def read_handshake(reader):
+    """
+    读取握手行
+
+    握手为一行 JSON：stream（流名，决定输出文件）、fs（采样频率）、
+    format（text 或 binary，默认 binary）、column（文本格式的数据列，默认 1）
+    """
+    try:
+        line = await reader.readuntil(b'\n')
+    except asyncio.LimitOverrunError:
+        raise StreamError("握手行过长")
+    except asyncio.IncompleteReadError:
+        raise StreamError("连接在握手前关闭")
+    if len(line) > MAX_HANDSHAKE_BYTES:
+        raise StreamError("握手行过长")
+    try:
+        header = json.loads(line)
+        stream = str(header['stream'])
+        fs = float(header['fs'])
+        fmt = header.get('format', BINARY_FORMAT)
+        column = int(header.get('column', 1))
+    except (ValueError, KeyError, TypeError):
+        raise StreamError("握手格式不正确，应为包含 stream 和 fs 的一行 JSON")
+    if fmt not in (TEXT_FORMAT, BINARY_FORMAT):
+        raise StreamError(f"不支持的样本格式: {fmt}")
+    if fs <= 0 or column < 0:
+        raise StreamError("采样频率或数据列设置不正确")
+    return stream, fs, fmt, column
+
+
+async def read_text_chunks(reader, queue, column, bad_lines):
+    """读取文本行，只解析完整的行，不完整的行留到下一次"""
+    remainder = b''
+    line_num = 1
+    while True:
+        data = await reader.read(READ_BYTES)
+        if not data:
+            break
+        data = remainder + data
+        cut = data.rfind(b'\n') + 1
+        remainder = data[cut:]
+        if cut == 0:
+            continue
+        block = data[:cut]
+        values = ECGPipeline._parse_block(block.decode('utf-8', errors='replace'), line_num,
+                                          bad_lines, (column,))
+        line_num += block.count(b'\n')
+        if len(values):
+            await queue.put(values[:, 0])
+    if remainder.strip():
+        values = ECGPipeline._parse_block(remainder.decode('utf-8', errors='replace'), line_num,
+                                          bad_lines, (column,))
+        if len(values):
+            await queue.put(values[:, 0])
+
+
+async def read_binary_chunks(reader, queue):
+    """读取二进制帧，样本数为 0 的帧或连接关闭时结束"""
+    while True:
+        try:
+            (count,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+        except asyncio.IncompleteReadError:
+            break
+        if count == 0:
+            break
+        if count > MAX_FRAME_SAMPLES:
+            raise StreamError(f"帧过大: {count} 个样本")
+        payload = await reader.readexactly(count * SAMPLE_DTYPE.itemsize)
+        await queue.put(np.frombuffer(payload, dtype=SAMPLE_DTYPE).astype(ADC_DTYPE))
+
+
+class StreamServer:
+    def __init__(self, output_dir, lowcut=1, highcut=45, queue_chunks=QUEUE_CHUNKS, log=print):
+        """
+        多路ECG数据流接入服务
+
+        每个TCP连接为一路数据流：先发送握手行，之后持续发送样本。每路各有一个
+        IncrementalRPeakDetector（因果带通滤波和自适应阈值R峰检测），确认的RR间期对
+        立即追加到该路的输出文件。读取和处理之间是有界队列，处理跟不上时停止读取，
+        由TCP流量控制让发送端等待，内存占用与连接时长无关。
+
+        Parameters:
+        output_dir: 各路RR间期对的输出目录
+        lowcut, highcut: 带通滤波参数
+        queue_chunks: 每路待处理样本块的上限
+        """
+        self.output_dir = output_dir
+        self.lowcut = lowcut
+        self.highcut = highcut
+        self.queue_chunks = queue_chunks
+        self.log = log
+        self.active = set()
+
+    async def handle(self, reader, writer):
+        """处理一个连接，结束时向客户端回送一行 JSON 汇总"""
+        peer = writer.get_extra_info('peername')
+        summary = {}
+        try:
+            stream, fs, fmt, column = await read_handshake(reader)
+            # 以输出文件区分数据流：名称不同但清理后相同的两路不能同时写同一个文件
+            path = stream_output_path(self.output_dir, stream)
+            if path in self.active:
+                raise StreamError(f"数据流 {stream} 的输出文件 {os.path.basename(path)} 已在写入中")
+            try:
+                detector = IncrementalRPeakDetector(fs, self.lowcut, self.highcut)
+            except ValueError as e:
+                raise StreamError(f"无法为采样频率 {fs} Hz 设计滤波器: {e}")
+            self.active.add(path)
+            try:
+                summary = await self.run_stream(reader, stream, path, fs, fmt, column, detector)
+            finally:
+                self.active.discard(path)
+            self.log(f"{stream}: {summary['samples']} 个样本，{summary['peaks']} 个R峰，"
+                     f"{summary['pairs']} 对RR间期，处理耗时 {summary['processing_s']:.3f} 秒")
+        except StreamError as e:
+            summary = {'error': str(e)}
+            self.log(f"{peer}: {e}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.log(f"{peer}: 连接中断")
+            writer.close()
+            return
+        except Exception as e:
+            # 其他异常（如输出文件无法写入）也回送错误并关闭连接，不留下挂起的客户端
+            summary = {'error': f"处理出错: {e}"}
+            self.log(f"{peer}: 处理出错: {e}")
+
+        try:
+            writer.write(json.dumps(summary, ensure_ascii=False).encode('utf-8') + b'\n')
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def run_stream(self, reader, stream, path, fs, fmt, column, detector):
+        """读取并处理一路数据流直至结束，RR间期对写入 path"""
+        rr_writer = RRWriter(path)
+        queue = asyncio.Queue(self.queue_chunks)
+        bad_lines = []
+        if fmt == TEXT_FORMAT:
+            producer = read_text_chunks(reader, queue, column, bad_lines)
+        else:
+            producer = read_binary_chunks(reader, queue)
+
+        async def read_all():
+            # 读取结束或出错时放入结束标记；被取消时处理端已退出，不再等待队列空位
+            try:
+                await producer
+            except Exception:
+                await queue.put(None)
+                raise
+            await queue.put(None)
+
+        self.log(f"{stream}: 开始接收（{fs:g} Hz，{fmt}），输出到 {os.path.basename(path)}")
+        reading = asyncio.ensure_future(read_all())
+        samples = peaks = 0
+        processing = 0.0
+        try:
+            finished = False
+            while not finished:
+                # 合并已排队的块一起处理：检测器每次调用有固定开销，负载高时自动增大批量
+                chunks = [await queue.get()]
+                while not queue.empty():
+                    chunks.append(queue.get_nowait())
+                if chunks[-1] is None:
+                    finished = True
+                    chunks.pop()
+                if not chunks:
+                    break
+                chunk = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+                started = time.perf_counter()
+                chunk_peaks, rr_intervals = detector.process(chunk)
+                rr_writer.write(rr_intervals)
+                processing += time.perf_counter() - started
+                samples += len(chunk)
+                peaks += len(chunk_peaks)
+                # 队列非空时 get 不会让出事件循环，每块处理后主动让出，各路轮流处理
+                await asyncio.sleep(0)
+            await reading
+        finally:
+            reading.cancel()
+            rr_writer.close()
+
+        summary = {'stream': stream, 'samples': samples, 'peaks': peaks, 'pairs': rr_writer.pairs,
+                   'processing_s': processing, 'output': path}
+        if bad_lines:
+            summary['bad_lines'] = len(bad_lines)
+        return summary
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """监听并处理连接，直至被取消"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        server = await asyncio.start_server(self.handle, host, port)
+        addresses = ', '.join(f"{sock.getsockname()[0]}:{sock.getsockname()[1]}"
+                              for sock in server.sockets)
+        self.log(f"正在监听 {addresses}，RR间期对输出到 {os.path.abspath(self.output_dir)}")
+        async with server:
+            await server.serve_forever()
+
+
+async def replay_stream(host, port, stream, ecg_data, fs, fmt=BINARY_FORMAT, speed=1.0,
+                        chunk_seconds=0.1):
+    """
+    把一条记录作为一路数据流发送给服务，按实时或加速的节奏分块发送
+
+    每块发送后等待发送缓冲区排空（drain），服务处理不过来时发送端随之变慢。
+
+    Parameters:
+    speed: 回放倍速，1 为实时，0 表示不等待、尽快发送
+
+    Returns:
+    dict: 服务回送的汇总
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    handshake = {'stream': stream, 'fs': fs, 'format': fmt}
+    writer.write(json.dumps(handshake, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    loop = asyncio.get_running_loop()
+    chunk_size = max(int(chunk_seconds * fs), 1)
+    started = loop.time()
+    for start in range(0, len(ecg_data), chunk_size):
+        if speed > 0:
+            delay = started + start / fs / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        writer.write(encode_chunk(ecg_data[start:start + chunk_size], fmt, start))
+        await writer.drain()
+    if fmt == BINARY_FORMAT:
+        writer.write(FRAME_HEADER.pack(0))
+    writer.write_eof()
+    await writer.drain()
+
+    line = await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+    if not line:
+        raise ConnectionError(f"{stream}: 服务未返回汇总")
+    summary = json.loads(line)
+    if 'error' in summary:
+        raise StreamError(f"{stream}: {summary['error']}")
+    return summary
+
+
+async def replay(inputs, host, port, fs, n_streams=None, fmt=BINARY_FORMAT, speed=1.0,
+                 chunk_seconds=0.1, columns=1):
+    """
+    同时回放多路数据流（路数多于记录数时循环使用记录）
+
+    Returns:
+    (summaries, elapsed): 各路汇总及总耗时（秒）
+    """
+    pipeline = ECGPipeline()
+    recordings = [pipeline.load_ecg_data(path, columns=columns) for path in inputs]
+    n_streams = n_streams or len(inputs)
+    names = [os.path.splitext(os.path.basename(inputs[i % len(inputs)]))[0] for i in range(n_streams)]
+    if n_streams > len(inputs) or len(set(names)) < len(names):
+        names = [f"{name}_{i}" for i, name in enumerate(names)]
+
+    started = time.perf_counter()
+    summaries = await asyncio.gather(*(
+        replay_stream(host, port, names[i], recordings[i % len(recordings)], fs, fmt, speed,
+                      chunk_seconds)
+        for i in range(n_streams)))
+    return summaries, time.perf_counter() - started
+
+
+def main(argv=None):
+    """命令行入口：serve 启动接入服务，replay 用已有记录模拟多路设备"""
+    parser = argparse.ArgumentParser(description="多路实时ECG数据流接入服务及回放客户端")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="启动接入服务")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST, help=f"监听地址，默认 {DEFAULT_HOST}")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"端口，默认 {DEFAULT_PORT}")
+    serve_parser.add_argument('--output-dir', default='rr_streams', help="RR间期对输出目录，默认 rr_streams")
+    serve_parser.add_argument('--lowcut', type=float, default=1, help="带通下限 (Hz)，默认 1")
+    serve_parser.add_argument('--highcut', type=float, default=45, help="带通上限 (Hz)，默认 45")
+    serve_parser.add_argument('--queue', type=int, default=QUEUE_CHUNKS,
+                              help=f"每路待处理样本块的上限，默认 {QUEUE_CHUNKS}")
+
+    replay_parser = subparsers.add_parser('replay', help="把已有记录作为多路数据流发送")
+    replay_parser.add_argument('inputs', nargs='+', help="ECG文本文件")
+    replay_parser.add_argument('--host', default=DEFAULT_HOST, help=f"服务地址，默认 {DEFAULT_HOST}")
+    replay_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"端口，默认 {DEFAULT_PORT}")
+    replay_parser.add_argument('--fs', type=float, default=500, help="采样频率 (Hz)，默认 500")
+    replay_parser.add_argument('--column', type=int, default=1, help="数据列（从0开始），默认 1")
+    replay_parser.add_argument('--streams', type=int, default=None, help="数据流路数，默认每个文件一路")
+    replay_parser.add_argument('--format', choices=(BINARY_FORMAT, TEXT_FORMAT), default=BINARY_FORMAT,
+                               help="传输格式，默认 binary")
+    replay_parser.add_argument('--speed', type=float, default=1.0, help="回放倍速，0 表示尽快发送")
+    replay_parser.add_argument('--chunk', type=float, default=0.1, help="每块时长（秒），默认 0.1")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        server = StreamServer(args.output_dir, args.lowcut, args.highcut, max(args.queue, 1))
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            print("服务已停止")
+        return 0
+
+    try:
+        summaries, elapsed = asyncio.run(replay(args.inputs, args.host, args.port, args.fs,
+                                                args.streams, args.format, args.speed, args.chunk,
+                                                args.column))
+    except (OSError, StreamError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+
+    samples = sum(summary['samples'] for summary in summaries)
+    processing = sum(summary['processing_s'] for summary in summaries)
+    for summary in summaries:
+        print(f"{summary['stream']}: {summary['samples']} 个样本，{summary['peaks']} 个R峰，"
+              f"{summary['pairs']} 对RR间期")
+    print(f"{len(summaries)} 路共 {samples} 个样本，耗时 {elapsed:.2f} 秒（{samples / elapsed:,.0f} 样本/秒）")
+    if processing > 0:
+        # 服务在单个事件循环中处理所有数据流，处理耗时之和即占用的单核时间
+        per_core = samples / processing
+        print(f"服务处理耗时 {processing:.2f} 秒，单核约 {per_core:,.0f} 样本/秒，"
+              f"相当于 {per_core / args.fs:,.0f} 路 {args.fs:g} Hz 实时数据流")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
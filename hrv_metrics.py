@@ -0,0 +1,324 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from csv_io import read_xy_csv
+from ecg_session import META_FILE, R_PEAKS, RR_PAIRS, SESSION_SUFFIX, ECGSession, pair_labels
+
+# 输出的指标：RR间期对数、平均RR (ms)、SDNN、RMSSD (ms)、pNN50 (%)、
+# Poincaré 图 SD1、SD2 (ms)、LF、HF 功率 (ms²) 及 LF/HF
+HRV_FIELDS = ('n_pairs', 'mean_rr', 'sdnn', 'rmssd', 'pnn50', 'sd1', 'sd2', 'lf', 'hf', 'lf_hf')
+
+# 相邻RR间期之差的阈值（秒）
+NN50_THRESHOLD = 0.05
+
+# 频域指标的频带 (Hz) 及 Lomb-Scargle 频谱的频率步长 (Hz)
+LF_BAND = (0.04, 0.15)
+HF_BAND = (0.15, 0.4)
+SPECTRUM_STEP = 0.0025
+
+# 滑动窗口的默认长度和步长（秒），以及窗口内计算指标所需的最少RR间期对数
+WINDOW_SECONDS = 300
+STEP_SECONDS = 30
+MIN_WINDOW_PAIRS = 20
+
+# 计算频谱时每批累积和数组的元素数上限（按频率分批，限制内存占用）
+SPECTRUM_CHUNK_ELEMENTS = 4 * 1024 * 1024
+
+
+def pair_times(x):
+    """
+    连续RR间期对的时间戳：第 i 对 (RR[i], RR[i+1]) 中间那个R峰相对第一个R峰的时刻（秒）
+
+    只适用于未经删减的RR间期对序列；清洗后的子集应使用R峰位置换算的时间戳
+    """
+    return np.cumsum(np.asarray(x, dtype=float))
+
+
+def _spectrum_freqs():
+    return np.arange(LF_BAND[0], HF_BAND[1] + SPECTRUM_STEP / 2, SPECTRUM_STEP)
+
+
+def _cumulative(values):
+    """沿第一维的累积和，前面补一行 0，窗口 [a, b) 之和为 out[b] - out[a]"""
+    out = np.zeros((len(values) + 1,) + values.shape[1:], dtype=values.dtype)
+    np.cumsum(values, axis=0, out=out[1:])
+    return out
+
+
+def _window_spectrum(y, times, starts, stops):
+    """
+    各窗口的 Lomb-Scargle 功率谱密度 (s²/Hz)
+
+    Lomb-Scargle 周期图只依赖 Σy·cos(ωt)、Σy·sin(ωt)、Σcos(ωt)、Σsin(ωt)、Σcos(2ωt)、
+    Σsin(2ωt) 六个和；对每个频率沿心搏方向求累积和后，任意窗口的这些和都只需一次相减，
+    窗口内去均值也由 Σcos、Σsin 修正，无需为每个窗口重新计算。
+
+    Returns:
+    np.ndarray: 形状为 (窗口数, 频率数)
+    """
+    freqs = _spectrum_freqs()
+    counts = (stops - starts).astype(float)
+    last = np.minimum(np.maximum(stops - 1, starts), len(times) - 1)
+    duration = times[last] - times[np.minimum(starts, len(times) - 1)]
+    cumulative_y = _cumulative(y)
+    means = (cumulative_y[stops] - cumulative_y[starts]) / np.maximum(counts, 1)
+
+    power = np.empty((len(starts), len(freqs)))
+    chunk = max(SPECTRUM_CHUNK_ELEMENTS // (6 * (len(y) + 1)), 1)
+    for first in range(0, len(freqs), chunk):
+        omega = 2 * np.pi * freqs[first:first + chunk]
+        # 以复指数 e^{iωt} 同时得到余弦和正弦项
+        phasor = np.exp(1j * times[:, None] * omega[None, :])
+        sums = [_cumulative(term) for term in (y[:, None] * phasor, phasor, phasor * phasor)]
+        weighted, plain, doubled = (total[stops] - total[starts] for total in sums)
+
+        weighted -= means[:, None] * plain
+        yc, ys = weighted.real, weighted.imag
+        c2, s2 = doubled.real, doubled.imag
+        two_tau = np.arctan2(s2, c2)
+        cos_tau, sin_tau = np.cos(two_tau / 2), np.sin(two_tau / 2)
+        a = yc * cos_tau + ys * sin_tau
+        b = ys * cos_tau - yc * sin_tau
+        r = np.hypot(c2, s2)
+        n = counts[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            periodogram = (np.where(n + r > 0, a * a / (n + r), 0.0)
+                           + np.where(n - r > 1e-9 * n, b * b / (n - r), 0.0))
+        power[:, first:first + chunk] = periodogram
+
+    # 周期图换算为单边功率谱密度，使各频率上的积分等于方差
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return power * (2 * duration / counts)[:, None]
+
+
+def _window_metrics(x, y, times, starts, stops):
+    """
+    对若干个窗口 [start, stop) 同时计算全部指标
+
+    时域和 Poincaré 指标都由累积和相减得到，每个窗口的计算量与窗口长度无关
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    times = np.asarray(times, dtype=float)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+
+    # 先减去全局均值，避免长记录的平方和累积时损失精度
+    offset = x.mean() if len(x) else 0.0
+    centered = x - offset
+    diff = y - x
+    total = x + y - 2 * offset
+    sums = _cumulative(np.column_stack((centered, centered * centered, diff, diff * diff,
+                                        np.abs(diff) > NN50_THRESHOLD, total, total * total)))
+    sx, sxx, sd, sdd, snn, st, stt = (sums[stops] - sums[starts]).T
+    n = (stops - starts).astype(float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = sx / n
+        var_x = np.maximum(sxx / n - mean_x ** 2, 0)
+        var_d = np.maximum(sdd / n - (sd / n) ** 2, 0)
+        var_t = np.maximum(stt / n - (st / n) ** 2, 0)
+
+        spectrum = _window_spectrum(centered, times, starts, stops)
+        freqs = _spectrum_freqs()
+        lf = spectrum[:, (freqs >= LF_BAND[0]) & (freqs < LF_BAND[1])].sum(axis=1) * SPECTRUM_STEP
+        hf = spectrum[:, (freqs >= HF_BAND[0]) & (freqs <= HF_BAND[1])].sum(axis=1) * SPECTRUM_STEP
+
+        metrics = {
+            'n_pairs': n.astype(np.int64),
+            'mean_rr': (mean_x + offset) * 1e3,
+            'sdnn': np.sqrt(var_x) * 1e3,
+            'rmssd': np.sqrt(sdd / n) * 1e3,
+            'pnn50': snn / n * 100,
+            'sd1': np.sqrt(var_d / 2) * 1e3,
+            'sd2': np.sqrt(var_t / 2) * 1e3,
+            'lf': lf * 1e6,
+            'hf': hf * 1e6,
+            'lf_hf': lf / hf,
+        }
+
+    too_short = n < MIN_WINDOW_PAIRS
+    for name in HRV_FIELDS[1:]:
+        metrics[name] = np.where(too_short, np.nan, metrics[name])
+    return metrics
+
+
+def hrv_metrics(x, y, times=None):
+    """
+    由RR间期对 (RR(n), RR(n+1)) 计算HRV指标
+
+    Parameters:
+    x, y: RR(n) 和 RR(n+1)（秒），可以是清洗后的子集
+    times: 每对中间R峰的时刻（秒），用于 Lomb-Scargle 频谱；为 None 时按连续序列由 x 累加得到
+
+    Returns:
+    dict: HRV_FIELDS 中的各项指标（RR间期对不足 MIN_WINDOW_PAIRS 时为 NaN）
+    """
+    times = pair_times(x) if times is None else times
+    metrics = _window_metrics(x, y, times, [0], [len(x)])
+    return {name: values[0].item() for name, values in metrics.items()}
+
+
+def sliding_hrv(x, y, times=None, window_seconds=WINDOW_SECONDS, step_seconds=STEP_SECONDS):
+    """
+    滑动窗口HRV指标
+
+    所有窗口由一次累积和得到，总计算量与窗口数和窗口长度的乘积无关
+
+    Returns:
+    dict: 'start' 为各窗口起始时刻（秒），其余为 HRV_FIELDS 中各指标的数组
+    """
+    times = np.asarray(pair_times(x) if times is None else times, dtype=float)
+    if len(times) == 0:
+        return {'start': np.empty(0), **{name: np.empty(0) for name in HRV_FIELDS}}
+    window_starts = np.arange(times[0], max(times[-1] - window_seconds, times[0]) + step_seconds / 2,
+                              step_seconds)
+    starts = np.searchsorted(times, window_starts, side='left')
+    stops = np.searchsorted(times, window_starts + window_seconds, side='left')
+    return {'start': window_starts, **_window_metrics(x, y, times, starts, stops)}
+
+
+def hrv_from_peaks(r_peaks, fs):
+    """由R峰位置（样本）计算HRV指标，时间戳取每对中间R峰的实际时刻"""
+    rr_intervals = np.diff(np.asarray(r_peaks, dtype=float)) / fs
+    return hrv_metrics(rr_intervals[:-1], rr_intervals[1:], pair_labels(r_peaks) / fs)
+
+
+def format_metrics(metrics):
+    """一行文字摘要，例如 “SDNN 52.1 ms，RMSSD 31.0 ms，…”"""
+    if np.isnan(metrics['sdnn']):
+        return f"RR间期对不足 {MIN_WINDOW_PAIRS} 个，无法计算HRV指标"
+    return (f"SDNN {metrics['sdnn']:.1f} ms，RMSSD {metrics['rmssd']:.1f} ms，"
+            f"pNN50 {metrics['pnn50']:.1f}%，SD1/SD2 {metrics['sd1']:.1f}/{metrics['sd2']:.1f} ms，"
+            f"LF/HF {metrics['lf']:.0f}/{metrics['hf']:.0f} ms² ({metrics['lf_hf']:.2f})")
+
+
+def _is_session(path):
+    return os.path.basename(path) == META_FILE or path.rstrip(os.sep).endswith(SESSION_SUFFIX)
+
+
+def windows_path(path):
+    """滑动窗口结果的输出路径：会话写在会话目录内，CSV写在旁边"""
+    if _is_session(path):
+        if os.path.basename(path) == META_FILE:
+            path = os.path.dirname(path)
+        return os.path.join(path, 'hrv_windows.csv')
+    return os.path.splitext(path)[0] + '_hrv_windows.csv'
+
+
+def load_recording(path, fs=None):
+    """
+    读取一条记录的RR间期对及时间戳
+
+    Parameters:
+    path: 分析会话（目录或其中的 meta.json，按会话中保存的清洗进度取保留的数据点）或RR间期对CSV
+    fs: CSV标签为R峰样本位置时的采样频率 (Hz)；为 None 时按连续序列由 RR(n) 累加时间戳
+
+    Returns:
+    (x, y, times)
+    """
+    if _is_session(path):
+        session = ECGSession(path)
+        pairs = np.asarray(session[RR_PAIRS])
+        x, y = pairs[:, 0], pairs[:, 1]
+        if R_PEAKS in session:
+            times = pair_labels(session[R_PEAKS]) / session.params['fs']
+        else:
+            times = pair_times(x)
+        cleaning = session.load_cleaning()
+        if cleaning is not None:
+            steps, position = cleaning
+            keep = np.unpackbits(steps[position], count=len(x)).view(bool)
+            x, y, times = x[keep], y[keep], times[keep]
+        return x, y, times
+
+    x, y, labels = read_xy_csv(path)
+    if fs is not None and labels is not None:
+        return x, y, np.asarray(labels, dtype=float) / fs
+    return x, y, pair_times(x)
+
+
+def collect_recordings(patterns):
+    """
+    收集输入：RR间期对CSV、会话目录，或包含它们的目录
+
+    会话的 meta.json 归并到会话目录；目录中的滑动窗口结果不作为输入
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern) and not _is_session(pattern):
+            paths += [path for path in glob.glob(os.path.join(pattern, '*.csv'))
+                      if not path.endswith('_hrv_windows.csv')]
+            paths += glob.glob(os.path.join(pattern, f'*{SESSION_SUFFIX}'))
+        else:
+            paths += glob.glob(pattern, recursive=True)
+    paths = [os.path.dirname(path) if os.path.basename(path) == META_FILE else path.rstrip(os.sep)
+             for path in paths]
+    return sorted(set(paths))
+
+
+def process_recording(path, fs=None, window_seconds=None, step_seconds=STEP_SECONDS):
+    """
+    在工作进程中计算一条记录的HRV指标；指定 window_seconds 时同时写出滑动窗口结果
+
+    Returns:
+    dict: 清单行
+    """
+    try:
+        x, y, times = load_recording(path, fs)
+        row = dict(file=path, status='ok', **hrv_metrics(x, y, times))
+        if window_seconds:
+            windows = sliding_hrv(x, y, times, window_seconds, step_seconds)
+            output = windows_path(path)
+            np.savetxt(output, np.column_stack([windows[name] for name in ('start',) + HRV_FIELDS]),
+                       delimiter=',', header=','.join(('start',) + HRV_FIELDS), comments='',
+                       fmt='%.6g')
+            row['windows'] = output
+        return row
+    except Exception as e:
+        return {'file': path, 'status': 'error', 'error': str(e)}
+
+
+def main(argv=None):
+    """命令行入口：批量计算HRV指标并写出汇总表"""
+    parser = argparse.ArgumentParser(description="由RR间期对计算HRV指标（时域、Poincaré图、Lomb-Scargle频域）")
+    parser.add_argument('inputs', nargs='+', help="RR间期对CSV、分析会话目录，或包含它们的目录/通配符")
+    parser.add_argument('--fs', type=float, default=None,
+                        help="CSV标签为R峰样本位置时的采样频率 (Hz)，用于还原清洗后数据的时间戳")
+    parser.add_argument('--window', type=float, default=None, metavar='SECONDS',
+                        help=f"同时计算滑动窗口指标（例如 {WINDOW_SECONDS}），每条记录写出 <文件名>_hrv_windows.csv")
+    parser.add_argument('--step', type=float, default=STEP_SECONDS, metavar='SECONDS',
+                        help=f"滑动窗口步长（秒），默认 {STEP_SECONDS}")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认等于CPU核数")
+    parser.add_argument('--output', default='hrv_summary.csv', help="汇总表路径，默认 hrv_summary.csv")
+    args = parser.parse_args(argv)
+
+    paths = collect_recordings(args.inputs)
+    if not paths:
+        print("未找到匹配的输入", file=sys.stderr)
+        return 1
+
+    workers = min(args.workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(process_recording, paths, [args.fs] * len(paths),
+                                 [args.window] * len(paths), [args.step] * len(paths)))
+
+    with open(args.output, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['file', 'status', 'error', *HRV_FIELDS, 'windows'],
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+    failed = sum(row['status'] != 'ok' for row in rows)
+    print(f"处理完成: 成功 {len(rows) - failed} 条记录，失败 {failed} 条；汇总表: {args.output}")
+    return 0 if failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
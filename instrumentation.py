@@ -0,0 +1,171 @@
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# 埋点开关：为空或 0 时关闭；1 或 stderr 时写到标准错误；其他值为追加写入的 JSON lines 文件路径
+INSTRUMENT_ENV = 'ECG_INSTRUMENT'
+
+# 设为 0 时不记录峰值分配（tracemalloc 会明显拖慢大量小对象分配的代码，例如绘图）
+INSTRUMENT_MEMORY_ENV = 'ECG_INSTRUMENT_MEMORY'
+
+_target = None
+_track_memory = False
+_stream = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure(target=None, memory=True):
+    """
+    开启或关闭埋点
+
+    Parameters:
+    target: None 为关闭；'stderr' 写到标准错误；其他为追加写入的文件路径
+    memory: 是否用 tracemalloc 记录各阶段的峰值分配
+    """
+    global _target, _track_memory, _stream
+    with _lock:
+        if _stream is not None and _stream is not sys.stderr:
+            _stream.close()
+        _stream = None
+        _target = target
+        _track_memory = target is not None and memory
+
+
+def configure_from_env():
+    """按环境变量 ECG_INSTRUMENT / ECG_INSTRUMENT_MEMORY 设置埋点（导入时自动调用）"""
+    value = os.environ.get(INSTRUMENT_ENV, '').strip()
+    if value in ('', '0'):
+        configure(None)
+    else:
+        configure('stderr' if value in ('1', 'stderr') else value,
+                  memory=os.environ.get(INSTRUMENT_MEMORY_ENV, '1').strip() != '0')
+
+
+def enabled():
+    return _target is not None
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _json_default(value):
+    """NumPy 标量等转换为 Python 数值"""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def _emit(record):
+    global _stream
+    line = json.dumps(record, ensure_ascii=False, default=_json_default) + '\n'
+    with _lock:
+        if _target is None:
+            return
+        if _stream is None:
+            _stream = sys.stderr if _target == 'stderr' else open(_target, 'a', encoding='utf-8')
+        # 每条记录一次写入并立即刷新，多个工作进程追加同一文件时行不会交错
+        _stream.write(line)
+        _stream.flush()
+
+
+class _NullStage:
+    """埋点关闭时使用的空上下文"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **items):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+        self.parent = None
+        self.track_memory = _track_memory
+        self.start_memory = self.max_peak = 0
+
+    def set(self, **items):
+        """补充计数等字段（例如处理后才知道的R峰数）"""
+        self.items.update(items)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # tracemalloc 只有一个全局峰值：重置前先把到目前为止的峰值记到外层阶段
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in stack:
+                frame.max_peak = max(frame.max_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = self.max_peak = current
+        stack.append(self)
+        self.cpu_started = time.process_time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.started
+        cpu = time.process_time() - self.cpu_started
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        record = {'ts': round(time.time(), 6), 'stage': self.name, 'parent': self.parent,
+                  'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6)}
+        if self.track_memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            for frame in stack:
+                frame.max_peak = max(frame.max_peak, peak)
+            record['peak_bytes'] = max(self.max_peak, peak) - self.start_memory
+        record['status'] = 'ok' if exc_type is None else exc_type.__name__
+        record['pid'] = os.getpid()
+        record['thread'] = threading.current_thread().name
+        record.update(self.items)
+        _emit(record)
+        return False
+
+
+def instrument(name, **items):
+    """
+    记录一个阶段的墙钟时间、CPU时间、峰值分配和计数，退出时输出一行 JSON
+
+    埋点关闭时返回共享的空上下文，开销只有一次函数调用。CPU 时间为整个进程的
+    CPU 时间（包含同时运行的其他线程）；嵌套的阶段记录外层阶段名（parent）。
+
+    用法:
+        with instrument('filter', samples=len(signal)) as stage:
+            ...
+            stage.set(peaks=len(peaks))
+    """
+    if _target is None:
+        return _NULL_STAGE
+    return _Stage(name, items)
+
+
+def annotate(**items):
+    """为当前线程最内层的阶段补充字段（埋点关闭时不做任何事）"""
+    if _target is None:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].set(**items)
+
+
+configure_from_env()
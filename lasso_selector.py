@@ -1,11 +1,52 @@
-import matplotlib.pyplot as plt
+import matplotlib
 import numpy as np
-from matplotlib.path import Path
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
 from matplotlib.widgets import LassoSelector
 
+from artifact_detection import detect_artifacts
+from cleaning_recipe import ADD, REMOVE, REPLACE, replay, scope_ranges, select_operation
+from instrumentation import instrument
+from spatial_index import PointGridIndex
+
+# 点数超过该值时改用密度图（二维直方图）显示
+DENSITY_THRESHOLD = 50000
+
+# 密度图每个像元对应的屏幕像素数
+DENSITY_BIN_PIXELS = 3
+
+# 套索时按住的修饰键：Shift 把圈中的点加入选择，Ctrl 从选择中移除，否则替换选择
+LASSO_ADD_KEYS = ('shift',)
+LASSO_REMOVE_KEYS = ('control', 'ctrl')
+
+
+def bin_points(x, y, extent, shape):
+    """
+    把点统计到规则网格上
+
+    Parameters:
+    extent: (xmin, xmax, ymin, ymax)
+    shape: (行数, 列数)
+
+    Returns:
+    np.ma.MaskedArray: 各网格的点数，空网格被屏蔽（显示为透明）
+    """
+    xmin, xmax, ymin, ymax = extent
+    ny, nx = shape
+    ix = np.floor((x - xmin) * (nx / max(xmax - xmin, 1e-12))).astype(np.int64)
+    iy = np.floor((y - ymin) * (ny / max(ymax - ymin, 1e-12))).astype(np.int64)
+    valid = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    counts = np.bincount(iy[valid] * nx + ix[valid], minlength=nx * ny).reshape(ny, nx)
+    return np.ma.masked_equal(counts, 0)
+
+
+def _density_cmap(name):
+    """空网格透明的颜色映射"""
+    return matplotlib.colormaps[name].with_extremes(bad=(0, 0, 0, 0))
+
 
 class LassoDataCleaner:
-    def __init__(self, x_data, y_data, labels=None):
+    def __init__(self, x_data, y_data, labels=None, density_threshold=DENSITY_THRESHOLD, segments=None):
         """
         套索选择数据清洗工具
         
@@ -13,23 +54,79 @@ class LassoDataCleaner:
         x_data: x轴数据
         y_data: y轴数据
         labels: 数据标签（可选）
+        density_threshold: 当前点数超过该值时以密度图代替散点显示
+        segments: 多个文件拼接时各文件的起止位置，自动预选按文件分别检测
         """
         self.x_original = np.array(x_data)
         self.y_original = np.array(y_data)
-        self.labels = labels if labels is not None else range(len(x_data))
+        self.labels = np.asarray(labels) if labels is not None else np.arange(len(self.x_original))
+        
+        # 清洗历史：每一步保存一个按位压缩的保留掩码（相对原始数据），当前数据按需生成
+        self.n_points = len(self.x_original)
+        self._history = [np.packbits(np.ones(self.n_points, dtype=bool))]
+        self._position = 0
+        self._current = None
+        
+        # 显示和清洗的范围（原始数据上的掩码，None 为全部），用于只清洗部分文件
+        self.segments = segments
+        self.scope = None
         
-        self.x_current = self.x_original.copy()
-        self.y_current = self.y_original.copy()
-        self.current_labels = list(self.labels)
+        # 本次录制的操作序列（清洗配方），可保存后在其他文件上无界面重放
+        self.operations = []
+        # 在部分范围内录制的操作依赖该范围，不能作为配方重放
+        self.recording_complete = True
         
-        self.selected_indices = []
+        self.selected_mask = np.zeros(self.n_points, dtype=bool)
         self.selector = None
+        self._index = None
+        self.density_threshold = density_threshold
+        self.density_mode = False
+        
+        # 创建图形（不经过 pyplot，由调用方绑定画布），右图与左图共享坐标范围
+        self.fig = Figure(figsize=(12, 6))
+        self.ax1, self.ax2 = self.fig.subplots(1, 2, sharex=True, sharey=True)
+        
+        # 长期存在的散点图：底层为当前数据，选中点和右图为动画层，通过blit更新
+        self.base_artist = self.ax1.scatter(np.empty(0), np.empty(0), c='green', alpha=0.8, s=25)
+        self.selected_artist = self.ax1.scatter(np.empty(0), np.empty(0), c='red', alpha=0.8, s=25,
+                                                edgecolors='darkred', animated=True, visible=False)
+        self.result_artist = self.ax2.scatter(np.empty(0), np.empty(0), c='blue', alpha=0.8, s=25,
+                                              animated=True, visible=False)
+        
+        # 密度图模式下对应的三层图像
+        image_kwargs = dict(origin='lower', aspect='auto', interpolation='nearest',
+                            norm=LogNorm(), visible=False)
+        empty = np.ma.masked_all((1, 1))
+        self.base_image = self.ax1.imshow(empty, cmap=_density_cmap('Greens'), **image_kwargs)
+        self.selected_image = self.ax1.imshow(empty, cmap=_density_cmap('Reds'), animated=True,
+                                              **image_kwargs)
+        self.result_image = self.ax2.imshow(empty, cmap=_density_cmap('Blues'), animated=True,
+                                            **image_kwargs)
+        for image in (self.base_image, self.selected_image, self.result_image):
+            image.sticky_edges.x[:] = []
+            image.sticky_edges.y[:] = []
         
-        # 创建图形
-        self.fig, (self.ax1, self.ax2) = plt.subplots(1, 2, figsize=(12, 6))
+        self.ax1.grid(True, alpha=0.3)
+        self.ax2.grid(True, alpha=0.3)
+        self._points = np.empty((0, 2))
+        self._base_selecting = False
+        self._background = None
+        self._updating = False
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        
+        # 点击数据点时的回调，参数为该点在原始数据中的索引
+        self.point_callback = None
+        self._lasso_key = None
+        self.fig.canvas.mpl_connect('button_press_event', self._on_click)
+        
+        # 缩放或平移后按可见区域重新分箱
+        self.ax1.callbacks.connect('xlim_changed', self._on_view_changed)
+        self.ax1.callbacks.connect('ylim_changed', self._on_view_changed)
         
-        # 初始化绘图
         self.update_plots()
+        self.fig.tight_layout()
+        
+        # 初始化选择器（只创建一次）
         self.setup_selector()
         
     def setup_selector(self):
@@ -42,95 +139,410 @@ class LassoDataCleaner:
         
         self.selector = LassoSelector(self.ax1, self.on_lasso_select)
     
+    def _on_draw(self, event):
+        """整图重绘后缓存不含动画层的背景，并补画动画层"""
+        if not self.fig.canvas.supports_blit:
+            return
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+    
+    def _draw_animated(self):
+        self.ax1.draw_artist(self.selected_artist)
+        self.ax1.draw_artist(self.selected_image)
+        self.ax2.draw_artist(self.result_artist)
+        self.ax2.draw_artist(self.result_image)
+    
+    def _view_extent(self):
+        """左图当前可见区域 (xmin, xmax, ymin, ymax)"""
+        xmin, xmax = self.ax1.get_xlim()
+        ymin, ymax = self.ax1.get_ylim()
+        return xmin, xmax, ymin, ymax
+    
+    def _bin_shape(self, ax):
+        """按坐标轴像素大小确定分箱数"""
+        bbox = ax.bbox
+        return (max(int(bbox.height / DENSITY_BIN_PIXELS), 1),
+                max(int(bbox.width / DENSITY_BIN_PIXELS), 1))
+    
+    def _set_density(self, image, points, ax):
+        """把点集分箱后写入密度图像"""
+        extent = self._view_extent()
+        counts = bin_points(points[:, 0], points[:, 1], extent, self._bin_shape(ax))
+        image.set_data(counts)
+        image.set_extent(extent)
+        if counts.count():
+            image.set_norm(LogNorm(vmin=1, vmax=max(int(counts.max()), 2)))
+    
+    def _on_view_changed(self, ax):
+        """缩放或平移后重新计算密度图"""
+        if not self.density_mode or self._updating:
+            return
+        self._set_density(self.base_image, self._points, self.ax1)
+        self._update_overlays()
+    
+    def _on_click(self, event):
+        """记录套索开始时按住的修饰键；双击左图或单击右图中的点时调用 point_callback"""
+        if event.inaxes is self.ax1:
+            self._lasso_key = event.key
+        if self.point_callback is None or event.button != 1 or self.fig.canvas.widgetlock.locked():
+            return
+        if event.inaxes is self.ax1 and event.dblclick:
+            candidates = None
+        elif event.inaxes is self.ax2:
+            candidates = self.selected_mask
+        else:
+            return
+        index = self.nearest_point(event.inaxes, event.x, event.y, candidates)
+        if index is not None:
+            self.point_callback(index)
+    
+    def nearest_point(self, ax, x, y, candidates=None, radius=10):
+        """
+        查找屏幕坐标 (x, y) 附近最近的当前数据点
+
+        Parameters:
+        candidates: 候选点的布尔掩码（相对当前数据），为 None 时在全部当前点中查找
+        radius: 最大距离（像素）
+
+        Returns:
+        int | None: 该点在原始数据中的索引
+        """
+        positions = np.arange(len(self._points)) if candidates is None else np.flatnonzero(candidates)
+        if len(positions) == 0:
+            return None
+        display = ax.transData.transform(self._points[positions])
+        distances = np.hypot(display[:, 0] - x, display[:, 1] - y)
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > radius:
+            return None
+        return int(self.current_indices[positions[nearest]])
+    
+    def _blit(self):
+        """恢复缓存背景并只重绘动画层"""
+        canvas = self.fig.canvas
+        if self._background is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self._background)
+        self._draw_animated()
+        canvas.blit(self.fig.bbox)
+    
+    @property
+    def selected_indices(self):
+        """当前选中点的索引"""
+        return np.flatnonzero(self.selected_mask)
+    
+    @selected_indices.setter
+    def selected_indices(self, indices):
+        mask = np.zeros(self.get_current_count(), dtype=bool)
+        mask[np.asarray(indices, dtype=np.int64)] = True
+        self.selected_mask = mask
+    
+    @property
+    def keep_mask(self):
+        """当前步骤的保留掩码（相对原始数据）"""
+        return np.unpackbits(self._history[self._position], count=self.n_points).view(bool)
+    
+    @property
+    def current_indices(self):
+        """当前数据在原始数据中的索引"""
+        return self._materialize()[0]
+    
+    @property
+    def x_current(self):
+        return self._materialize()[1]
+    
+    @property
+    def y_current(self):
+        return self._materialize()[2]
+    
+    @property
+    def current_labels(self):
+        return self._materialize()[3]
+    
+    def _materialize(self):
+        """按当前保留掩码生成数据（结果缓存到历史位置变化为止）"""
+        if self._current is None:
+            keep = self.keep_mask
+            if self.scope is not None:
+                keep &= self.scope
+            if keep.all():
+                indices = np.arange(self.n_points)
+                self._current = (indices, self.x_original, self.y_original, self.labels)
+            else:
+                indices = np.flatnonzero(keep)
+                self._current = (indices, self.x_original[indices], self.y_original[indices],
+                                 self.labels[indices])
+        return self._current
+    
+    def set_scope(self, mask):
+        """
+        只显示和清洗 mask 中的点（None 为全部），范围外的点保持不变
+
+        清洗历史仍针对全部数据，切换范围不改变历史，只清空选择
+        """
+        self.scope = None if mask is None else np.asarray(mask, dtype=bool)
+        if self.scope is not None:
+            self.recording_complete = False
+        self._goto(self._position)
+    
+    def _goto(self, position):
+        """切换到历史中的某一步，清空选择并刷新图形"""
+        self._position = position
+        self._current = None
+        self._index = None
+        self.selected_mask = np.zeros(self.get_current_count(), dtype=bool)
+        self.update_plots()
+    
+    def _push(self, keep):
+        """追加一步历史（丢弃当前位置之后的重做记录）"""
+        del self._history[self._position + 1:]
+        self._history.append(np.packbits(keep))
+        self._goto(len(self._history) - 1)
+    
+    @property
+    def index(self):
+        """当前数据的空间索引（数据变化后按需重建）"""
+        if self._index is None:
+            self._index = PointGridIndex(self.x_current, self.y_current)
+        return self._index
+    
     def on_lasso_select(self, verts):
         """套索选择回调函数"""
         if len(verts) < 3:
             return
-            
-        path = Path(verts)
-        points = np.column_stack((self.x_current, self.y_current))
-        self.selected_indices = [i for i, point in enumerate(points) if path.contains_point(point)]
         
+        with instrument('lasso_select', points=self.get_current_count(), verts=len(verts)) as record:
+            inside = self.index.query_polygon(verts)
+            if self._lasso_key in LASSO_ADD_KEYS:
+                mode = ADD
+                self.selected_mask = self.selected_mask | inside
+            elif self._lasso_key in LASSO_REMOVE_KEYS:
+                mode = REMOVE
+                self.selected_mask = self.selected_mask & ~inside
+            else:
+                mode = REPLACE
+                self.selected_mask = inside
+            self.operations.append(select_operation(verts, mode))
+            record.set(mode=mode, selected=self.get_selected_count())
+            
+            self.highlight_selected()
+    
+    def auto_select(self):
+        """
+        自动预选：标记疑似伪迹，选中其余的点
+
+        “应用选择”保留选中的点，因此预选的是正常点，应用后即去除伪迹；操作者可按住
+        Shift/Ctrl 套索增减选择。伪迹检测在完整的原始序列上进行，结果映射到当前数据。
+
+        Returns:
+        np.ndarray: 当前各数据点的伪迹类型（0 为正常）
+        """
+        codes = detect_artifacts(self.x_original, self.y_original,
+                                 self.segments)[self.current_indices]
+        self.selected_mask = codes == 0
+        self.operations.append({'op': 'auto_select'})
         self.highlight_selected()
+        return codes
     
     def highlight_selected(self):
         """高亮显示选中的数据点"""
-        self.ax1.clear()
-        
-        # 绘制未选中的点
-        unselected = [i for i in range(len(self.x_current)) if i not in self.selected_indices]
-        if unselected:
-            self.ax1.scatter(self.x_current[unselected], self.y_current[unselected], 
-                           c='lightgray', alpha=0.6, s=25)
+        selecting = bool(self.selected_mask.any())
         
-        # 绘制选中的点
-        if self.selected_indices:
-            selected_x = self.x_current[self.selected_indices]
-            selected_y = self.y_current[self.selected_indices]
-            self.ax1.scatter(selected_x, selected_y, 
-                           c='red', alpha=0.8, s=25, edgecolors='darkred')
-        
-        self.ax1.grid(True, alpha=0.3)
-        
-        # 重新设置选择器
-        self.setup_selector()
-        
-        # 更新右图
+        with instrument('highlight', selected=self.get_selected_count(),
+                        density=self.density_mode) as record:
+            # 选中的点（红色）及右图
+            self._update_overlays()
+            
+            if selecting != self._base_selecting:
+                # 底层颜色切换（绿色 ↔ 浅灰）需要整图重绘一次，之后只需blit
+                self._base_selecting = selecting
+                self._style_base(selecting)
+                self.fig.canvas.draw_idle()
+                record.set(full_redraw=True)
+            else:
+                self._blit()
+    
+    def _style_base(self, selecting):
+        """底层配色：无选择时为绿色，有选择时未选中点为浅灰"""
+        self.base_artist.set_facecolor('lightgray' if selecting else 'green')
+        self.base_artist.set_alpha(0.6 if selecting else 0.8)
+        self.base_image.set_cmap(_density_cmap('Greys' if selecting else 'Greens'))
+    
+    def _update_overlays(self):
+        """按当前显示模式更新选中层"""
+        selecting = bool(self.selected_mask.any())
+        selected_points = self._points[self.selected_mask]
+        if self.density_mode:
+            self._set_density(self.selected_image, selected_points, self.ax1)
+            self.selected_image.set_visible(selecting)
+        else:
+            self.selected_artist.set_offsets(selected_points)
+            self.selected_artist.set_visible(selecting)
         self.update_right_plot()
-        
-        plt.draw()
     
     def update_plots(self):
-        """更新两个子图"""
-        # 左图：当前数据
-        self.ax1.clear()
-        self.ax1.scatter(self.x_current, self.y_current, c='green', alpha=0.8, s=25)
-        self.ax1.grid(True, alpha=0.3)
-        
-        # 右图：清洗后的数据
-        self.update_right_plot()
-        
-        plt.tight_layout()
-        plt.draw()
+        """当前数据变化后更新两个子图"""
+        with instrument('redraw', points=self.get_current_count()) as record:
+            self._points = np.column_stack((self.x_current, self.y_current))
+            self.density_mode = len(self._points) > self.density_threshold
+            self._base_selecting = False
+            self._style_base(False)
+            
+            # 按新数据重新计算坐标范围（两图共享），之后关闭自动缩放以免图像范围影响坐标轴
+            self._updating = True
+            for ax in (self.ax1, self.ax2):
+                ax.set_autoscale_on(True)
+                ax.ignore_existing_data_limits = True
+                if len(self._points):
+                    ax.update_datalim(self._points)
+            self.ax1.autoscale_view()
+            for ax in (self.ax1, self.ax2):
+                ax.set_autoscale_on(False)
+            self._updating = False
+            
+            # 左图：当前数据（散点或密度图）
+            self.base_artist.set_offsets(self._points if not self.density_mode else np.empty((0, 2)))
+            self.base_artist.set_visible(not self.density_mode)
+            self.base_image.set_visible(self.density_mode)
+            self.selected_artist.set_visible(False)
+            self.selected_image.set_visible(False)
+            self.result_artist.set_visible(False)
+            self.result_image.set_visible(False)
+            if self.density_mode:
+                self._set_density(self.base_image, self._points, self.ax1)
+            record.set(density=self.density_mode)
+            
+            # 右图：清洗后的数据
+            self._update_overlays()
+            
+            self.fig.canvas.draw_idle()
     
     def update_right_plot(self):
         """更新右侧图形"""
-        self.ax2.clear()
-        if len(self.selected_indices) > 0:
-            selected_x = self.x_current[self.selected_indices]
-            selected_y = self.y_current[self.selected_indices]
-            self.ax2.scatter(selected_x, selected_y, c='blue', alpha=0.8, s=25)
-        
-        self.ax2.grid(True, alpha=0.3)
+        selecting = bool(self.selected_mask.any())
+        selected_points = self._points[self.selected_mask]
+        if self.density_mode:
+            self._set_density(self.result_image, selected_points, self.ax2)
+            self.result_image.set_visible(selecting)
+        else:
+            self.result_artist.set_offsets(selected_points)
+            self.result_artist.set_visible(selecting)
     
     def apply_cleaning(self):
         """应用数据清洗"""
-        if not self.selected_indices:
+        if not self.selected_mask.any():
             return False
         
-        # 更新当前数据为选中的数据
-        self.x_current = self.x_current[self.selected_indices]
-        self.y_current = self.y_current[self.selected_indices]
-        self.current_labels = [self.current_labels[i] for i in self.selected_indices]
-        
-        # 清空选择
-        self.selected_indices = []
-        
-        # 更新图形
-        self.update_plots()
-        self.setup_selector()
+        # 只保留选中的点：在原始数据的保留掩码上清除未选中的位（范围外的点不受影响）
+        keep = self.keep_mask
+        keep[self.current_indices[~self.selected_mask]] = False
+        self.operations.append({'op': 'apply'})
+        with instrument('apply_cleaning', points=self.get_current_count(),
+                        kept=self.get_selected_count()):
+            self._push(keep)
         
         return True
     
     def reset_data(self):
-        """重置为原始数据"""
-        self.x_current = self.x_original.copy()
-        self.y_current = self.y_original.copy()
-        self.current_labels = list(self.labels)
-        self.selected_indices = []
-        
-        self.update_plots()
-        self.setup_selector()
+        """重置为原始数据（作为一步历史，可撤销）；设置了范围时只恢复范围内的点"""
+        keep = self.keep_mask
+        operation = {'op': 'reset'}
+        if self.scope is None:
+            reset = np.ones(self.n_points, dtype=bool)
+        else:
+            reset = keep | self.scope
+            operation['scope'] = scope_ranges(self.scope)
+        self.operations.append(operation)
+        if np.array_equal(reset, keep):
+            self.selected_mask = np.zeros(self.get_current_count(), dtype=bool)
+            self.update_plots()
+            return
+        self._push(reset)
+    
+    def can_undo(self):
+        return self._position > 0
+    
+    def can_redo(self):
+        return self._position < len(self._history) - 1
+    
+    def undo(self):
+        """撤销上一步清洗"""
+        if not self.can_undo():
+            return False
+        self.operations.append({'op': 'undo'})
+        self._goto(self._position - 1)
+        return True
+    
+    def redo(self):
+        """重做被撤销的清洗"""
+        if not self.can_redo():
+            return False
+        self.operations.append({'op': 'redo'})
+        self._goto(self._position + 1)
+        return True
+    
+    def history_state(self):
+        """
+        Returns:
+        (steps, position): 各步保留掩码（按位压缩，形状为 (步数, 字节数)）及当前步骤
+        """
+        return np.stack(self._history), self._position
+    
+    def restore_history(self, steps, position):
+        """
+        恢复清洗历史，数据点数必须与当前原始数据一致
+
+        Raises:
+        ValueError: 历史记录与当前数据不匹配
+        """
+        steps = np.asarray(steps, dtype=np.uint8)
+        if steps.ndim != 2 or steps.shape[1] != (self.n_points + 7) // 8 or not 0 <= position < len(steps):
+            raise ValueError("历史记录与当前数据不一致")
+        self._history = list(steps)
+        self._goto(int(position))
+    
+    def save_history(self, filepath):
+        """
+        保存清洗历史，便于之后继续清洗
+
+        每一步只保存按位压缩的保留掩码，不包含数据本身
+        """
+        steps, position = self.history_state()
+        np.savez_compressed(filepath, n_points=self.n_points, position=position, steps=steps)
+    
+    def load_history(self, filepath):
+        """
+        载入清洗历史，数据点数必须与当前原始数据一致
+
+        Raises:
+        ValueError: 历史记录与当前数据不匹配
+        """
+        with np.load(filepath) as history:
+            n_points = int(history['n_points'])
+            position = int(history['position'])
+            steps = history['steps']
+        if n_points != self.n_points:
+            raise ValueError(f"历史记录包含 {n_points} 个点，与当前数据（{self.n_points} 个点）不一致")
+        self.restore_history(steps, position)
+    
+    def apply_recipe(self, operations):
+        """
+        在当前文件上重放清洗配方
+
+        配方从原始数据开始重放（与无界面批量重放结果一致），结果作为一步历史加入，可撤销；
+        之后录制的操作接在该配方之后。设置了范围时只替换范围内的点。
+
+        Returns:
+        int: 重放后范围内保留的点数
+        """
+        keep = replay(operations, self.x_original, self.y_original, self.segments)
+        if self.scope is not None:
+            keep = np.where(self.scope, keep, self.keep_mask)
+        self.operations = list(operations)
+        self.recording_complete = self.scope is None
+        self._push(keep)
+        return self.get_current_count()
     
     def get_cleaned_data(self):
         """获取当前清洗后的数据"""
@@ -138,8 +550,8 @@ class LassoDataCleaner:
     
     def get_selected_count(self):
         """获取当前选中的数据点数量"""
-        return len(self.selected_indices)
+        return int(np.count_nonzero(self.selected_mask))
     
     def get_current_count(self):
         """获取当前数据点总数量"""
-        return len(self.x_current)
+        return len(self.current_indices)
@@ -0,0 +1,254 @@
+import argparse
+import itertools
+import sys
+
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft, rfftfreq
+from scipy.ndimage import maximum_filter1d, median_filter
+from scipy.signal import find_peaks, sosfreqz
+
+from ecg_pipeline import (PEAK_DISTANCE_SECONDS, PEAK_PERCENTILE, PEAK_PROMINENCE_FACTOR,
+                          ECGPipeline, design_bandpass)
+
+# 默认搜索网格
+SWEEP_GRID = {
+    'lowcut': (0.5, 1, 3, 5),
+    'highcut': (15, 25, 45),
+    'order': (2, 4),
+    'prominence_factor': (0.5, 0.8, 1.2),
+    'distance_seconds': (0.2, 0.25, 0.33),
+}
+
+# 默认参数（得分相同时优先选择与之更接近的设置）
+DEFAULT_SETTING = {
+    'lowcut': 1, 'highcut': 45, 'order': 4,
+    'prominence_factor': PEAK_PROMINENCE_FACTOR, 'distance_seconds': PEAK_DISTANCE_SECONDS,
+}
+
+# 评估用的信号片段：从记录中均匀选取若干个窗口
+SWEEP_WINDOWS = 5
+SWEEP_WINDOW_SECONDS = 60
+SWEEP_PAD_SECONDS = 2
+
+# 评分用的参考频带（突出QRS波群）及心搏模板半宽（秒）
+REFERENCE_BAND = (5, 15, 2)
+TEMPLATE_HALF_WIDTH = 0.1
+
+# 生理上合理的RR间期范围（秒）及相邻RR间期的最大相对变化
+RR_RANGE = (0.3, 2.0)
+RR_MAX_CHANGE = 0.2
+
+
+def sample_windows(signal, fs, n_windows=SWEEP_WINDOWS, window_seconds=SWEEP_WINDOW_SECONDS):
+    """
+    从记录中均匀选取若干个等长窗口
+
+    Returns:
+    np.ndarray: 形状为 (窗口数, 窗口长度)；记录较短时只有一个窗口
+    """
+    window = int(window_seconds * fs)
+    if len(signal) <= window * n_windows:
+        n_windows = max(len(signal) // window, 1)
+        window = len(signal) // n_windows
+    starts = np.linspace(0, len(signal) - window, n_windows).astype(np.int64)
+    return np.stack([np.asarray(signal[start:start + window], dtype=float) for start in starts])
+
+
+def filter_bank(windows, fs, bands, pad_seconds=SWEEP_PAD_SECONDS):
+    """
+    用一组带通滤波器同时对所有窗口做零相位滤波
+
+    零相位（正反向）滤波的频率响应为 |H(f)|²，因此每个窗口只需一次FFT，
+    各滤波器只在频域相乘后批量反变换。窗口两侧先做镜像延拓以抑制循环卷积的边缘效应。
+
+    Parameters:
+    windows: 形状为 (窗口数, 窗口长度)
+    bands: (lowcut, highcut, order) 序列
+
+    Returns:
+    np.ndarray: 形状为 (滤波器数, 窗口数, 窗口长度)
+    """
+    length = windows.shape[-1]
+    pad = min(int(pad_seconds * fs), length - 1)
+    padded = np.pad(windows, ((0, 0), (pad, pad)), mode='reflect')
+    n_fft = next_fast_len(padded.shape[-1], real=True)
+
+    spectrum = rfft(padded, n=n_fft, axis=-1)
+    freqs = rfftfreq(n_fft, 1 / fs)
+    gains = np.stack([np.abs(sosfreqz(design_bandpass(fs, lowcut, highcut, order),
+                                      worN=freqs, fs=fs)[1]) ** 2
+                      for lowcut, highcut, order in bands])
+    filtered = irfft(spectrum[None, :, :] * gains[:, None, :], n=n_fft, axis=-1)
+    return filtered[..., pad:pad + length]
+
+
+def score_peaks(peak_lists, reference, fs):
+    """
+    按信号质量和RR间期合理性为一组检测结果评分
+
+    - plausible: RR间期落在生理范围内的比例
+    - consistency: RR间期与局部中位数相差不超过 RR_MAX_CHANGE 的比例
+    - completeness: RR间期内部参考信号没有QRS幅度尖峰（即没有漏检）的比例
+    - quality: 各心搏与中位数模板的平均相关系数
+
+    Parameters:
+    peak_lists: 每个窗口的R峰位置
+    reference: 参考频带滤波后的窗口，形状为 (窗口数, 窗口长度)
+
+    Returns:
+    dict: 各分项及其乘积 score
+    """
+    half = int(TEMPLATE_HALF_WIDTH * fs)
+    offsets = np.arange(-half, half + 1)
+    local_max = maximum_filter1d(reference, size=2 * half + 1, axis=-1)
+
+    rr_list, beats, gap_flags = [], [], []
+    for peaks, ref, ref_max in zip(peak_lists, reference, local_max):
+        if len(peaks) < 2:
+            continue
+        rr_list.append(np.diff(peaks) / fs)
+
+        inside = peaks[(peaks >= half) & (peaks < len(ref) - half)]
+        beats.append(ref[inside[:, None] + offsets])
+
+        # 两个R峰之间（各让出一个模板半宽）出现接近R峰幅度的尖峰，视为漏检
+        amplitude = np.median(ref_max[peaks])
+        starts, stops = peaks[:-1] + half, peaks[1:] - half
+        valid = stops > starts
+        gap_max = np.zeros(len(starts))
+        if valid.any():
+            bounds = np.column_stack((starts[valid], stops[valid])).ravel()
+            gap_max[valid] = np.maximum.reduceat(ref, bounds)[::2]
+        gap_flags.append(gap_max > 0.5 * amplitude)
+
+    result = {'n_rr': 0, 'plausible': 0.0, 'consistency': 0.0, 'completeness': 0.0,
+              'quality': 0.0, 'score': 0.0}
+    if not rr_list:
+        return result
+    rr = np.concatenate(rr_list)
+    result['n_rr'] = len(rr)
+    if len(rr) < 5:
+        return result
+
+    local_median = np.concatenate([median_filter(r, size=5, mode='nearest') for r in rr_list])
+    result['plausible'] = float(np.mean((rr >= RR_RANGE[0]) & (rr <= RR_RANGE[1])))
+    result['consistency'] = float(np.mean(np.abs(rr - local_median) <= RR_MAX_CHANGE * local_median))
+    result['completeness'] = 1.0 - float(np.mean(np.concatenate(gap_flags)))
+
+    beats = np.concatenate(beats)
+    if len(beats) >= 2:
+        beats = beats - beats.mean(axis=1, keepdims=True)
+        template = np.median(beats, axis=0)
+        norms = np.linalg.norm(beats, axis=1) * np.linalg.norm(template)
+        correlation = beats @ template / np.where(norms > 0, norms, 1)
+        result['quality'] = max(float(np.mean(correlation)), 0.0)
+
+    result['score'] = (result['plausible'] * result['consistency'] * result['completeness']
+                       * result['quality'])
+    return result
+
+
+def _expand_grid(grid):
+    """网格展开为参数字典列表"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _distance_to_default(setting):
+    return sum(setting.get(name) != value for name, value in DEFAULT_SETTING.items())
+
+
+def sweep_parameters(signal, fs, grid=None, n_windows=SWEEP_WINDOWS,
+                     window_seconds=SWEEP_WINDOW_SECONDS):
+    """
+    在参数网格上评估滤波和R峰检测设置
+
+    记录只取若干窗口；每个滤波频带只滤波一次（整个滤波器组批量在频域完成），
+    其百分位阈值、标准差等中间量在该频带的所有检测参数组合之间复用。
+
+    Parameters:
+    signal: 原始ECG信号（一维，可以是内存映射数组）
+    grid: 参数网格 {参数名: 候选值序列}，默认 SWEEP_GRID
+
+    Returns:
+    list: 每个设置一个字典（参数及评分），按得分从高到低排列
+    """
+    grid = dict(SWEEP_GRID if grid is None else grid)
+    settings = [s for s in _expand_grid(grid) if 0 < s['lowcut'] < s['highcut'] < fs / 2]
+    if not settings:
+        raise ValueError("参数网格中没有有效的滤波频带")
+
+    by_band = {}
+    for setting in settings:
+        by_band.setdefault((setting['lowcut'], setting['highcut'], setting['order']), []).append(setting)
+    bands = list(by_band)
+
+    windows = sample_windows(signal, fs, n_windows, window_seconds)
+    filtered = filter_bank(windows, fs, bands + [REFERENCE_BAND])
+    reference = filtered[-1]
+
+    results = []
+    for band, band_windows in zip(bands, filtered[:-1]):
+        # 阈值统计量按窗口计算一次，供本频带的各检测参数组合复用
+        stds = np.std(band_windows, axis=-1)
+        heights = {}
+        for setting in by_band[band]:
+            percentile = setting.get('percentile', PEAK_PERCENTILE)
+            if percentile not in heights:
+                heights[percentile] = np.percentile(band_windows, percentile, axis=-1)
+            peak_lists = [_detect(w, fs, height, std, setting)
+                          for w, height, std in zip(band_windows, heights[percentile], stds)]
+            results.append(dict(setting, **score_peaks(peak_lists, reference, fs)))
+
+    # 得分按两位小数比较，相同时取与默认参数最接近的设置
+    results.sort(key=lambda r: (-round(r['score'], 2), _distance_to_default(r)))
+    return results
+
+
+def _detect(window, fs, height, std, setting):
+    """使用预先算好的阈值统计量检测R峰（与 locate_r_peaks 判据相同）"""
+    distance = setting.get('distance_seconds', PEAK_DISTANCE_SECONDS)
+    prominence = setting.get('prominence_factor', PEAK_PROMINENCE_FACTOR)
+    peaks, _ = find_peaks(window, height=height, distance=max(int(distance * fs), 1),
+                          prominence=std * prominence)
+    return peaks
+
+
+def best_parameters(signal, fs, grid=None):
+    """
+    自动选择滤波和R峰检测参数
+
+    Returns:
+    (filter_params, detect_params, result): 滤波参数 {lowcut, highcut, order}、
+    检测参数（传给 locate_r_peaks）以及该设置的评分
+    """
+    best = sweep_parameters(signal, fs, grid)[0]
+    filter_params = {name: best[name] for name in ('lowcut', 'highcut', 'order')}
+    detect_params = {name: best[name] for name in best
+                     if name in ('percentile', 'prominence_factor', 'distance_seconds')}
+    return filter_params, detect_params, best
+
+
+def main(argv=None):
+    """命令行入口：评估参数网格并列出得分最高的设置"""
+    parser = argparse.ArgumentParser(description="为ECG记录搜索滤波频带和R峰检测参数")
+    parser.add_argument('input', help="ECG文本文件")
+    parser.add_argument('--fs', type=float, default=500, help="采样频率 (Hz)，默认 500")
+    parser.add_argument('--column', type=int, default=1, help="数据列号（从0开始），默认 1")
+    parser.add_argument('--top', type=int, default=10, help="列出得分最高的设置数，默认 10")
+    args = parser.parse_args(argv)
+
+    signal = ECGPipeline().load_ecg_data(args.input, columns=args.column)
+    results = sweep_parameters(signal, args.fs)
+
+    print(f"{'lowcut':>7} {'highcut':>7} {'order':>5} {'prom':>5} {'dist':>5} "
+          f"{'score':>6} {'plaus':>6} {'cons':>6} {'compl':>6} {'qual':>6} {'n_rr':>5}")
+    for r in results[:args.top]:
+        print(f"{r['lowcut']:>7g} {r['highcut']:>7g} {r['order']:>5d} {r['prominence_factor']:>5g} "
+              f"{r['distance_seconds']:>5g} {r['score']:>6.3f} {r['plausible']:>6.3f} "
+              f"{r['consistency']:>6.3f} {r['completeness']:>6.3f} {r['quality']:>6.3f} {r['n_rr']:>5d}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
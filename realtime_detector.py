@@ -0,0 +1,200 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+from scipy.signal import find_peaks, sosfilt, sosfilt_zi
+
+from ecg_pipeline import ECGPipeline, design_bandpass
+
+
+class IncrementalRPeakDetector:
+    def __init__(self, fs, lowcut=1, highcut=45, order=4, refractory=0.25, learning_seconds=2.0):
+        """
+        增量式R峰检测器，逐块输入样本，R峰确认后立即输出
+
+        使用因果带通滤波（滤波器状态跨块保持），以指数滑动平均维护信号峰和噪声峰
+        电平，阈值随幅度漂移自适应；内存占用与已处理的样本数无关。
+        输出的R峰位置包含因果滤波的群延迟，RR间期不受影响。
+
+        Parameters:
+        fs: 采样频率 (Hz)
+        lowcut, highcut, order: 带通滤波参数
+        refractory: 不应期（秒），两个R峰的最小间隔
+        learning_seconds: 初始化阈值所用的学习时长（秒）
+        """
+        self.fs = fs
+        self.sos = design_bandpass(fs, lowcut, highcut, order)
+        self.distance = max(int(refractory * fs), 1)
+        self.learning_samples = max(int(learning_seconds * fs), 2 * self.distance + 1)
+
+        self._zi = None
+        self._buffer = np.empty(0)  # 尚需参与判定的滤波后样本
+        self._buffer_start = 0      # _buffer[0] 对应的绝对样本序号
+        self._n_seen = 0
+        self._next_candidate = 0    # 此前的候选峰均已判定
+
+        # 学习阶段统计量
+        self._learn_max = 0.0
+        self._learn_abs_sum = 0.0
+        self._learned = False
+
+        # 自适应阈值状态
+        self.signal_level = 0.0
+        self.noise_level = 0.0
+        self.rr_mean = None          # RR间期滑动平均（样本数）
+        self.last_peak = None
+        self._searchback = None      # 上一个R峰之后最高的噪声候选 (位置, 幅值)
+
+    @property
+    def threshold(self):
+        """当前判定阈值"""
+        return self.noise_level + 0.25 * (self.signal_level - self.noise_level)
+
+    def process(self, samples):
+        """
+        输入一块原始样本
+
+        Returns:
+        (peaks, rr_intervals): 本次确认的R峰位置（绝对样本序号）及对应的RR间期（秒）
+        """
+        samples = np.asarray(samples, dtype=float)
+        if len(samples) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        if self._zi is None:
+            self._zi = sosfilt_zi(self.sos) * samples[0]
+        filtered, self._zi = sosfilt(self.sos, samples, zi=self._zi)
+
+        self._buffer = np.concatenate((self._buffer, filtered))
+        self._n_seen += len(filtered)
+
+        if not self._learned:
+            self._update_learning(filtered)
+            if not self._learned:
+                return np.empty(0, dtype=np.int64), np.empty(0)
+
+        peaks, rr_samples = [], []
+        self._judge_candidates(peaks, rr_samples)
+
+        # 只保留下一轮判定所需的左侧上下文，内存有界
+        keep_from = max(self._next_candidate - self.distance, self._buffer_start)
+        self._buffer = self._buffer[keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
+
+        return np.array(peaks, dtype=np.int64), np.array(rr_samples, dtype=float) / self.fs
+
+    def _update_learning(self, filtered):
+        """学习阶段：记录最大幅值和平均绝对幅值，用于初始化阈值"""
+        remaining = self.learning_samples - (self._n_seen - len(filtered))
+        window = filtered[:max(remaining, 0)]
+        if len(window):
+            self._learn_max = max(self._learn_max, float(window.max()))
+            self._learn_abs_sum += float(np.abs(window).sum())
+
+        if self._n_seen >= self.learning_samples:
+            self.signal_level = self._learn_max
+            self.noise_level = self._learn_abs_sum / self.learning_samples
+            self._learned = True
+
+    def _judge_candidates(self, peaks, rr_samples):
+        """判定已具备左右各一个不应期上下文的候选峰"""
+        confirm_before = self._n_seen - self.distance
+        if confirm_before <= self._next_candidate:
+            return
+
+        buffer = self._buffer
+        local_maxima, _ = find_peaks(buffer)
+        positions = local_maxima + self._buffer_start
+        in_range = (positions >= self._next_candidate) & (positions < confirm_before)
+        local_maxima = local_maxima[in_range]
+
+        # 只保留在前后一个不应期内为最大值的候选
+        window_max = maximum_filter1d(buffer, size=2 * self.distance + 1, mode='nearest')
+        dominant = local_maxima[buffer[local_maxima] >= window_max[local_maxima]]
+
+        for index in dominant:
+            position = int(index + self._buffer_start)
+            self._judge(position, float(buffer[index]), peaks, rr_samples)
+
+        self._next_candidate = confirm_before
+
+    def _judge(self, position, value, peaks, rr_samples):
+        """按自适应阈值判定单个候选峰，必要时回溯漏检的R峰"""
+        if (self.last_peak is not None and self.rr_mean is not None
+                and self._searchback is not None
+                and position - self.last_peak > 1.66 * self.rr_mean
+                and self._searchback[1] > 0.5 * self.threshold):
+            # 间隔过长：以较低阈值接受上一个R峰之后最高的候选
+            back_position, back_value = self._searchback
+            self.signal_level = 0.25 * back_value + 0.75 * self.signal_level
+            self._accept(back_position, peaks, rr_samples)
+
+        outside_refractory = self.last_peak is None or position - self.last_peak >= self.distance
+        if value > self.threshold and outside_refractory:
+            self.signal_level = 0.125 * value + 0.875 * self.signal_level
+            self._accept(position, peaks, rr_samples)
+        else:
+            self.noise_level = 0.125 * value + 0.875 * self.noise_level
+            if outside_refractory and (self._searchback is None or value > self._searchback[1]):
+                self._searchback = (position, value)
+
+    def _accept(self, position, peaks, rr_samples):
+        """确认一个R峰并更新RR间期滑动平均"""
+        if self.last_peak is not None:
+            rr = position - self.last_peak
+            rr_samples.append(rr)
+            self.rr_mean = rr if self.rr_mean is None else 0.125 * rr + 0.875 * self.rr_mean
+        self.last_peak = position
+        self._searchback = None
+        peaks.append(position)
+
+
+def iter_replay(filepath, detector, fs, speed=1.0, chunk_seconds=0.1, columns=1):
+    """
+    回放文本记录，按实时或加速的节奏分块送入检测器
+
+    Parameters:
+    speed: 回放倍速，1 为实时，0 表示不等待、尽快回放
+    chunk_seconds: 每块时长（秒）
+
+    Yields:
+    (peaks, rr_intervals): 每块确认的R峰和RR间期
+    """
+    ecg_data = ECGPipeline().load_ecg_data(filepath, columns=columns)
+    chunk_size = max(int(chunk_seconds * fs), 1)
+    started = time.perf_counter()
+
+    for start in range(0, len(ecg_data), chunk_size):
+        if speed > 0:
+            due = started + start / fs / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield detector.process(ecg_data[start:start + chunk_size])
+
+
+def main(argv=None):
+    """命令行入口：回放记录并实时输出RR间期"""
+    parser = argparse.ArgumentParser(description="回放ECG文本记录，测试增量R峰检测")
+    parser.add_argument('input', help="ECG文本文件")
+    parser.add_argument('--fs', type=float, default=500, help="采样频率 (Hz)，默认 500")
+    parser.add_argument('--lowcut', type=float, default=1, help="带通下限 (Hz)，默认 1")
+    parser.add_argument('--highcut', type=float, default=45, help="带通上限 (Hz)，默认 45")
+    parser.add_argument('--speed', type=float, default=1.0, help="回放倍速，0 表示尽快回放")
+    parser.add_argument('--chunk', type=float, default=0.1, help="每块时长（秒），默认 0.1")
+    args = parser.parse_args(argv)
+
+    detector = IncrementalRPeakDetector(args.fs, args.lowcut, args.highcut)
+    n_peaks = 0
+    for peaks, rr_intervals in iter_replay(args.input, detector, args.fs, args.speed, args.chunk):
+        for peak, rr in zip(peaks[len(peaks) - len(rr_intervals):], rr_intervals):
+            print(f"{peak / args.fs:10.3f} s  RR = {rr:.3f} s")
+        n_peaks += len(peaks)
+    print(f"共检测到 {n_peaks} 个R峰", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
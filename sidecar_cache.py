@@ -0,0 +1,58 @@
+import glob
+import os
+import tempfile
+
+import numpy as np
+
+
+def sidecar_path(filepath, tag):
+    """
+    生成源文件旁的二进制缓存路径，文件名中包含源文件大小和修改时间，
+    源文件变化后旧缓存自动失效
+    """
+    stat = os.stat(filepath)
+    directory, name = os.path.split(os.path.abspath(filepath))
+    return os.path.join(directory, f"{name}.{tag}-{stat.st_size}-{stat.st_mtime_ns}.npy")
+
+
+def load_sidecar(filepath, tag):
+    """以内存映射方式读取缓存，不存在或已损坏时返回 None"""
+    path = sidecar_path(filepath, tag)
+    if not os.path.isfile(path):
+        return None
+    try:
+        return np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def write_sidecar(filepath, tag, array):
+    """
+    写出缓存（先写临时文件再原子替换），并删除同一源文件的过期缓存
+
+    Returns:
+    str | None: 缓存路径，目录不可写等情况下返回 None
+    """
+    path = sidecar_path(filepath, tag)
+    directory, name = os.path.split(path)
+    source_name = os.path.basename(filepath)
+
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.save(file, np.ascontiguousarray(array))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        return None
+
+    for stale in glob.glob(os.path.join(directory, glob.escape(f"{source_name}.{tag}-") + "*.npy")):
+        if stale != path:
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+    return path
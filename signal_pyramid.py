@@ -0,0 +1,76 @@
+import numpy as np
+
+# 第一层每块的样本数、相邻层之间的缩减倍数及最粗一层的最少块数
+PYRAMID_BASE_BLOCK = 16
+PYRAMID_FACTOR = 4
+PYRAMID_MIN_BLOCKS = 1024
+
+# 逐段构建第一层时每段的样本数（限制内存映射信号的一次读取量）
+PYRAMID_BUILD_CHUNK = PYRAMID_BASE_BLOCK * 1024 * 1024
+
+
+class MinMaxPyramid:
+    def __init__(self, signal, base_block=PYRAMID_BASE_BLOCK, factor=PYRAMID_FACTOR):
+        """
+        信号的多分辨率最小/最大值金字塔，用于按屏幕像素抽取长记录的波形轮廓
+
+        第 k 层把信号按 base_block * factor**k 个样本分块，保存每块的最小值和最大值；
+        各层总大小约为原信号的 2 / (base_block - 1)。
+
+        Parameters:
+        signal: 一维信号（可以是内存映射数组）
+        base_block: 第一层每块的样本数
+        factor: 相邻层之间的缩减倍数
+        """
+        self.signal = signal
+        self.n_samples = len(signal)
+        self.levels = []  # (块大小, 最小值, 最大值)
+
+        if self.n_samples == 0:
+            return
+
+        mins, maxs = [], []
+        for start in range(0, self.n_samples, PYRAMID_BUILD_CHUNK):
+            chunk = np.asarray(signal[start:start + PYRAMID_BUILD_CHUNK])
+            offsets = np.arange(0, len(chunk), base_block)
+            mins.append(np.minimum.reduceat(chunk, offsets))
+            maxs.append(np.maximum.reduceat(chunk, offsets))
+        block, mins, maxs = base_block, np.concatenate(mins), np.concatenate(maxs)
+        self.levels.append((block, mins, maxs))
+
+        while len(mins) > PYRAMID_MIN_BLOCKS:
+            offsets = np.arange(0, len(mins), factor)
+            block, mins, maxs = (block * factor, np.minimum.reduceat(mins, offsets),
+                                 np.maximum.reduceat(maxs, offsets))
+            self.levels.append((block, mins, maxs))
+
+    def envelope(self, start, stop, n_bins):
+        """
+        [start, stop) 区间内按 n_bins 个像素抽取的波形轮廓
+
+        每个像素区间取最小值和最大值，交错成竖线段，折线绘制后与逐点绘制外观一致。
+        选用块大小不超过每像素样本数的最粗一层，耗时只与像素数有关。
+
+        Returns:
+        (positions, values): 样本位置和对应的值；样本数不多于像素数时直接返回原始样本
+        """
+        start = max(int(start), 0)
+        stop = min(int(np.ceil(stop)), self.n_samples)
+        n_bins = max(int(n_bins), 1)
+        if stop <= start:
+            return np.empty(0), np.empty(0)
+
+        samples_per_bin = (stop - start) / n_bins
+        usable = [level for level in self.levels if level[0] <= samples_per_bin]
+        if not usable:
+            return np.arange(start, stop), np.asarray(self.signal[start:stop])
+
+        block, mins, maxs = usable[-1]
+        first, last = start // block, -(-stop // block)
+        edges = np.unique(np.linspace(0, last - first, n_bins + 1).astype(np.int64)[:-1])
+        bin_mins = np.minimum.reduceat(mins[first:last], edges)
+        bin_maxs = np.maximum.reduceat(maxs[first:last], edges)
+
+        positions = np.repeat((first + edges) * block, 2)
+        values = np.column_stack((bin_mins, bin_maxs)).ravel()
+        return positions, values
@@ -0,0 +1,104 @@
+import numpy as np
+from matplotlib.figure import Figure
+
+from signal_pyramid import MinMaxPyramid
+
+# 滚轮每格的缩放倍数、跳转到R峰时两侧留出的时长（秒）及最短可视时长（秒）
+SCROLL_ZOOM = 1.25
+PEAK_MARGIN_SECONDS = 1.0
+MIN_VIEW_SECONDS = 0.05
+
+# 可视区域内R峰超过该数量时不再逐个标出
+MAX_VISIBLE_PEAKS = 2000
+
+
+class SignalViewer:
+    def __init__(self, signal, fs, r_peaks=None, figsize=(12, 2.5)):
+        """
+        长时程ECG波形查看器
+
+        可视区域变化时按坐标轴像素宽度从最小/最大值金字塔抽取波形轮廓，绘制的点数
+        只与像素数有关，24小时记录也能流畅缩放和平移；标出可视区域内的R峰。
+
+        Parameters:
+        signal: 一维信号（可以是内存映射数组）
+        fs: 采样频率 (Hz)
+        r_peaks: R峰样本位置（可选）
+        """
+        self.signal = signal
+        self.fs = fs
+        self.r_peaks = np.asarray(r_peaks) if r_peaks is not None else np.empty(0, dtype=np.int64)
+        self.pyramid = MinMaxPyramid(signal)
+        self.duration = len(signal) / fs
+
+        self.fig = Figure(figsize=figsize)
+        self.ax = self.fig.add_subplot(1, 1, 1)
+        self.ax.set_xlabel("Time (s)")
+        self.ax.grid(True, alpha=0.3)
+        self.line, = self.ax.plot([], [], color='black', linewidth=0.6)
+        self.peak_artist, = self.ax.plot([], [], 'v', color='tab:blue', markersize=4)
+        self.highlight_artist, = self.ax.plot([], [], 'v', color='red', markersize=8)
+        self.highlighted = np.empty(0, dtype=np.int64)
+
+        self._rendering = False
+        self.ax.callbacks.connect('xlim_changed', lambda ax: self.render())
+        self.fig.canvas.mpl_connect('scroll_event', self._on_scroll)
+        self.fig.canvas.mpl_connect('resize_event', lambda event: self.render())
+        self.ax.set_xlim(0, max(self.duration, MIN_VIEW_SECONDS))
+        self.fig.tight_layout()
+
+    def render(self):
+        """按当前可视区域和像素宽度重新抽取波形"""
+        if self._rendering:
+            return
+        self._rendering = True
+        try:
+            t0, t1 = self.ax.get_xlim()
+            n_pixels = max(int(self.ax.bbox.width), 1)
+            positions, values = self.pyramid.envelope(t0 * self.fs, t1 * self.fs, n_pixels)
+            self.line.set_data(positions / self.fs, values)
+
+            if len(values):
+                low, high = float(np.min(values)), float(np.max(values))
+                pad = (high - low) * 0.05 or 1.0
+                self.ax.set_ylim(low - pad, high + pad)
+
+            self._set_peaks(self.peak_artist, self.r_peaks, t0, t1)
+            self._set_peaks(self.highlight_artist, self.highlighted, t0, t1)
+        finally:
+            self._rendering = False
+        self.fig.canvas.draw_idle()
+
+    def _set_peaks(self, artist, peaks, t0, t1):
+        """只绘制可视区域内的R峰"""
+        first, last = np.searchsorted(peaks, [t0 * self.fs, t1 * self.fs])
+        if last - first > MAX_VISIBLE_PEAKS:
+            first = last
+        visible = peaks[first:last]
+        artist.set_data(visible / self.fs, np.asarray(self.signal[visible]))
+
+    def show_peaks(self, peaks, margin=PEAK_MARGIN_SECONDS):
+        """跳转到指定R峰附近并高亮标出"""
+        self.highlighted = np.sort(np.asarray(peaks, dtype=np.int64))
+        if len(self.highlighted) == 0:
+            self.render()
+            return
+        t0 = self.highlighted[0] / self.fs - margin
+        t1 = self.highlighted[-1] / self.fs + margin
+        self.ax.set_xlim(max(t0, 0), min(t1, self.duration))
+        self.render()
+
+    def show_pair(self, pair_index):
+        """跳转到第 pair_index 个RR间期对 (RR[i], RR[i+1]) 的三个R峰"""
+        self.show_peaks(self.r_peaks[pair_index:pair_index + 3])
+
+    def _on_scroll(self, event):
+        """滚轮以鼠标位置为中心缩放时间轴"""
+        if event.inaxes is not self.ax or event.xdata is None:
+            return
+        scale = 1 / SCROLL_ZOOM if event.button == 'up' else SCROLL_ZOOM
+        t0, t1 = self.ax.get_xlim()
+        width = min(max((t1 - t0) * scale, MIN_VIEW_SECONDS), self.duration)
+        left = event.xdata - (event.xdata - t0) * width / (t1 - t0)
+        left = min(max(left, 0), max(self.duration - width, 0))
+        self.ax.set_xlim(left, left + width)
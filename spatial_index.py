@@ -0,0 +1,126 @@
+import numpy as np
+from matplotlib.path import Path
+from scipy.ndimage import binary_dilation
+
+# 每个网格单元的目标点数及单轴最大单元数
+POINTS_PER_CELL = 16
+MAX_CELLS_PER_AXIS = 512
+
+# 边界采样点数上限（相对子网格单元数），超过时子网格全部按边界单元逐点测试
+MAX_SAMPLES_PER_CELL = 4
+
+
+class PointGridIndex:
+    def __init__(self, x_data, y_data):
+        """
+        二维点集的均匀网格索引，用于套索多边形的批量命中测试
+
+        点按所在网格单元排序存储（CSR形式）。查询时先用多边形包围盒裁剪网格，
+        再把网格单元分为完全在内、完全在外和边界三类：完全在内的单元整体选中，
+        只有边界单元中的点需要逐点做多边形包含测试。
+
+        Parameters:
+        x_data, y_data: 点坐标
+        """
+        self.x = np.asarray(x_data, dtype=float)
+        self.y = np.asarray(y_data, dtype=float)
+        self.n_points = len(self.x)
+
+        n_cells = max(self.n_points // POINTS_PER_CELL, 1)
+        self.nx = self.ny = int(min(max(np.sqrt(n_cells), 1), MAX_CELLS_PER_AXIS))
+
+        if self.n_points:
+            self.x_min, x_max = float(self.x.min()), float(self.x.max())
+            self.y_min, y_max = float(self.y.min()), float(self.y.max())
+        else:
+            self.x_min = x_max = self.y_min = y_max = 0.0
+        # 某一轴上所有点坐标相同（例如只剩一个点）时，该轴改用另一轴的跨度或 1 作为网格范围，
+        # 避免单元尺寸趋于零
+        x_span, y_span = x_max - self.x_min, y_max - self.y_min
+        fallback = max(x_span, y_span) if max(x_span, y_span) > 0 else 1.0
+        self.cell_w = (x_span if x_span > 0 else fallback) / self.nx
+        self.cell_h = (y_span if y_span > 0 else fallback) / self.ny
+
+        ix, iy = self._cell_coords(self.x, self.y)
+        cell_ids = iy * self.nx + ix
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.cell_starts = np.searchsorted(cell_ids[self.order], np.arange(self.nx * self.ny + 1))
+
+    def _cell_coords(self, x, y):
+        """坐标所在的网格单元（超出范围的夹到边缘单元）"""
+        ix = np.clip(((x - self.x_min) / self.cell_w).astype(np.int64), 0, self.nx - 1)
+        iy = np.clip(((y - self.y_min) / self.cell_h).astype(np.int64), 0, self.ny - 1)
+        return ix, iy
+
+    def _gather(self, cell_ids):
+        """取出若干网格单元内全部点的索引"""
+        starts = self.cell_starts[cell_ids]
+        lengths = self.cell_starts[cell_ids + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        return self.order[offsets + np.arange(total)]
+
+    def query_polygon(self, verts):
+        """
+        多边形命中测试
+
+        Returns:
+        np.ndarray: 布尔掩码，True 表示点在多边形内
+        """
+        mask = np.zeros(self.n_points, dtype=bool)
+        verts = np.asarray(verts, dtype=float)
+        if self.n_points == 0 or len(verts) < 3:
+            return mask
+
+        # 包围盒裁剪到子网格
+        x0 = int(np.floor((verts[:, 0].min() - self.x_min) / self.cell_w))
+        x1 = int(np.floor((verts[:, 0].max() - self.x_min) / self.cell_w))
+        y0 = int(np.floor((verts[:, 1].min() - self.y_min) / self.cell_h))
+        y1 = int(np.floor((verts[:, 1].max() - self.y_min) / self.cell_h))
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.nx - 1), min(y1, self.ny - 1)
+        if x0 > x1 or y0 > y1:
+            return mask
+        sub_w, sub_h = x1 - x0 + 1, y1 - y0 + 1
+
+        # 边界单元：沿每条边以不超过半个单元的步长采样，再向外扩一个单元（保守估计）
+        closed = np.vstack((verts, verts[:1]))
+        delta = np.diff(closed, axis=0)
+        steps = np.ceil(np.maximum(np.abs(delta[:, 0]) / self.cell_w,
+                                   np.abs(delta[:, 1]) / self.cell_h) * 2) + 1
+        if steps.sum() > MAX_SAMPLES_PER_CELL * sub_w * sub_h:
+            # 采样点多于子网格单元数的若干倍时（多边形远大于数据范围），直接把子网格全部视为边界
+            boundary = np.ones((sub_h, sub_w), dtype=bool)
+        else:
+            steps = steps.astype(np.int64)
+            segment = np.repeat(np.arange(len(delta)), steps)
+            t = (np.arange(int(steps.sum())) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+            samples = closed[segment] + delta[segment] * t[:, None]
+            sx = np.floor((samples[:, 0] - self.x_min) / self.cell_w).astype(np.int64) - x0
+            sy = np.floor((samples[:, 1] - self.y_min) / self.cell_h).astype(np.int64) - y0
+            inside_sub = (sx >= 0) & (sx < sub_w) & (sy >= 0) & (sy < sub_h)
+
+            boundary = np.zeros((sub_h, sub_w), dtype=bool)
+            boundary[sy[inside_sub], sx[inside_sub]] = True
+            boundary = binary_dilation(boundary, structure=np.ones((3, 3), dtype=bool))
+
+        path = Path(verts)
+        cy, cx = np.divmod(np.arange(sub_w * sub_h), sub_w)
+        cell_ids = (cy + y0) * self.nx + (cx + x0)
+        flat_boundary = boundary.ravel()
+
+        # 非边界单元只需测试中心点即可整体判定
+        interior = ~flat_boundary
+        centers = np.column_stack((self.x_min + (cx[interior] + x0 + 0.5) * self.cell_w,
+                                   self.y_min + (cy[interior] + y0 + 0.5) * self.cell_h))
+        inside_cells = cell_ids[interior][path.contains_points(centers)]
+        mask[self._gather(inside_cells)] = True
+
+        # 边界单元中的点逐点测试
+        candidates = self._gather(cell_ids[flat_boundary])
+        if len(candidates):
+            points = np.column_stack((self.x[candidates], self.y[candidates]))
+            mask[candidates[path.contains_points(points)]] = True
+        return mask
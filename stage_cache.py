@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# 默认缓存目录（可用环境变量 ECG_STAGE_CACHE 覆盖）及容量上限
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.ecg_stage_cache')
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+# 计算文件内容哈希时每次读取的字节数
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+
+# 各阶段的显示名称
+STAGE_NAMES = {
+    'load': "加载",
+    'filter': "滤波",
+    'peaks': "R峰检测",
+    'rr': "RR间期",
+}
+
+
+def default_cache_dir():
+    return os.environ.get('ECG_STAGE_CACHE') or DEFAULT_CACHE_DIR
+
+
+class StageCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, stages=None):
+        """
+        按内容寻址的阶段结果缓存
+
+        每个阶段的键由上一阶段的键加上本阶段参数计算得到，输入文件以内容哈希标识，
+        因此只改动某个参数时，它之前的阶段直接复用缓存。结果以 .npy（单个数组，内存
+        映射读取）或 .npz（数组列表）保存。
+
+        首次写入时扫描一次目录得到总大小，之后只累加本实例写入的大小，超过上限时才
+        按最近使用时间淘汰；清理过期的哈希记录需要逐个检查源文件，由调用方在批处理
+        开始等时机显式调用 evict。
+
+        Parameters:
+        directory: 缓存目录，默认 ~/.ecg_stage_cache
+        max_bytes: 缓存总大小上限（字节）
+        stages: 需要缓存结果的阶段，默认全部；不缓存的阶段每次重新计算，但仍参与键的计算
+        """
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.stages = frozenset(STAGE_NAMES if stages is None else stages)
+        self.reset_stats()
+        # 缓存总大小（字节），首次写入时才扫描目录
+        self._total = None
+        os.makedirs(os.path.join(self.directory, 'hashes'), exist_ok=True)
+
+    def reset_stats(self):
+        """清零命中统计（同一实例依次处理多个文件时，按文件统计）"""
+        self.stats = {stage: {'hits': 0, 'misses': 0, 'saved': 0.0} for stage in STAGE_NAMES}
+
+    @staticmethod
+    def key(stage, *parts):
+        """由阶段名和参数（含上一阶段的键）计算缓存键"""
+        text = json.dumps([stage, *parts], default=str)
+        return f"{stage}-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:40]}"
+
+    def content_hash(self, filepath):
+        """
+        文件内容哈希
+
+        以路径、大小和修改时间为索引记住已计算的哈希，文件未变化时无需重新读取；
+        记录中同时保存该索引，便于淘汰时识别源文件已删除或已修改的记录
+        """
+        stat_key = self._stat_key(filepath)
+        memo_path = os.path.join(self.directory, 'hashes',
+                                 hashlib.sha1(stat_key.encode('utf-8')).hexdigest())
+        try:
+            with open(memo_path, 'r', encoding='utf-8') as file:
+                content = file.readline().strip()
+            os.utime(memo_path)  # 更新最近使用时间
+            return content
+        except OSError:
+            pass
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(filepath, 'rb') as file:
+            for block in iter(lambda: file.read(HASH_CHUNK_BYTES), b''):
+                digest.update(block)
+        content = digest.hexdigest()
+        if self._atomic_write(memo_path,
+                              lambda file: file.write(f"{content}\n{stat_key}".encode('utf-8'))):
+            self._track(memo_path)
+        return content
+
+    @staticmethod
+    def _stat_key(filepath):
+        stat = os.stat(filepath)
+        return f"{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def get(self, stage, key):
+        """
+        读取缓存结果并记录命中/未命中
+
+        Returns:
+        (result, seconds): 结果及当初的计算耗时；未命中时 result 为 None
+        """
+        for suffix in ('.npy', '.npz'):
+            path = os.path.join(self.directory, key + suffix)
+            if not os.path.isfile(path):
+                continue
+            try:
+                if suffix == '.npy':
+                    result = np.load(path, mmap_mode='r')
+                else:
+                    with np.load(path) as archive:
+                        result = [archive[f'arr_{i}'] for i in range(len(archive.files))]
+                os.utime(path)  # 更新最近使用时间
+            except (OSError, ValueError):
+                continue
+            seconds = self._read_seconds(key)
+            self.stats[stage]['hits'] += 1
+            self.stats[stage]['saved'] += seconds
+            return result, seconds
+
+        self.stats[stage]['misses'] += 1
+        return None, 0.0
+
+    def put(self, key, result, seconds=0.0):
+        """写入阶段结果（数组或数组列表），总大小超过上限时淘汰旧缓存"""
+        if isinstance(result, (list, tuple)):
+            path = os.path.join(self.directory, key + '.npz')
+            writer = lambda file: np.savez(file, *[np.asarray(item) for item in result])
+        else:
+            path = os.path.join(self.directory, key + '.npy')
+            writer = lambda file: np.save(file, np.ascontiguousarray(result))
+        if not self._atomic_write(path, writer):
+            return
+        self._atomic_write(os.path.join(self.directory, key + '.json'),
+                           lambda file: file.write(json.dumps({'seconds': seconds}).encode('utf-8')))
+        self._track(path)
+
+    def _track(self, path):
+        """累加新写入文件的大小，超过上限时淘汰"""
+        if self._total is None:
+            self._total = sum(size for _, size, _ in self._scan())
+        else:
+            try:
+                self._total += os.path.getsize(path)
+            except OSError:
+                pass
+        if self._total > self.max_bytes:
+            self.evict(prune=False)
+
+    def _scan(self):
+        """缓存中的结果文件和哈希记录: [(修改时间, 大小, 路径)]"""
+        entries = []
+        for directory in (self.directory, os.path.join(self.directory, 'hashes')):
+            for entry in os.scandir(directory):
+                if entry.is_file() and not entry.name.endswith(('.json', '.tmp')):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self, prune=True):
+        """
+        清理缓存
+
+        prune 为真时先删除源文件已不存在或已修改的哈希记录（需逐个检查源文件，
+        每批处理调用一次即可）；之后总大小（含哈希记录）超过上限时，从最久未使用的
+        结果和哈希记录开始删除
+        """
+        if prune:
+            for entry in os.scandir(os.path.join(self.directory, 'hashes')):
+                if (entry.is_file() and not entry.name.endswith('.tmp')
+                        and self._memo_is_stale(entry.path)):
+                    self._unlink(entry.path)
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._unlink(path)
+            if path.endswith(('.npy', '.npz')):
+                self._unlink(os.path.splitext(path)[0] + '.json')
+            total -= size
+        self._total = total
+
+    @classmethod
+    def _memo_is_stale(cls, memo_path):
+        """哈希记录对应的源文件已删除、已修改，或记录为不含索引的旧格式"""
+        try:
+            with open(memo_path, 'r', encoding='utf-8') as file:
+                file.readline()
+                stat_key = file.readline()
+            return stat_key != cls._stat_key(stat_key.rsplit('|', 2)[0])
+        except (OSError, ValueError):
+            return True
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def summary(self):
+        """命中统计，例如 “加载 命中1/未命中0，…，共节省约 12.3 秒”"""
+        parts = [f"{STAGE_NAMES[stage]} 命中{counts['hits']}/未命中{counts['misses']}"
+                 for stage, counts in self.stats.items() if counts['hits'] or counts['misses']]
+        saved = sum(counts['saved'] for counts in self.stats.values())
+        return f"阶段缓存: {'，'.join(parts)}，共节省约 {saved:.1f} 秒"
+
+    def _read_seconds(self, key):
+        try:
+            with open(os.path.join(self.directory, key + '.json'), 'r', encoding='utf-8') as file:
+                return float(json.load(file).get('seconds', 0.0))
+        except (OSError, ValueError):
+            return 0.0
+
+    def _atomic_write(self, path, writer):
+        """先写临时文件再原子替换；目录不可写等情况下返回 False"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    writer(file)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            return False
+        return True
+
+
+def timed(func, *args, **kwargs):
+    """执行函数并返回 (结果, 耗时秒数)"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
@@ -0,0 +1,137 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# 界面程序启动时不应导入的重型模块（在窗口出现后由后台线程预先导入）
+HEAVY_MODULES = ('numpy', 'scipy', 'matplotlib')
+
+# 启动时间预算（秒）：导入界面模块，以及（有显示器时）从导入到窗口完成首次绘制
+IMPORT_BUDGET_SECONDS = 0.3
+WINDOW_BUDGET_SECONDS = 1.0
+
+# 检查的界面程序：模块名及创建窗口的代码（返回 Tk 根窗口）
+APPS = {
+    'ecg_analyzer': "module.ECGAnalyzer().root",
+    'data_selection_app': "module.DataCleanerApp(__import__('tkinter').Tk()).root",
+}
+
+# 子进程中运行的测量代码
+_PROBE = """
+import json, os, sys, time
+started = time.perf_counter()
+import importlib
+module = importlib.import_module({module!r})
+imported = time.perf_counter()
+result = {{'import_s': imported - started,
+           'heavy': sorted(name for name in {heavy!r} if name in sys.modules)}}
+if {window!r}:
+    root = {create}
+    root.update()
+    result['window_s'] = time.perf_counter() - started
+    root.destroy()
+print(json.dumps(result))
+"""
+
+
+def preload(modules):
+    """
+    在后台线程中依次导入模块
+
+    界面先创建窗口，数值计算和绘图模块在后台导入；用到它们的代码照常在函数内 import，
+    预导入尚未完成时由导入锁等待，已完成时直接取缓存的模块。
+
+    Returns:
+    threading.Thread: 预导入线程
+    """
+    def run():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                # 缺少的可选依赖等到实际使用时再报错
+                pass
+
+    thread = threading.Thread(target=run, name='preload', daemon=True)
+    thread.start()
+    return thread
+
+
+def has_display():
+    """是否可以创建 Tk 窗口"""
+    if sys.platform.startswith('win') or sys.platform == 'darwin':
+        return True
+    return bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def measure_startup(module, window=True):
+    """
+    在新的解释器中测量界面程序的启动
+
+    Returns:
+    dict: process_s（含解释器启动的总耗时）、import_s、window_s（创建窗口并完成首次绘制）、
+    heavy（导入界面模块后已加载的重型模块）
+    """
+    code = _PROBE.format(module=module, heavy=HEAVY_MODULES, window=window, create=APPS[module])
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else
+                           f"{module} 启动失败")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_s'] = elapsed
+    return result
+
+
+def main(argv=None):
+    """命令行入口：检查界面程序的启动时间，超出预算或启动时导入了重型模块时返回非零"""
+    parser = argparse.ArgumentParser(description="检查ECG数据分析器和数据精选工具的启动时间")
+    parser.add_argument('apps', nargs='*', default=list(APPS), help="要检查的界面模块，默认全部")
+    parser.add_argument('--repeat', type=int, default=3, help="每个程序的测量次数（取最短），默认 3")
+    parser.add_argument('--no-window', action='store_true', help="只测量导入，不创建窗口")
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_SECONDS,
+                        help=f"导入时间预算（秒），默认 {IMPORT_BUDGET_SECONDS}")
+    parser.add_argument('--window-budget', type=float, default=WINDOW_BUDGET_SECONDS,
+                        help=f"窗口出现的时间预算（秒），默认 {WINDOW_BUDGET_SECONDS}")
+    args = parser.parse_args(argv)
+
+    window = not args.no_window and has_display()
+    if not args.no_window and not window:
+        print("没有可用的显示器，只测量导入时间")
+
+    failures = []
+    for app in args.apps:
+        runs = [measure_startup(app, window) for _ in range(max(args.repeat, 1))]
+        best = {key: min(run[key] for run in runs) for key in runs[0] if key != 'heavy'}
+        heavy = sorted({name for run in runs for name in run['heavy']})
+
+        line = f"{app}: 导入 {best['import_s'] * 1000:.0f} ms"
+        if 'window_s' in best:
+            line += f"，窗口 {best['window_s'] * 1000:.0f} ms"
+        line += f"，进程总计 {best['process_s'] * 1000:.0f} ms"
+        print(line)
+
+        if heavy:
+            failures.append(f"{app}: 启动时导入了 {', '.join(heavy)}")
+        if best['import_s'] > args.import_budget:
+            failures.append(f"{app}: 导入耗时 {best['import_s']:.3f} s，超出预算 {args.import_budget} s")
+        if best.get('window_s', 0) > args.window_budget:
+            failures.append(f"{app}: 窗口出现耗时 {best['window_s']:.3f} s，超出预算 {args.window_budget} s")
+
+    if failures:
+        print("\n启动检查未通过:", file=sys.stderr)
+        for line in failures:
+            print(f"  ✗ {line}", file=sys.stderr)
+        return 1
+    print("启动检查通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import numpy as np
+from scipy.signal import oaconvolve
+
+from ecg_pipeline import ADC_DTYPE
+
+# 心搏模板：(相对R峰的时刻(秒), 幅度(mV), 宽度(秒))，依次为 P、Q、R、S、T 波
+BEAT_WAVES = (
+    (-0.2, 0.1, 0.025),
+    (-0.03, -0.1, 0.008),
+    (0.0, 1.0, 0.01),
+    (0.03, -0.2, 0.008),
+    (0.3, 0.06, 0.07),
+)
+BEAT_SPAN = (-0.3, 0.5)
+
+# 1 mV 对应的ADC值
+ADC_SCALE = 1000
+
+# 心率变异的调制频率（Hz）：LF（Mayer 波）和 HF（呼吸）
+LF_FREQUENCY = 0.1
+HF_FREQUENCY = 0.25
+
+# 基线漂移的频率（Hz）：呼吸和缓慢漂移
+WANDER_FREQUENCIES = (0.25, 0.05)
+
+# 异位搏动：提前的比例（随后的代偿间歇延长同样比例）及R波幅度
+ECTOPIC_PREMATURITY = 0.3
+ECTOPIC_AMPLITUDE = 1.3
+
+# 生成信号及写出文本时每块的样本数
+GENERATE_BLOCK = 1 << 22
+WRITE_BLOCK = 1 << 20
+
+
+def synthetic_rr(n_beats, heart_rate=70, hrv=0.05, artifacts=0.0, seed=0):
+    """
+    生成RR间期序列（确定性）
+
+    Parameters:
+    heart_rate: 平均心率（次/分）
+    hrv: RR间期的相对标准差（LF、HF 调制与随机成分叠加）
+    artifacts: 异位搏动占心搏的比例
+
+    Returns:
+    (rr, ectopic): RR间期（秒）及异位搏动所在间期的掩码
+    """
+    rng = np.random.default_rng(seed)
+    mean_rr = 60.0 / heart_rate
+    t = np.arange(n_beats) * mean_rr
+    modulation = (np.sin(2 * np.pi * LF_FREQUENCY * t + rng.uniform(0, 2 * np.pi))
+                  + np.sin(2 * np.pi * HF_FREQUENCY * t + rng.uniform(0, 2 * np.pi))
+                  + rng.standard_normal(n_beats))
+    std = modulation.std()
+    rr = mean_rr * (1 + hrv * modulation / (std if std > 0 else 1))
+
+    # 异位搏动：间期提前，随后的间期为代偿间歇（相邻的异位搏动只保留第一个）
+    ectopic = np.zeros(n_beats, dtype=bool)
+    if artifacts > 0 and n_beats > 1:
+        hits = np.flatnonzero(rng.random(n_beats - 1) < artifacts)
+        if len(hits):
+            hits = hits[np.concatenate(([True], np.diff(hits) > 1))]
+            ectopic[hits] = True
+            rr[hits] *= 1 - ECTOPIC_PREMATURITY
+            rr[hits + 1] *= 1 + ECTOPIC_PREMATURITY
+    return rr, ectopic
+
+
+def poincare_points(n_points, heart_rate=70, hrv=0.05, artifacts=0.0, seed=0):
+    """
+    生成RR间期对 (RR(n), RR(n+1))，与 synthetic_rr 使用同一模型
+
+    Returns:
+    (x, y): RR间期对（秒）
+    """
+    rr, _ = synthetic_rr(n_points + 1, heart_rate, hrv, artifacts, seed)
+    return rr[:-1], rr[1:]
+
+
+def beat_template(fs):
+    """
+    单个心搏的波形（mV），由 BEAT_WAVES 中的高斯波叠加
+
+    Returns:
+    (template, pre): 模板及R峰在模板中的位置
+    """
+    pre = int(round(-BEAT_SPAN[0] * fs))
+    post = int(round(BEAT_SPAN[1] * fs))
+    t = np.arange(-pre, post + 1) / fs
+    template = np.zeros(len(t))
+    for center, amplitude, width in BEAT_WAVES:
+        template += amplitude * np.exp(-0.5 * ((t - center) / width) ** 2)
+    return template, pre
+
+
+def synthetic_ecg(n_samples, fs=500, heart_rate=70, hrv=0.05, noise=0.02, baseline_wander=0.1,
+                  artifacts=0.0, seed=0):
+    """
+    生成单导联ECG（确定性，ADC值）
+
+    R峰处放置冲激（幅度随呼吸轻微变化，异位搏动幅度更大），与心搏模板卷积，
+    再叠加基线漂移和高斯噪声。按块生成，10⁸ 个样本也只需输出数组本身的内存。
+
+    Parameters:
+    n_samples: 样本数
+    noise: 高斯噪声标准差（mV）
+    baseline_wander: 基线漂移幅度（mV）
+    artifacts: 异位搏动占心搏的比例
+
+    Returns:
+    (adc, r_peaks): ADC值（ADC_DTYPE）及R峰位置（样本）
+    """
+    rng = np.random.default_rng(seed)
+    duration = n_samples / fs
+    mean_rr = 60.0 / heart_rate
+    n_beats = int(duration / (mean_rr * (1 - ECTOPIC_PREMATURITY))) + 2
+    rr, ectopic = synthetic_rr(n_beats, heart_rate, hrv, artifacts, seed)
+
+    beat_times = mean_rr / 2 + np.concatenate(([0.0], np.cumsum(rr)))
+    r_peaks = np.round(beat_times * fs).astype(np.int64)
+    inside = r_peaks < n_samples
+    r_peaks = r_peaks[inside]
+    ectopic_beats = np.concatenate(([False], ectopic))[inside]
+    amplitudes = 1 + 0.1 * np.sin(2 * np.pi * HF_FREQUENCY * r_peaks / fs)
+    amplitudes[ectopic_beats] *= ECTOPIC_AMPLITUDE
+
+    template, pre = beat_template(fs)
+    post = len(template) - 1 - pre
+    phases = rng.uniform(0, 2 * np.pi, len(WANDER_FREQUENCIES))
+
+    adc = np.empty(n_samples, dtype=ADC_DTYPE)
+    for start in range(0, n_samples, GENERATE_BLOCK):
+        stop = min(start + GENERATE_BLOCK, n_samples)
+        # 影响 [start, stop) 的心搏位于 [start - post, stop + pre)
+        low, high = start - post, stop + pre
+        first, last = np.searchsorted(r_peaks, (low, high))
+        impulses = np.zeros(high - low)
+        impulses[r_peaks[first:last] - low] = amplitudes[first:last]
+        block = oaconvolve(impulses, template)[pre + post:pre + post + stop - start]
+
+        t = np.arange(start, stop) / fs
+        for frequency, phase in zip(WANDER_FREQUENCIES, phases):
+            block += baseline_wander * np.sin(2 * np.pi * frequency * t + phase)
+        block += noise * rng.standard_normal(stop - start)
+        adc[start:stop] = np.round(block * ADC_SCALE)
+    return adc, r_peaks
+
+
+def write_ecg_text(filepath, adc, block_size=WRITE_BLOCK):
+    """按分析器读取的文本格式写出ECG（表头一行，之后每行 “序号 ADC值”）"""
+    with open(filepath, 'w') as file:
+        file.write('idx adc\n')
+        for start in range(0, len(adc), block_size):
+            block = np.asarray(adc[start:start + block_size])
+            rows = np.column_stack((np.arange(start, start + len(block)), block))
+            # 整块一次格式化，比逐行 savetxt 快约十倍
+            file.write(('%d %d\n' * len(block)) % tuple(rows.ravel().tolist()))